@@ -0,0 +1,526 @@
+"""
+Bulk Ingestion
+批量导入 - 将目录中的存量文档批量处理入库
+
+解析、分段、实体识别和关系抽取在进程池中并行执行；主进程把多个文档的
+分块合并成大批量做向量化，并以批量事务写入 Neo4j 和 ChromaDB。
+每批写入成功后记录检查点，中断后重新运行会跳过已完成的文件。
+
+用法:
+    python bulk_ingest.py /path/to/archive --workers 8
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".doc")
+
+# 批量导入的文档ID由内容哈希派生，重复运行时同一文件得到同一ID
+BULK_NAMESPACE = uuid.UUID("5b0c3f1e-6d0a-4c55-9a53-2f1f5e3c9b71")
+
+
+def bulk_document_id(content_hash: str) -> str:
+    return str(uuid.uuid5(BULK_NAMESPACE, content_hash))
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def discover_files(root: str) -> List[str]:
+    """递归查找目录下支持的文档（按路径排序，保证每次运行顺序一致）"""
+    return sorted(
+        str(path) for path in Path(root).rglob("*")
+        if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS
+    )
+
+
+class IngestCheckpoint:
+    """批量导入检查点（SQLite），以文件路径、大小和修改时间判断文件是否已处理"""
+
+    def __init__(self, db_path: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                status TEXT NOT NULL,
+                document_id TEXT,
+                content_hash TEXT,
+                error TEXT,
+                updated_at TEXT
+            )
+        """)
+        self._db.commit()
+
+    def completed(self) -> Dict[str, tuple]:
+        """已完成（成功或重复）的文件 {路径: (大小, 修改时间)}"""
+        rows = self._db.execute(
+            "SELECT path, size, mtime FROM files WHERE status IN ('completed', 'duplicate')"
+        ).fetchall()
+        return {path: (size, mtime) for path, size, mtime in rows}
+
+    def mark_many(self, results: List[Dict[str, Any]]):
+        now = datetime.now().isoformat()
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO files "
+                "(path, size, mtime, status, document_id, content_hash, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        r["path"], r["size"], r["mtime"], r["status"],
+                        r.get("document_id"), r.get("content_hash"), r.get("error"), now
+                    )
+                    for r in results
+                ]
+            )
+
+    def summary(self) -> Dict[str, int]:
+        return dict(self._db.execute("SELECT status, COUNT(*) FROM files GROUP BY status").fetchall())
+
+    def close(self):
+        self._db.close()
+
+
+# ==================== 工作进程 ====================
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(
+    ner_backend: str,
+    max_chunk_size: int,
+    overlap: int,
+    document_store_path: str,
+    force: bool,
+    tokenizer: Any = None,
+    max_tokens: int = 0
+):
+    """初始化工作进程内的解析/NLP组件（每个进程各一份），分词器由主进程传入"""
+    from app.parsers.pdf_parser import PDFParser
+    from app.parsers.word_parser import WordParser
+    from app.nlp.segmenter import create_segmenter
+    from app.nlp.ner import SimpleNER, SpacyNER, RelationExtractor
+    from app.storage.document_store import DocumentStore
+
+    ner_engine = None
+    if ner_backend == "spacy":
+        ner_engine = SpacyNER()
+        if not ner_engine.available:
+            ner_engine = None
+    _worker.update({
+        # 已在进程池中并行，单个文件内不再拆分页面
+        "pdf_parser": PDFParser(max_workers=1),
+        "word_parser": WordParser(),
+        "segmenter": create_segmenter(tokenizer, max_tokens, max_chunk_size=max_chunk_size, overlap=overlap),
+        "ner": ner_engine or SimpleNER(),
+        "relations": RelationExtractor(),
+        "document_store": DocumentStore(document_store_path),
+        "force": force
+    })
+
+
+def analyze_file(path: str) -> Dict[str, Any]:
+    """
+    在工作进程中处理单个文件：哈希去重 -> 解析 -> 分段 -> 实体识别 -> 关系抽取
+
+    Returns:
+        {"path", "size", "mtime", "status": analyzed/duplicate/failed, ...}
+    """
+    stat = os.stat(path)
+    result: Dict[str, Any] = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+    start = time.perf_counter()
+
+    try:
+        content_hash = file_sha256(path)
+        result["content_hash"] = content_hash
+
+        existing = _worker["document_store"].find_by_hash(content_hash)
+        if existing and not _worker["force"]:
+            result.update(status="duplicate", document_id=existing["document_id"])
+            return result
+
+        document_id = existing["document_id"] if existing else bulk_document_id(content_hash)
+        file_ext = Path(path).suffix.lower()
+        parser = _worker["pdf_parser"] if file_ext == ".pdf" else _worker["word_parser"]
+
+        parse_result = parser.parse(path)
+        if parse_result["status"] == "error":
+            raise Exception(parse_result.get("error", "Parse error"))
+
+        text = parse_result["text"]
+        chunks = _worker["segmenter"].segment(text, document_id)
+        entities = _worker["ner"].extract_entities(text)
+        relations = _worker["relations"].extract_relations(text, entities)
+
+        result.update(
+            status="analyzed",
+            document_id=document_id,
+            replace=existing is not None,
+            file_name=Path(path).name,
+            file_type=file_ext[1:],
+            metadata={**parse_result["metadata"], "source_path": path},
+            text=text,
+            chunks=chunks,
+            entities=entities,
+            relations=relations,
+            analyze_seconds=time.perf_counter() - start
+        )
+    except Exception as e:
+        result.update(status="failed", error=str(e))
+
+    return result
+
+
+# ==================== 主进程 ====================
+
+class BulkIngestor:
+    """批量导入协调器"""
+
+    def __init__(
+        self,
+        workers: int = None,
+        batch_docs: int = 64,
+        batch_chunks: int = 2048,
+        checkpoint_path: str = None,
+        ner_backend: str = "simple",
+        force: bool = False,
+        max_chunk_size: int = 500,
+        overlap: int = 50
+    ):
+        """
+        Args:
+            workers: 解析/NER 进程数（默认CPU核数）
+            batch_docs: 每批写入的最大文档数
+            batch_chunks: 每批写入的最大分块数（一次向量化的规模）
+            checkpoint_path: 检查点数据库路径
+            ner_backend: simple 或 spacy
+            force: 内容重复的文件也重新处理
+            max_chunk_size: 分块大小（字符数）
+            overlap: 分块重叠字符数
+        """
+        from app.kg.neo4j_manager import Neo4jManager
+        from app.vector.vector_store import VectorStoreManager
+        from app.storage.document_store import DocumentStore
+
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_docs = batch_docs
+        self.batch_chunks = batch_chunks
+        self.ner_backend = ner_backend
+        self.force = force
+        self.max_chunk_size = max_chunk_size
+        self.overlap = overlap
+
+        self.checkpoint = IngestCheckpoint(
+            checkpoint_path or os.getenv("BULK_CHECKPOINT_PATH", "./data/bulk_ingest.db")
+        )
+        self.document_store = DocumentStore()
+
+        self.kg_manager = Neo4jManager()
+        if self.kg_manager.connected:
+            self.kg_manager.create_constraints()
+
+        self.vector_store = VectorStoreManager()
+
+        self.stats = {"completed": 0, "duplicate": 0, "failed": 0, "chunks": 0, "entities": 0, "relations": 0}
+        self._start = 0.0
+        self._seen_hashes: Dict[str, str] = {}
+
+    def run(self, root: str) -> Dict[str, Any]:
+        """
+        导入目录下的所有文档
+
+        Returns:
+            统计信息
+        """
+        files = discover_files(root)
+        done = self.checkpoint.completed()
+        pending = [path for path in files if not self._is_done(path, done)]
+        logger.info(f"Bulk ingest: {len(files)} files found, {len(files) - len(pending)} already done, {len(pending)} to process")
+
+        self._start = time.perf_counter()
+        buffer: List[Dict[str, Any]] = []
+        buffered_chunks = 0
+
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(
+                self.ner_backend, self.max_chunk_size, self.overlap,
+                self.document_store.db_path, self.force,
+                *self.vector_store.get_tokenizer()
+            )
+        )
+
+        # 同一次运行中内容相同的文件（工作进程之间互不知晓）只导入一份
+        self._seen_hashes.clear()
+
+        try:
+            for result in self._iter_results(executor, pending):
+                if result["status"] == "analyzed":
+                    if result["content_hash"] in self._seen_hashes:
+                        result = self._as_duplicate(result, self._seen_hashes[result["content_hash"]])
+                    else:
+                        self._seen_hashes[result["content_hash"]] = result["document_id"]
+                buffer.append(result)
+                buffered_chunks += len(result.get("chunks", []))
+                if len(buffer) >= self.batch_docs or buffered_chunks >= self.batch_chunks:
+                    self._flush(buffer)
+                    buffer, buffered_chunks = [], 0
+        except KeyboardInterrupt:
+            logger.warning("Interrupted, writing analyzed documents before exit...")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if buffer:
+                self._flush(buffer)
+
+        return self._progress()
+
+    def close(self):
+        self.checkpoint.close()
+        self.document_store.close()
+        self.kg_manager.close()
+
+    def _is_done(self, path: str, done: Dict[str, tuple]) -> bool:
+        if path not in done:
+            return False
+        stat = os.stat(path)
+        return done[path] == (stat.st_size, stat.st_mtime)
+
+    @staticmethod
+    def _as_duplicate(result: Dict[str, Any], document_id: str) -> Dict[str, Any]:
+        return {
+            "path": result["path"],
+            "size": result["size"],
+            "mtime": result["mtime"],
+            "content_hash": result["content_hash"],
+            "status": "duplicate",
+            "document_id": document_id
+        }
+
+    def _iter_results(self, executor: ProcessPoolExecutor, paths: List[str]) -> Iterator[Dict[str, Any]]:
+        """
+        限制在途任务数地提交文件，按完成顺序返回结果
+
+        主进程写入一批数据时，进程池继续处理在途的文件（流水线），
+        在途任务数有上限以控制内存占用
+        """
+        max_in_flight = self.workers * 2
+        remaining = iter(paths)
+        in_flight = set()
+
+        for path in remaining:
+            in_flight.add(executor.submit(analyze_file, path))
+            if len(in_flight) >= max_in_flight:
+                break
+
+        while in_flight:
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    in_flight.add(executor.submit(analyze_file, next_path))
+                yield future.result()
+
+    def _flush(self, results: List[Dict[str, Any]]):
+        """
+        批量写入向量库、知识图谱和文档存储，然后记录检查点
+
+        向量或知识图谱写入失败的文档标记为 failed，不写入文档存储也不记为完成，下次运行时重新处理
+        """
+        analyzed = [r for r in results if r["status"] == "analyzed"]
+        new_docs = [r for r in analyzed if not r["replace"]]
+        replaced = [r for r in analyzed if r["replace"]]
+
+        # 1. 向量化：多个文档的分块合并为一次大批量
+        vector_ok = {r["document_id"]: False for r in analyzed}
+        if self.vector_store.available and new_docs:
+            texts, metadatas, ids = [], [], []
+            for r in new_docs:
+                for chunk in r["chunks"]:
+                    texts.append(chunk["text"])
+                    ids.append(chunk["chunk_id"])
+                    metadatas.append(self.vector_store.chunk_metadata(chunk, r["document_id"]))
+            if not texts or self.vector_store.add_documents(texts, metadatas, ids):
+                for r in new_docs:
+                    vector_ok[r["document_id"]] = True
+            else:
+                self._mark_failed(results, new_docs, "Failed to add chunks to vector store")
+                new_docs = []
+
+        # 强制重新处理的已有文档增量同步分块。sync_document_chunks 先写入新分块再删除过期分块，
+        # 失败时向量库中的旧版本完整保留，该文档也不更新知识图谱和文档存储，下次运行时重新同步
+        if self.vector_store.available:
+            synced = []
+            for r in replaced:
+                try:
+                    self.vector_store.sync_document_chunks(r["document_id"], r["chunks"])
+                except Exception as e:
+                    self._mark_failed(results, [r], f"Failed to sync chunks: {e}")
+                    continue
+                vector_ok[r["document_id"]] = True
+                synced.append(r)
+            replaced = synced
+
+        # 2. 知识图谱：文档节点、实体提及、关系跨文档批量写入
+        # 写入失败的文档标记为 failed（向量已写入，重新处理时按分块ID覆盖，提及次数也不会重复累加）
+        kg_ok = self.kg_manager.connected
+        if kg_ok and new_docs:
+            try:
+                written = self.kg_manager.bulk_create_documents([
+                    {
+                        "document_id": r["document_id"],
+                        "metadata": {**r["metadata"], "file_name": r["file_name"], "file_type": r["file_type"]},
+                        "entities": r["entities"],
+                        "relations": r["relations"]
+                    }
+                    for r in new_docs
+                ])
+                error = None if written["documents"] == len(new_docs) else "Failed to write document nodes"
+            except Exception as e:
+                error = str(e)
+            if error:
+                self._mark_failed(results, new_docs, f"Failed to write knowledge graph: {error}")
+                new_docs = []
+
+        # 强制重新处理的已有文档走增量同步（失败时文档存储保留旧版本，重新处理时以其为基准再次同步）
+        if kg_ok:
+            synced = []
+            for r in replaced:
+                document_id = r["document_id"]
+                try:
+                    self.kg_manager.create_document_node(
+                        document_id, {**r["metadata"], "file_name": r["file_name"], "file_type": r["file_type"]}
+                    )
+                    self.kg_manager.sync_document_entities(
+                        document_id, self.document_store.get_payload(document_id, "entities") or [], r["entities"]
+                    )
+                    self.kg_manager.sync_document_relations(
+                        document_id, self.document_store.get_payload(document_id, "relations") or [], r["relations"]
+                    )
+                except Exception as e:
+                    self._mark_failed(results, [r], f"Failed to sync knowledge graph: {e}")
+                    continue
+                synced.append(r)
+            replaced = synced
+
+        # 3. 文档存储
+        for r in new_docs + replaced:
+            self.document_store.save(
+                {
+                    "document_id": r["document_id"],
+                    "file_name": r["file_name"],
+                    "file_type": r["file_type"],
+                    "file_path": None,  # 源文件不归平台管理，删除文档时不删除原文件
+                    "text_length": len(r["text"]),
+                    "chunks_count": len(r["chunks"]),
+                    "entities_count": len(r["entities"]),
+                    "relations_count": len(r["relations"]),
+                    "metadata": r["metadata"],
+                    "processing": {"knowledge_graph": kg_ok, "vector_store": vector_ok[r["document_id"]]},
+                    "status": "success",
+                    "content_hash": r["content_hash"]
+                },
+                {
+                    "text": r["text"],
+                    "chunks": r["chunks"],
+                    "entities": r["entities"],
+                    "relations": r["relations"]
+                }
+            )
+            r["status"] = "completed"
+            self.stats["chunks"] += len(r["chunks"])
+            self.stats["entities"] += len(r["entities"])
+            self.stats["relations"] += len(r["relations"])
+
+        for r in results:
+            if r["status"] == "failed":
+                logger.warning(f"Failed: {r['path']}: {r.get('error')}")
+            self.stats[r["status"]] += 1
+
+        # 4. 检查点（写入成功后才记录，中断时未写入的文件下次重新处理）
+        self.checkpoint.mark_many(results)
+
+        progress = self._progress()
+        logger.info(
+            f"Bulk ingest: {progress['processed']} files "
+            f"({progress['completed']} ok, {progress['duplicate']} duplicate, {progress['failed']} failed), "
+            f"{progress['docs_per_minute']:.1f} docs/min"
+        )
+
+    def _mark_failed(self, results: List[Dict[str, Any]], docs: List[Dict[str, Any]], error: str):
+        """将写入失败的文档（以及本批中作为其重复项的文件）标记为 failed"""
+        failed_ids = set()
+        for r in docs:
+            r.update(status="failed", error=error)
+            failed_ids.add(r["document_id"])
+            # 之后出现的相同内容的文件需要重新导入，而不是记为这份未写入文档的重复
+            self._seen_hashes.pop(r["content_hash"], None)
+        for r in results:
+            if r["status"] == "duplicate" and r["document_id"] in failed_ids:
+                r.update(status="failed", error=error)
+
+    def _progress(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._start if self._start else 0.0
+        processed = self.stats["completed"] + self.stats["duplicate"] + self.stats["failed"]
+        return {
+            **self.stats,
+            "processed": processed,
+            "elapsed_seconds": round(elapsed, 1),
+            "docs_per_minute": self.stats["completed"] / elapsed * 60 if elapsed else 0.0
+        }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="批量导入目录中的 PDF/Word 文档")
+    parser.add_argument("directory", help="文档目录（递归查找 .pdf/.docx/.doc）")
+    parser.add_argument("--workers", type=int, default=None, help="解析/NER 进程数（默认CPU核数）")
+    parser.add_argument("--batch-docs", type=int, default=64, help="每批写入的最大文档数")
+    parser.add_argument("--batch-chunks", type=int, default=2048, help="每批向量化的最大分块数")
+    parser.add_argument("--checkpoint", default=None, help="检查点数据库路径（默认 ./data/bulk_ingest.db）")
+    parser.add_argument("--ner", choices=["simple", "spacy"], default="simple", help="NER 引擎")
+    parser.add_argument("--force", action="store_true", help="内容重复的文件也重新处理")
+    args = parser.parse_args(argv)
+
+    if not Path(args.directory).is_dir():
+        parser.error(f"目录不存在: {args.directory}")
+
+    ingestor = BulkIngestor(
+        workers=args.workers,
+        batch_docs=args.batch_docs,
+        batch_chunks=args.batch_chunks,
+        checkpoint_path=args.checkpoint,
+        ner_backend=args.ner,
+        force=args.force
+    )
+    try:
+        stats = ingestor.run(args.directory)
+    finally:
+        ingestor.close()
+
+    print("=" * 60)
+    print(f"完成: {stats['completed']}  重复: {stats['duplicate']}  失败: {stats['failed']}")
+    print(f"分块: {stats['chunks']}  实体: {stats['entities']}  关系: {stats['relations']}")
+    print(f"耗时: {stats['elapsed_seconds']}s  吞吐: {stats['docs_per_minute']:.1f} docs/min")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Ingestion Job Queue
+后台任务队列 - 在有界线程池中执行文档处理流水线，避免阻塞事件循环
+
+任务记录保存在 SQLite 中，多个 worker 进程共享：任一进程提交的任务都可以
+在其他进程上查询，内容去重也能看到其他进程正在处理的任务
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from app.jobs.metrics import process_alive
+
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobQueue:
+    """有界后台任务队列（任务在提交它的进程中执行，任务记录多进程共享）"""
+
+    def __init__(
+        self,
+        max_workers: int = None,
+        max_pending: int = None,
+        max_history: int = 1000,
+        db_path: str = None
+    ):
+        """
+        Args:
+            max_workers: 工作线程数 (默认从环境变量 INGEST_WORKERS 读取)
+            max_pending: 最多排队+运行中的任务数 (默认从环境变量 INGEST_MAX_PENDING 读取)
+            max_history: 保留的任务记录数量上限（超出后淘汰最早完成的任务）
+            db_path: 任务记录数据库路径 (默认从环境变量 JOB_STORE_PATH 读取)
+        """
+        self.max_workers = max_workers or int(os.getenv("INGEST_WORKERS", "2"))
+        self.max_pending = max_pending or int(os.getenv("INGEST_MAX_PENDING", "100"))
+        self.max_history = max_history
+        self.db_path = db_path or os.getenv("JOB_STORE_PATH", "./data/jobs.db")
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="ingest"
+        )
+        self._lock = threading.Lock()
+        # 实例标识（进程号 + 随机后缀）：进程重启后复用同一进程号时，用于区分上一个实例遗留的任务
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                owner TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+            CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at);
+        """)
+        # 旧版任务库没有 owner 列
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._db.commit()
+        self._fail_orphaned()
+
+        logger.info(f"JobQueue initialized: workers={self.max_workers}, max_pending={self.max_pending}")
+
+    # ==================== 提交与查询 ====================
+
+    def pending_count(self) -> int:
+        """排队中和运行中的任务数（所有进程）"""
+        self._fail_orphaned()
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES
+            ).fetchone()[0]
+
+    def is_full(self) -> bool:
+        """队列是否已满"""
+        return self.pending_count() >= self.max_pending
+
+    def submit(
+        self,
+        fn: Callable[["JobContext"], Dict[str, Any]],
+        stages: List[str],
+        metadata: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        """
+        提交任务
+
+        Args:
+            fn: 任务函数，接收 JobContext，返回结果字典
+            stages: 任务阶段列表（用于计算进度）
+            metadata: 附加到任务记录上的信息（document_id, file_name 等）
+
+        Returns:
+            任务快照
+        """
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            **(metadata or {}),
+            "status": "queued",
+            "stage": "queued",
+            "stages": list(stages),
+            "completed_stages": [],
+            "progress": 0.0,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None
+        }
+
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO jobs (job_id, status, created_at, pid, owner, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, job["status"], job["created_at"], os.getpid(), self._owner, self._dumps(job))
+                )
+                self._evict_finished()
+
+        self._executor.submit(self._run, job_id, fn)
+        logger.info(f"Job queued: {job_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务快照"""
+        with self._lock:
+            row = self._db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_active(self, key: str, value: Any) -> Optional[Dict[str, Any]]:
+        """查找排队中或运行中、且元数据字段 key 等于 value 的任务（所有进程）"""
+        self._fail_orphaned()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM jobs WHERE status IN (?, ?) ORDER BY created_at", ACTIVE_STATUSES
+            ).fetchall()
+        for (data,) in rows:
+            job = json.loads(data)
+            if job.get(key) == value:
+                return job
+        return None
+
+    def list_jobs(self, status: str = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """列出最近的任务（新的在前）"""
+        query = "SELECT data FROM jobs"
+        params: List[Any] = []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [
+            {k: v for k, v in json.loads(data).items() if k != "result"}
+            for (data,) in rows
+        ]
+
+    def shutdown(self, wait: bool = False):
+        """关闭线程池（本实例未完成的任务标记为失败）"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id, status FROM jobs WHERE owner = ? AND status IN (?, ?)",
+                (self._owner, *ACTIVE_STATUSES)
+            ).fetchall()
+        for job_id, status in rows:
+            self._update(
+                job_id,
+                status="failed",
+                error=(
+                    "Server shut down before the job started" if status == "queued"
+                    else "Server shut down before the job finished"
+                ),
+                finished_at=datetime.now().isoformat()
+            )
+        logger.info("JobQueue shut down")
+
+    # ==================== 内部实现 ====================
+
+    def _run(self, job_id: str, fn: Callable[["JobContext"], Dict[str, Any]]):
+        """在工作线程中执行任务"""
+        self._update(job_id, status="running", started_at=datetime.now().isoformat())
+        context = JobContext(self, job_id)
+
+        try:
+            result = fn(context)
+            context.finish_stage()
+            self._update(
+                job_id,
+                status="completed",
+                stage="done",
+                progress=1.0,
+                result=result,
+                finished_at=datetime.now().isoformat()
+            )
+            logger.info(f"Job completed: {job_id}")
+        except Exception as e:
+            logger.error(f"Job failed: {job_id}: {str(e)}")
+            self._update(
+                job_id,
+                status="failed",
+                error=str(e),
+                finished_at=datetime.now().isoformat()
+            )
+
+    @staticmethod
+    def _dumps(job: Dict[str, Any]) -> str:
+        return json.dumps(job, ensure_ascii=False, default=str)
+
+    def _modify(self, job_id: str, change: Callable[[Dict[str, Any]], None]):
+        """读取-修改-写回任务记录（任务只由所在进程修改）"""
+        with self._lock:
+            with self._db:
+                row = self._db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if row is None:
+                    return
+                job = json.loads(row[0])
+                change(job)
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, data = ? WHERE job_id = ?",
+                    (job["status"], self._dumps(job), job_id)
+                )
+
+    def _update(self, job_id: str, **fields):
+        self._modify(job_id, lambda job: job.update(fields))
+
+    def _set_stage(self, job_id: str, stage: str):
+        def change(job: Dict[str, Any]):
+            previous = job["stage"]
+            if previous in job["stages"] and previous not in job["completed_stages"]:
+                job["completed_stages"].append(previous)
+            job["stage"] = stage
+            job["progress"] = round(len(job["completed_stages"]) / max(len(job["stages"]), 1), 3)
+
+        self._modify(job_id, change)
+
+    def _fail_orphaned(self):
+        """
+        所在进程已退出的未完成任务标记为失败（worker 进程崩溃或重启）
+
+        进程号与当前进程相同、但不是本实例提交的任务，来自复用了该进程号的上一个进程
+        （例如容器中的 1 号进程重启），同样视为遗留任务
+        """
+        pid = os.getpid()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id, pid, owner FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES
+            ).fetchall()
+
+        orphaned: Dict[int, List[str]] = {}
+        for job_id, job_pid, owner in rows:
+            if (owner != self._owner) if job_pid == pid else not process_alive(job_pid):
+                orphaned.setdefault(job_pid, []).append(job_id)
+
+        for job_pid, job_ids in orphaned.items():
+            for job_id in job_ids:
+                self._update(
+                    job_id,
+                    status="failed",
+                    error="Worker process exited before the job finished",
+                    finished_at=datetime.now().isoformat()
+                )
+            logger.warning(f"Marked {len(job_ids)} orphaned job(s) of process {job_pid} as failed")
+
+    def _evict_finished(self):
+        """超出历史上限时淘汰最早完成的任务（调用方需持有锁并处于事务中）"""
+        overflow = self._db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - self.max_history
+        if overflow <= 0:
+            return
+
+        self._db.execute(
+            "DELETE FROM jobs WHERE job_id IN ("
+            "SELECT job_id FROM jobs WHERE status IN ('completed', 'failed') "
+            "ORDER BY created_at LIMIT ?)",
+            (overflow,)
+        )
+
+
+class JobContext:
+    """任务函数用于上报阶段进度的句柄"""
+
+    def __init__(self, queue: JobQueue, job_id: str):
+        self._queue = queue
+        self.job_id = job_id
+
+    def set_stage(self, stage: str):
+        """进入新阶段（上一阶段视为完成）"""
+        self._queue._set_stage(self.job_id, stage)
+
+    def finish_stage(self):
+        """标记当前阶段完成"""
+        self._queue._set_stage(self.job_id, "done")
@@ -0,0 +1,393 @@
+"""
+Ingestion Metrics
+处理流水线指标 - 记录每个阶段的耗时、输入/输出数量和字节数，并按阶段聚合为直方图
+"""
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from loguru import logger
+
+
+# 耗时直方图桶上界（秒），最后一个桶为 +Inf
+DEFAULT_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+
+
+def process_alive(pid: int) -> bool:
+    """进程是否仍在运行（Windows 上只能确认当前进程）"""
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Histogram:
+    """固定桶直方图（非累积计数，导出时再累加）"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶估算分位数（返回所在桶的上界，+Inf 桶返回最大值）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def merge(self, counts: List[int], count: int, total: float, minimum: Optional[float], maximum: Optional[float]):
+        """合并另一个相同分桶的直方图"""
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.count += count
+        self.sum += total
+        if minimum is not None:
+            self.min = minimum if self.min is None else min(self.min, minimum)
+        if maximum is not None:
+            self.max = maximum if self.max is None else max(self.max, maximum)
+
+    def to_dict(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "min": self.min,
+            "max": self.max,
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets
+        }
+
+
+class StageMetrics:
+    """
+    按阶段聚合的流水线指标（线程安全）
+
+    指定 db_path 时每个进程把自己的统计写入共享的 SQLite 数据库，
+    snapshot() 合并所有存活 worker 进程的统计；否则只统计本进程
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_DURATION_BUCKETS, db_path: str = None):
+        """
+        Args:
+            buckets: 耗时直方图桶上界（秒）
+            db_path: 多进程共享的 SQLite 数据库路径
+        """
+        self.buckets = tuple(buckets)
+        self.db_path = db_path
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._worker_id: Optional[str] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        本进程的数据库连接（调用方需持有锁）
+
+        fork 出的子进程不沿用父进程的连接和统计，首次使用时重新连接，
+        并清除 pid 被复用前遗留的记录
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._worker_id = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+            self._stages = {}
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS stage_metrics (
+                    worker_id TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    stage TEXT NOT NULL,
+                    buckets TEXT NOT NULL,
+                    counts TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    sum REAL NOT NULL,
+                    min REAL,
+                    max REAL,
+                    items_in INTEGER NOT NULL,
+                    items_out INTEGER NOT NULL,
+                    bytes_in INTEGER NOT NULL,
+                    errors INTEGER NOT NULL,
+                    PRIMARY KEY (worker_id, stage)
+                )
+            """)
+            self._db.execute("DELETE FROM stage_metrics WHERE pid = ?", (self._pid,))
+            self._db.commit()
+        return self._db
+
+    def record(
+        self,
+        stage: str,
+        duration: float,
+        items_in: int = 0,
+        items_out: int = 0,
+        bytes_in: int = 0,
+        error: bool = False
+    ):
+        """
+        记录一次阶段执行
+
+        Args:
+            stage: 阶段名称
+            duration: 耗时（秒）
+            items_in: 输入条目数
+            items_out: 输出条目数
+            bytes_in: 输入字节数
+            error: 是否执行失败
+        """
+        with self._lock:
+            db = self._connection() if self.db_path else None
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {
+                    "duration": Histogram(self.buckets),
+                    "items_in": 0,
+                    "items_out": 0,
+                    "bytes_in": 0,
+                    "errors": 0
+                }
+            stats["duration"].observe(duration)
+            stats["items_in"] += items_in
+            stats["items_out"] += items_out
+            stats["bytes_in"] += bytes_in
+            stats["errors"] += int(error)
+
+            if db is not None:
+                self._persist(db, stage, stats)
+
+    def _persist(self, db: sqlite3.Connection, stage: str, stats: Dict[str, Any]):
+        """写入本进程某个阶段的累计统计（调用方需持有锁）"""
+        histogram = stats["duration"]
+        try:
+            db.execute(
+                "INSERT OR REPLACE INTO stage_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._worker_id, self._pid, stage,
+                    json.dumps(self.buckets), json.dumps(histogram.counts),
+                    histogram.count, histogram.sum, histogram.min, histogram.max,
+                    stats["items_in"], stats["items_out"], stats["bytes_in"], stats["errors"]
+                )
+            )
+            db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to persist stage metrics: {str(e)}")
+
+    def _merged_stages(self) -> Dict[str, Dict[str, Any]]:
+        """合并所有存活 worker 进程的统计（调用方需持有锁）"""
+        db = self._connection()
+        rows = db.execute("SELECT * FROM stage_metrics").fetchall()
+
+        dead = {row[1] for row in rows if not process_alive(row[1])}
+        if dead:
+            db.executemany("DELETE FROM stage_metrics WHERE pid = ?", [(pid,) for pid in dead])
+            db.commit()
+
+        stages: Dict[str, Dict[str, Any]] = {}
+        for (_, pid, stage, buckets, counts, count, total, minimum, maximum,
+             items_in, items_out, bytes_in, errors) in rows:
+            if pid in dead or tuple(json.loads(buckets)) != self.buckets:
+                continue
+            stats = stages.setdefault(stage, {
+                "duration": Histogram(self.buckets),
+                "items_in": 0,
+                "items_out": 0,
+                "bytes_in": 0,
+                "errors": 0
+            })
+            stats["duration"].merge(json.loads(counts), count, total, minimum, maximum)
+            stats["items_in"] += items_in
+            stats["items_out"] += items_out
+            stats["bytes_in"] += bytes_in
+            stats["errors"] += errors
+        return stages
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """导出各阶段的直方图与吞吐量"""
+        with self._lock:
+            stages = self._merged_stages() if self.db_path else self._stages
+            result = {}
+            for stage, stats in stages.items():
+                histogram = stats["duration"]
+                seconds = histogram.sum
+                result[stage] = {
+                    "duration_seconds": histogram.to_dict(),
+                    "items_in": stats["items_in"],
+                    "items_out": stats["items_out"],
+                    "bytes_in": stats["bytes_in"],
+                    "errors": stats["errors"],
+                    "items_per_second": round(stats["items_in"] / seconds, 3) if seconds else None,
+                    "bytes_per_second": round(stats["bytes_in"] / seconds, 3) if seconds else None
+                }
+            return result
+
+    def to_prometheus(self, prefix: str = "mcp_ingest") -> str:
+        """导出为 Prometheus 文本格式"""
+        lines = [
+            f"# TYPE {prefix}_stage_duration_seconds histogram",
+        ]
+        counters: Dict[str, List[str]] = {"items_in": [], "items_out": [], "bytes_in": [], "errors": []}
+
+        for stage, stats in self.snapshot().items():
+            histogram = stats["duration_seconds"]
+            for bound, cumulative in histogram["buckets"].items():
+                lines.append(
+                    f'{prefix}_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+            for name in counters:
+                counters[name].append(f'{prefix}_stage_{name}_total{{stage="{stage}"}} {stats[name]}')
+
+        for name, samples in counters.items():
+            lines.append(f"# TYPE {prefix}_stage_{name}_total counter")
+            lines.extend(samples)
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            if self.db_path:
+                self._connection().execute("DELETE FROM stage_metrics WHERE worker_id = ?", (self._worker_id,))
+                self._db.commit()
+
+
+class StageTimer:
+    """单个阶段的计时上下文，退出时写入 PipelineTrace 和全局指标"""
+
+    def __init__(self, trace: "PipelineTrace", stage: str, items_in: int, bytes_in: int, accumulate: bool = False):
+        self._trace = trace
+        self.stage = stage
+        self.accumulate = accumulate
+        self.items_in = items_in
+        self.items_out = 0
+        self.bytes_in = bytes_in
+        self._start = 0.0
+
+    def __enter__(self) -> "StageTimer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        self._trace._finish(self, duration, error=exc_type is not None)
+        return False
+
+
+class PipelineTrace:
+    """
+    一次流水线执行的阶段计时记录
+
+    用法:
+        trace = PipelineTrace(ingest_metrics)
+        with trace.stage("parsing", items_in=1, bytes_in=size) as stage:
+            ...
+            stage.items_out = page_count
+        trace.to_dict()  # {"parsing": {"duration_ms", "items_in", "items_out", "bytes_in", "error"}}
+
+    流式处理中各阶段交替执行多次，用 accumulate() 累加，结束时调用 finish_accumulated()
+    按每个阶段一次记录
+    """
+
+    def __init__(self, metrics: StageMetrics = None):
+        self.metrics = metrics
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+    def stage(self, name: str, items_in: int = 0, bytes_in: int = 0) -> StageTimer:
+        return StageTimer(self, name, items_in, bytes_in)
+
+    def accumulate(self, name: str, items_in: int = 0, bytes_in: int = 0) -> StageTimer:
+        return StageTimer(self, name, items_in, bytes_in, accumulate=True)
+
+    def finish_accumulated(self):
+        """记录 accumulate() 累加的各阶段"""
+        for name, totals in self._pending.items():
+            self.record(name, **totals)
+        self._pending.clear()
+
+    def record(
+        self,
+        stage: str,
+        duration: float,
+        items_in: int = 0,
+        items_out: int = 0,
+        bytes_in: int = 0,
+        error: bool = False
+    ):
+        """记录一个阶段的执行结果"""
+        self.stages[stage] = {
+            "duration_ms": round(duration * 1000, 3),
+            "items_in": items_in,
+            "items_out": items_out,
+            "bytes_in": bytes_in,
+            "error": error
+        }
+        if self.metrics:
+            self.metrics.record(
+                stage,
+                duration,
+                items_in=items_in,
+                items_out=items_out,
+                bytes_in=bytes_in,
+                error=error
+            )
+        logger.debug(f"Stage {stage}: {duration * 1000:.1f} ms, {items_in} -> {items_out}")
+
+    def _finish(self, timer: StageTimer, duration: float, error: bool):
+        if not timer.accumulate:
+            self.record(timer.stage, duration, timer.items_in, timer.items_out, timer.bytes_in, error)
+            return
+
+        totals = self._pending.setdefault(
+            timer.stage,
+            {"duration": 0.0, "items_in": 0, "items_out": 0, "bytes_in": 0, "error": False}
+        )
+        totals["duration"] += duration
+        totals["items_in"] += timer.items_in
+        totals["items_out"] += timer.items_out
+        totals["bytes_in"] += timer.bytes_in
+        totals["error"] = totals["error"] or error
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段耗时明细"""
+        return dict(self.stages)
@@ -0,0 +1,224 @@
+"""
+Streaming Ingestion
+流式处理流水线 - 大文档逐页解析、边读边分段，实体识别按文本窗口执行，
+向量化和写入按批次滚动进行，峰值内存由批大小决定而与文档大小无关
+"""
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List
+
+from loguru import logger
+
+from app.jobs.metrics import PipelineTrace
+from app.nlp.segmenter import PARAGRAPH_SEPARATOR
+from app.storage.document_store import PAYLOAD_KINDS
+
+
+class StreamingIngestor:
+    """
+    单个文档的流式处理（每个文档创建一个实例）
+
+    - 解析器按页/段落产出文本块，TextSegmenter.segment_stream 消费同一个迭代器产出分块
+    - 文本块累积到 window_chars 后做一次实体识别和关系抽取，并写入知识图谱
+    - 分块累积到 batch_chunks 后做一次向量化写入
+    - 全文、分块、实体、关系以增量压缩的方式写入文档存储
+    """
+
+    def __init__(
+        self,
+        segmenter,
+        ner_engine,
+        relation_extractor,
+        document_store,
+        kg_manager=None,
+        vector_store=None,
+        batch_chunks: int = None,
+        window_chars: int = None
+    ):
+        """
+        Args:
+            segmenter: TextSegmenter
+            ner_engine: SimpleNER / SpacyNER
+            relation_extractor: RelationExtractor
+            document_store: DocumentStore（提供增量压缩的 payload_writer）
+            kg_manager: Neo4jManager（未连接时跳过）
+            vector_store: VectorStoreManager（不可用时跳过）
+            batch_chunks: 每批向量化的分块数 (默认从环境变量 STREAMING_BATCH_CHUNKS 读取)
+            window_chars: 实体识别的文本窗口大小 (默认从环境变量 STREAMING_WINDOW_CHARS 读取)
+        """
+        self.segmenter = segmenter
+        self.ner_engine = ner_engine
+        self.relation_extractor = relation_extractor
+        self.document_store = document_store
+        self.kg_manager = kg_manager if kg_manager and kg_manager.connected else None
+        self.vector_store = vector_store if vector_store and vector_store.available else None
+        self.batch_chunks = batch_chunks or int(os.getenv("STREAMING_BATCH_CHUNKS", "256"))
+        self.window_chars = window_chars or int(os.getenv("STREAMING_WINDOW_CHARS", "100000"))
+
+        self._writers = {kind: document_store.payload_writer(kind) for kind in PAYLOAD_KINDS}
+        self._window: List[str] = []
+        self._window_start = 0
+        self._window_length = 0
+        self._offset = 0
+        self._pending_chunks: List[Dict] = []
+        self._seen_relations = set()
+        self._vector_ok = self.vector_store is not None
+        self._nested_seconds = 0.0
+
+    def run(
+        self,
+        trace: PipelineTrace,
+        document_id: str,
+        blocks: Iterable[str],
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        处理文档
+
+        Args:
+            trace: 阶段计时（各阶段交替执行，结束时每个阶段记录一次）
+            document_id: 文档ID
+            blocks: 解析器 parse_stream() 产出的文本块
+            metadata: 文档节点元数据
+
+        Returns:
+            {
+                "text_length", "chunks_count", "entities_count", "relations_count",
+                "processing": {"knowledge_graph": bool, "vector_store": bool},
+                "payloads": 压缩后的大字段，直接传给 DocumentStore.save()
+            }
+        """
+        self.trace = trace
+        self.document_id = document_id
+
+        if self.kg_manager:
+            with trace.accumulate("knowledge_graph", items_in=1) as stage:
+                self.kg_manager.create_document_node(document_id, metadata)
+                stage.items_out = 1
+
+        # 分段耗时 = 取下一个分块的总耗时 - 期间解析、实体识别等阶段的耗时
+        segmenting_seconds = 0.0
+        chunks = self.segmenter.segment_stream(self._tap(blocks), document_id)
+        while True:
+            start, nested = time.perf_counter(), self._nested_seconds
+            chunk = next(chunks, None)
+            segmenting_seconds += time.perf_counter() - start - (self._nested_seconds - nested)
+            if chunk is None:
+                break
+            self._add_chunk(chunk)
+        self._flush_chunks()
+
+        chunks_count = self._writers["chunks"].count
+        trace.record(
+            "segmenting", segmenting_seconds,
+            items_in=1, items_out=chunks_count, bytes_in=self._writers["text"].count
+        )
+        trace.finish_accumulated()
+
+        logger.info(
+            f"Streamed {document_id}: {self._writers['text'].count} chars, {chunks_count} chunks, "
+            f"{self._writers['entities'].count} entities, {self._writers['relations'].count} relations"
+        )
+        return {
+            "text_length": self._writers["text"].count,
+            "chunks_count": chunks_count,
+            "entities_count": self._writers["entities"].count,
+            "relations_count": self._writers["relations"].count,
+            "processing": {
+                "knowledge_graph": self.kg_manager is not None,
+                "vector_store": self._vector_ok
+            },
+            "payloads": {kind: writer.finish() for kind, writer in self._writers.items()}
+        }
+
+    def _tap(self, blocks: Iterable[str]) -> Iterator[str]:
+        """转发文本块给分段器，同时写入全文并按窗口触发实体识别"""
+        iterator = iter(blocks)
+        while True:
+            start = time.perf_counter()
+            with self.trace.accumulate("parsing") as stage:
+                block = next(iterator, None)
+                stage.items_out = int(block is not None)
+            self._nested_seconds += time.perf_counter() - start
+
+            if block is None:
+                break
+
+            if self._offset:
+                self._writers["text"].write(PARAGRAPH_SEPARATOR)
+            self._writers["text"].write(block)
+
+            if not self._window:
+                self._window_start = self._offset
+            self._window.append(block)
+            self._window_length += len(block) + len(PARAGRAPH_SEPARATOR)
+            self._offset += len(block) + len(PARAGRAPH_SEPARATOR)
+
+            if self._window_length >= self.window_chars:
+                self._analyze_window()
+
+            yield block
+
+        self._analyze_window()
+
+    def _analyze_window(self):
+        """对当前窗口做实体识别、关系抽取并写入知识图谱（实体偏移换算为全局偏移）"""
+        if not self._window:
+            return
+
+        start = time.perf_counter()
+        text = PARAGRAPH_SEPARATOR.join(self._window)
+        text_bytes = len(text.encode("utf-8"))
+        self._window, self._window_length = [], 0
+
+        with self.trace.accumulate("ner", items_in=1, bytes_in=text_bytes) as stage:
+            entities = self.ner_engine.extract_entities(text)
+            stage.items_out = len(entities)
+
+        with self.trace.accumulate("relations", items_in=len(entities), bytes_in=text_bytes) as stage:
+            relations = []
+            for relation in self.relation_extractor.extract_relations(text, entities):
+                key = (relation["subject"], relation["predicate"], relation["object"])
+                if key not in self._seen_relations:
+                    self._seen_relations.add(key)
+                    relations.append(relation)
+            stage.items_out = len(relations)
+
+        entities = [
+            {**entity, "start": entity["start"] + self._window_start, "end": entity["end"] + self._window_start}
+            for entity in entities
+        ]
+        for entity in entities:
+            self._writers["entities"].append(entity)
+        for relation in relations:
+            self._writers["relations"].append(relation)
+
+        if self.kg_manager:
+            with self.trace.accumulate("knowledge_graph", items_in=len(entities) + len(relations)) as stage:
+                stage.items_out = (
+                    self.kg_manager.batch_create_entities(entities, self.document_id)
+                    + self.kg_manager.batch_create_relations(relations, document_id=self.document_id)
+                )
+
+        self._nested_seconds += time.perf_counter() - start
+
+    def _add_chunk(self, chunk: Dict):
+        self._writers["chunks"].append(chunk)
+        self._pending_chunks.append(chunk)
+        if len(self._pending_chunks) >= self.batch_chunks:
+            self._flush_chunks()
+
+    def _flush_chunks(self):
+        """向量化并写入一批分块；失败时删除已写入的部分，后续批次不再写入"""
+        chunks, self._pending_chunks = self._pending_chunks, []
+        if not chunks or not self._vector_ok:
+            return
+
+        chunk_bytes = sum(len(chunk["text"].encode("utf-8")) for chunk in chunks)
+        with self.trace.accumulate("vector_store", items_in=len(chunks), bytes_in=chunk_bytes) as stage:
+            if self.vector_store.add_chunks(chunks, self.document_id):
+                stage.items_out = len(chunks)
+            else:
+                logger.error(f"Streaming vector write failed for {self.document_id}, dropping its vectors")
+                self._vector_ok = False
+                self.vector_store.delete_document(self.document_id)
@@ -0,0 +1,205 @@
+"""
+Background Warm-up
+后台预热 - 服务绑定端口后在后台线程中并行初始化各子系统（模型加载、数据库连接），
+并记录每个子系统的预热状态供存活/就绪探针查询
+
+多进程部署时主进程先用 preload_models() 加载模型，fork 出的 worker 预热时直接复用
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+
+WARMUP_PENDING = "pending"
+WARMUP_LOADING = "loading"
+WARMUP_READY = "ready"
+WARMUP_FAILED = "failed"
+
+
+class _Subsystem:
+    def __init__(self, name: str, init_fn: Callable[[], Any], depends_on: Iterable[str]):
+        self.name = name
+        self.init_fn = init_fn
+        self.depends_on = tuple(depends_on)
+        self.state = WARMUP_PENDING
+        self.error: Optional[str] = None
+        self.started_at: Optional[str] = None
+        self.duration_ms: Optional[float] = None
+        self.done = threading.Event()
+
+
+class Warmup:
+    """
+    子系统后台预热
+
+    每个子系统一个守护线程，互不依赖的子系统并行初始化；
+    depends_on 中的子系统结束（无论成功失败）后才开始初始化。
+    初始化函数返回 False 或抛出异常视为失败，失败的子系统按降级模式运行
+    """
+
+    def __init__(self):
+        self._subsystems: Dict[str, _Subsystem] = {}
+        self._lock = threading.Lock()
+        self._on_complete: Optional[Callable[[], Any]] = None
+        self.started = False
+
+    def register(self, name: str, init_fn: Callable[[], Any], depends_on: Iterable[str] = ()):
+        """
+        注册子系统
+
+        Args:
+            name: 子系统名称
+            init_fn: 初始化函数（在后台线程中调用）
+            depends_on: 需要先完成初始化的子系统名称
+        """
+        self._subsystems[name] = _Subsystem(name, init_fn, depends_on)
+
+    def start(self, on_complete: Callable[[], Any] = None):
+        """
+        启动所有子系统的后台初始化（立即返回）
+
+        Args:
+            on_complete: 全部子系统结束初始化后调用（在最后结束的预热线程中执行）
+        """
+        if self.started:
+            return
+        self.started = True
+        self._on_complete = on_complete
+        for subsystem in self._subsystems.values():
+            threading.Thread(
+                target=self._run,
+                args=(subsystem,),
+                name=f"warmup-{subsystem.name}",
+                daemon=True
+            ).start()
+        logger.info(f"Warm-up started: {', '.join(self._subsystems)}")
+
+    def _run(self, subsystem: _Subsystem):
+        for dependency in subsystem.depends_on:
+            self._subsystems[dependency].done.wait()
+
+        with self._lock:
+            subsystem.state = WARMUP_LOADING
+            subsystem.started_at = datetime.now().isoformat()
+        start = time.perf_counter()
+
+        try:
+            ok = subsystem.init_fn() is not False
+            error = None if ok else "initialization returned unavailable"
+        except Exception as e:
+            ok, error = False, str(e)
+
+        duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        with self._lock:
+            subsystem.state = WARMUP_READY if ok else WARMUP_FAILED
+            subsystem.error = error
+            subsystem.duration_ms = duration_ms
+            subsystem.done.set()
+            last = self.is_done()
+
+        if ok:
+            logger.info(f"✓ Warm-up {subsystem.name} ready in {duration_ms:.0f} ms")
+        else:
+            logger.warning(f"✗ Warm-up {subsystem.name} failed after {duration_ms:.0f} ms: {error}")
+
+        if last and self._on_complete:
+            try:
+                self._on_complete()
+            except Exception as e:
+                logger.error(f"Warm-up completion callback failed: {str(e)}")
+
+    def wait(self, names: Iterable[str] = None, timeout: float = None) -> bool:
+        """
+        等待子系统初始化结束
+
+        Args:
+            names: 子系统名称 (默认全部)
+            timeout: 总的最长等待时间（秒）
+
+        Returns:
+            是否全部结束（超时返回 False）
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in names or list(self._subsystems):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self._subsystems[name].done.wait(remaining):
+                return False
+        return True
+
+    def is_done(self, names: Iterable[str] = None) -> bool:
+        """子系统是否都已结束初始化（成功或失败）"""
+        return all(self._subsystems[name].done.is_set() for name in names or self._subsystems)
+
+    def state(self, name: str) -> str:
+        """子系统的预热状态"""
+        return self._subsystems[name].state
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """各子系统的预热状态、耗时和错误信息"""
+        with self._lock:
+            return {
+                name: {
+                    "state": subsystem.state,
+                    "started_at": subsystem.started_at,
+                    "duration_ms": subsystem.duration_ms,
+                    "error": subsystem.error
+                }
+                for name, subsystem in self._subsystems.items()
+            }
+
+    def pending(self) -> List[str]:
+        """尚未结束初始化的子系统"""
+        return [name for name, subsystem in self._subsystems.items() if not subsystem.done.is_set()]
+
+
+def preload_models() -> Dict[str, Optional[str]]:
+    """
+    在 fork worker 进程之前加载 spaCy 管道和 Embedding 模型（由 gunicorn 主进程调用）
+
+    模型只在主进程中加载一次，worker 创建 SpacyNER / VectorStoreManager 时直接复用，
+    各 worker 以写时复制的方式共享模型内存。这里不打开数据库连接、不创建线程，
+    二者都不能跨 fork 使用，仍由各 worker 在预热时创建
+
+    Returns:
+        {"spacy": 模型名或 None, "embedding": 模型名或 None}
+    """
+    from app.nlp.ner import SpacyNER
+    from app.vector.embedding_backends import preload_embedding_model
+    from app.vector.vector_store import EMBEDDING_MODEL_FALLBACKS
+
+    start = time.perf_counter()
+    loaded: Dict[str, Optional[str]] = {"spacy": None, "embedding": None}
+
+    ner = SpacyNER()
+    if ner.available:
+        loaded["spacy"] = ner.nlp.meta.get("name")
+
+    # 使用独立的向量化服务时 worker 不加载 Embedding 模型
+    if os.getenv("EMBEDDING_SERVER_SOCKET"):
+        model_names = []
+        logger.info("EMBEDDING_SERVER_SOCKET is set, embedding model is served out of process")
+    else:
+        model_names = EMBEDDING_MODEL_FALLBACKS
+
+    backend = os.getenv("EMBEDDING_BACKEND", "torch")
+    backends = [backend] if backend == "torch" else [backend, "torch"]
+    for model_name in model_names:
+        for candidate in backends:
+            try:
+                preload_embedding_model(model_name, candidate)
+                loaded["embedding"] = f"{model_name} ({candidate})"
+                break
+            except Exception as e:
+                logger.warning(f"Preloading {model_name} ({candidate}) failed: {str(e)}")
+        if loaded["embedding"]:
+            break
+
+    logger.info(
+        f"Models preloaded in {time.perf_counter() - start:.1f}s: "
+        f"spacy={loaded['spacy']}, embedding={loaded['embedding']}"
+    )
+    return loaded
@@ -0,0 +1,178 @@
+"""
+Async Neo4j Knowledge Graph Manager
+异步知识图谱管理器 - 基于 AsyncGraphDatabase，供 async 接口读取图数据
+"""
+import asyncio
+import os
+from typing import List, Dict, Optional, Any
+from neo4j import AsyncGraphDatabase, AsyncDriver, READ_ACCESS
+from loguru import logger
+
+from app.kg.neo4j_manager import (
+    NODE_COUNT_QUERY,
+    REL_COUNT_QUERY,
+    ENTITY_NEIGHBORS_QUERY,
+    ENTITIES_BY_LABEL_QUERY,
+    PATH_BETWEEN_ENTITIES_QUERY,
+    DOCUMENT_GRAPH_QUERY,
+    serialize_neo4j_value,
+    driver_pool_settings,
+)
+
+
+class AsyncNeo4jManager:
+    """
+    异步Neo4j管理器（只读查询）
+
+    在事件循环中等待数据库往返而不阻塞，多个图查询可以并发执行；
+    写入仍由同步的 Neo4jManager 在后台任务线程中完成
+    """
+
+    def __init__(
+        self,
+        uri: str = None,
+        user: str = None,
+        password: str = None
+    ):
+        """
+        Args:
+            uri: Neo4j连接URI (默认从环境变量读取)
+            user: 用户名 (默认从环境变量读取)
+            password: 密码 (默认从环境变量读取)
+        """
+        self.uri = uri or os.getenv("NEO4J_URI", "bolt://localhost:7687")
+        self.user = user or os.getenv("NEO4J_USER", "neo4j")
+        self.password = password or os.getenv("NEO4J_PASSWORD", "password")
+
+        self.driver: Optional[AsyncDriver] = None
+        self.connected = False
+
+    async def connect(self) -> bool:
+        """建立Neo4j连接（需在事件循环中调用）"""
+        try:
+            self.driver = AsyncGraphDatabase.driver(
+                self.uri,
+                auth=(self.user, self.password),
+                **driver_pool_settings()
+            )
+            # 测试连接
+            await self.driver.verify_connectivity()
+            self.connected = True
+            logger.info(f"✓ Async Neo4j driver connected to {self.uri}")
+        except Exception as e:
+            logger.warning(f"✗ Async Neo4j driver failed to connect: {str(e)}")
+            self.connected = False
+        return self.connected
+
+    async def close(self):
+        """关闭连接"""
+        if self.driver:
+            await self.driver.close()
+            self.connected = False
+            logger.info("Async Neo4j connection closed")
+
+    async def execute_query(self, query: str, parameters: Dict = None) -> List[Dict]:
+        """
+        执行只读Cypher查询
+
+        Args:
+            query: Cypher查询语句
+            parameters: 查询参数
+
+        Returns:
+            查询结果列表
+        """
+        if not self.connected:
+            logger.warning("Neo4j not connected, query skipped")
+            return []
+
+        parameters = parameters or {}
+
+        try:
+            async with self.driver.session(default_access_mode=READ_ACCESS) as session:
+                result = await session.run(query, parameters)
+                records = []
+                async for record in result:
+                    records.append({
+                        key: serialize_neo4j_value(record[key])
+                        for key in record.keys()
+                    })
+                return records
+        except Exception as e:
+            logger.error(f"Async query execution failed: {str(e)}")
+            logger.debug(f"Query: {query}, Parameters: {parameters}")
+            return []
+
+    async def get_stats(self) -> Dict[str, int]:
+        """获取图数据库统计信息（节点数与关系数并发查询）"""
+        if not self.connected:
+            return {"nodes": 0, "relationships": 0, "connected": False}
+
+        node_result, rel_result = await asyncio.gather(
+            self.execute_query(NODE_COUNT_QUERY),
+            self.execute_query(REL_COUNT_QUERY)
+        )
+
+        return {
+            "nodes": node_result[0]["count"] if node_result else 0,
+            "relationships": rel_result[0]["count"] if rel_result else 0,
+            "connected": True
+        }
+
+    async def get_entity_neighbors(
+        self,
+        entity_text: str,
+        max_depth: int = 2,
+        limit: int = 50
+    ) -> Dict[str, Any]:
+        """获取实体的邻居节点（子图）"""
+        if not self.connected:
+            return {"nodes": [], "edges": []}
+
+        result = await self.execute_query(ENTITY_NEIGHBORS_QUERY, {
+            "entity_text": entity_text,
+            "max_depth": max_depth,
+            "limit": limit
+        })
+
+        if result:
+            return result[0]
+        return {"nodes": [], "edges": []}
+
+    async def search_entities_by_label(self, label: str, limit: int = 20) -> List[Dict]:
+        """按标签搜索实体"""
+        if not self.connected:
+            return []
+
+        return await self.execute_query(ENTITIES_BY_LABEL_QUERY, {"label": label, "limit": limit})
+
+    async def find_path_between_entities(
+        self,
+        entity1: str,
+        entity2: str,
+        max_depth: int = 5
+    ) -> List[Dict]:
+        """查找两个实体之间的路径"""
+        if not self.connected:
+            return []
+
+        return await self.execute_query(PATH_BETWEEN_ENTITIES_QUERY, {
+            "entity1": entity1,
+            "entity2": entity2,
+            "max_depth": max_depth
+        })
+
+    async def get_document_graph(self, document_id: str) -> Dict[str, Any]:
+        """获取文档的完整知识图谱"""
+        if not self.connected:
+            return {"nodes": [], "edges": []}
+
+        result = await self.execute_query(DOCUMENT_GRAPH_QUERY, {"document_id": document_id})
+
+        if result:
+            data = result[0]
+            return {
+                "nodes": data.get("nodes", []),
+                "edges": data.get("edges", [])
+            }
+        return {"nodes": [], "edges": []}
@@ -8,6 +8,121 @@ from neo4j import GraphDatabase, Driver
 from loguru import logger
 
 
+# ==================== 只读查询（同步/异步管理器共用） ====================
+
+NODE_COUNT_QUERY = "MATCH (n) RETURN count(n) as count"
+REL_COUNT_QUERY = "MATCH ()-[r]->() RETURN count(r) as count"
+
+ENTITY_NEIGHBORS_QUERY = """
+    MATCH path = (e:Entity {text: $entity_text})-[*1..$max_depth]-(neighbor)
+    WITH e, neighbor, relationships(path) as rels
+    LIMIT $limit
+    WITH 
+        collect(DISTINCT {
+            id: e.id,
+            text: e.text,
+            label: e.label,
+            confidence: e.confidence
+        }) + collect(DISTINCT {
+            id: neighbor.id,
+            text: neighbor.text,
+            label: neighbor.label,
+            confidence: neighbor.confidence
+        }) as nodes,
+        [r IN rels | {
+            source: startNode(r).text,
+            target: endNode(r).text,
+            type: type(r)
+        }] as edges
+    RETURN nodes, edges
+    """
+
+ENTITIES_BY_LABEL_QUERY = """
+    MATCH (e:Entity {label: $label})
+    RETURN e.text as text, e.label as label, e.confidence as confidence
+    LIMIT $limit
+    """
+
+PATH_BETWEEN_ENTITIES_QUERY = """
+    MATCH path = shortestPath(
+        (e1:Entity {text: $entity1})-[*1..$max_depth]-(e2:Entity {text: $entity2})
+    )
+    RETURN [node IN nodes(path) | node.text] as path,
+           [rel IN relationships(path) | type(rel)] as relations,
+           length(path) as length
+    """
+
+DOCUMENT_GRAPH_QUERY = """
+    // 1. 找到文档提到的所有实体
+    MATCH (d:Document {id: $document_id})-[:MENTIONS]->(e:Entity)
+    WITH d, collect(e) as doc_entities
+
+    // 2. 只找这些实体之间的关系（限定在当前文档的实体内）
+    UNWIND doc_entities as e1
+    OPTIONAL MATCH (e1)-[r]-(e2:Entity)
+    WHERE e2 IN doc_entities
+
+    // 3. 收集节点和边
+    WITH doc_entities, collect(DISTINCT r) as relationships
+
+    RETURN
+        [e IN doc_entities | {
+            id: e.id,
+            text: e.text,
+            label: e.label,
+            confidence: e.confidence
+        }] as nodes,
+        [r IN relationships WHERE r IS NOT NULL | {
+            source: startNode(r).text,
+            target: endNode(r).text,
+            type: type(r),
+            confidence: r.confidence
+        }] as edges
+    """
+
+
+def serialize_neo4j_value(value):
+    """
+    递归地将Neo4j对象转换为可序列化的Python对象
+
+    Args:
+        value: Neo4j返回的值
+
+    Returns:
+        可序列化的Python对象
+    """
+    from neo4j.graph import Node, Relationship
+
+    if isinstance(value, Node):
+        # 将Node对象转换为字典
+        return dict(value)
+    elif isinstance(value, Relationship):
+        # 将Relationship对象转换为字典
+        return {
+            "type": value.type,
+            **dict(value)
+        }
+    elif isinstance(value, list):
+        # 递归处理列表
+        return [serialize_neo4j_value(item) for item in value]
+    elif isinstance(value, dict):
+        # 递归处理字典
+        return {k: serialize_neo4j_value(v) for k, v in value.items()}
+    else:
+        # 基本类型直接返回
+        return value
+
+
+def driver_pool_settings() -> Dict[str, Any]:
+    """连接池参数（从环境变量读取，同步/异步驱动共用）"""
+    return {
+        "max_connection_pool_size": int(os.getenv("NEO4J_MAX_POOL_SIZE", "50")),
+        "connection_acquisition_timeout": float(os.getenv("NEO4J_ACQUIRE_TIMEOUT", "30")),
+        "max_connection_lifetime": float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600")),
+        "keep_alive": True
+    }
+
+
 class Neo4jManager:
     """Neo4j数据库管理器"""
 
@@ -15,7 +130,8 @@ class Neo4jManager:
         self,
         uri: str = None,
         user: str = None,
-        password: str = None
+        password: str = None,
+        batch_size: int = None
     ):
         """
         初始化Neo4j连接
@@ -24,10 +140,12 @@ class Neo4jManager:
             uri: Neo4j连接URI (默认从环境变量读取)
             user: 用户名 (默认从环境变量读取)
             password: 密码 (默认从环境变量读取)
+            batch_size: 批量写入时每个事务的行数 (默认从环境变量读取)
         """
         self.uri = uri or os.getenv("NEO4J_URI", "bolt://localhost:7687")
         self.user = user or os.getenv("NEO4J_USER", "neo4j")
         self.password = password or os.getenv("NEO4J_PASSWORD", "password")
+        self.batch_size = batch_size or int(os.getenv("NEO4J_BATCH_SIZE", "1000"))
 
         self.driver: Optional[Driver] = None
         self.connected = False
@@ -39,7 +157,8 @@ class Neo4jManager:
         try:
             self.driver = GraphDatabase.driver(
                 self.uri,
-                auth=(self.user, self.password)
+                auth=(self.user, self.password),
+                **driver_pool_settings()
             )
             # 测试连接
             self.driver.verify_connectivity()
@@ -57,35 +176,8 @@ class Neo4jManager:
             logger.info("Neo4j connection closed")
 
     def _serialize_neo4j_value(self, value):
-        """
-        递归地将Neo4j对象转换为可序列化的Python对象
-
-        Args:
-            value: Neo4j返回的值
-
-        Returns:
-            可序列化的Python对象
-        """
-        from neo4j.graph import Node, Relationship
-
-        if isinstance(value, Node):
-            # 将Node对象转换为字典
-            return dict(value)
-        elif isinstance(value, Relationship):
-            # 将Relationship对象转换为字典
-            return {
-                "type": value.type,
-                **dict(value)
-            }
-        elif isinstance(value, list):
-            # 递归处理列表
-            return [self._serialize_neo4j_value(item) for item in value]
-        elif isinstance(value, dict):
-            # 递归处理字典
-            return {k: self._serialize_neo4j_value(v) for k, v in value.items()}
-        else:
-            # 基本类型直接返回
-            return value
+        """递归地将Neo4j对象转换为可序列化的Python对象"""
+        return serialize_neo4j_value(value)
 
     def execute_query(self, query: str, parameters: Dict = None) -> List[Dict]:
         """
@@ -132,6 +224,8 @@ class Neo4jManager:
             "CREATE CONSTRAINT IF NOT EXISTS FOR (e:Entity) REQUIRE e.id IS UNIQUE",
             # 概念节点唯一约束
             "CREATE CONSTRAINT IF NOT EXISTS FOR (c:Concept) REQUIRE c.id IS UNIQUE",
+            # 实体文本索引（关系写入和实体查询按 text 查找）
+            "CREATE INDEX entity_text IF NOT EXISTS FOR (e:Entity) ON (e.text)",
         ]
 
         for constraint in constraints:
@@ -153,11 +247,8 @@ class Neo4jManager:
         if not self.connected:
             return {"nodes": 0, "relationships": 0, "connected": False}
 
-        node_count_query = "MATCH (n) RETURN count(n) as count"
-        rel_count_query = "MATCH ()-[r]->() RETURN count(r) as count"
-
-        node_result = self.execute_query(node_count_query)
-        rel_result = self.execute_query(rel_count_query)
+        node_result = self.execute_query(NODE_COUNT_QUERY)
+        rel_result = self.execute_query(REL_COUNT_QUERY)
 
         return {
             "nodes": node_result[0]["count"] if node_result else 0,
@@ -261,71 +352,245 @@ class Neo4jManager:
         result = self.execute_query(query, parameters)
         return len(result) > 0
 
-    def batch_create_entities(self, entities: List[Dict], document_id: str) -> int:
+    def _group_mentions(self, entities: List[Dict]) -> Dict[str, Dict]:
+        """按实体ID合并提及（保持首次出现的顺序），统计提及次数和首次位置"""
+        grouped: Dict[str, Dict] = {}
+        for entity in entities:
+            entity_id = f"{entity['label']}_{entity['text']}"
+            row = grouped.get(entity_id)
+            if row is None:
+                grouped[entity_id] = {
+                    "entity_id": entity_id,
+                    "text": entity["text"],
+                    "label": entity["label"],
+                    "confidence": entity.get("confidence", 1.0),
+                    "count": 1,
+                    "first_position": [entity.get("start", 0), entity.get("end", 0)]
+                }
+            else:
+                # 与逐条写入一致：置信度取最后一次提及的值
+                row["confidence"] = entity.get("confidence", 1.0)
+                row["count"] += 1
+        return grouped
+
+    def batch_create_entities(
+        self,
+        entities: List[Dict],
+        document_id: str,
+        batch_size: int = None
+    ) -> int:
         """
         批量创建实体节点
 
+        先在客户端按 (label, text) 合并同一实体的多次提及，统计提及次数和首次位置，
+        再通过 UNWIND 分批写入，每批一个事务
+
         Args:
             entities: 实体列表
             document_id: 文档ID
+            batch_size: 每个事务写入的实体数（默认 self.batch_size）
 
         Returns:
-            成功创建的数量
+            成功关联到文档的提及数量
         """
         if not self.connected:
             return 0
 
+        batch_size = batch_size or self.batch_size
+        rows = list(self._group_mentions(entities).values())
+
         count = 0
-        for entity in entities:
-            if self.create_entity_node(entity, document_id):
-                count += 1
+        for i in range(0, len(rows), batch_size):
+            count += self._write_mentions(rows[i:i + batch_size], document_id)
 
-        logger.info(f"Created {count}/{len(entities)} entity nodes")
+        logger.info(f"Created {len(rows)} entity nodes for {count}/{len(entities)} mentions")
         return count
 
-    # ==================== 关系操作 ====================
+    def _write_mentions(self, rows: List[Dict], document_id: str = None, accumulate: bool = True) -> int:
+        """
+        以 UNWIND 方式写入一批实体及其提及关系（单个事务）
 
-    def create_relation(self, relation: Dict) -> bool:
+        行内的 document_id 优先于参数 document_id，便于跨文档批量写入
+
+        Args:
+            accumulate: 提及次数累加到已有值上（同一文档分多次写入时使用）；
+                为 False 时直接写为行内的次数，行内已是整篇文档的合计时重复写入结果不变
+
+        Returns:
+            写入的提及数量
         """
-        创建实体间关系
+        if accumulate:
+            count = "coalesce(r.count, 0) + row.count"
+            position = "CASE WHEN r.first_position IS NULL THEN row.first_position ELSE r.first_position END"
+        else:
+            count = "row.count"
+            position = "row.first_position"
+
+        query = f"""
+        UNWIND $rows AS row
+        // 创建或合并实体节点
+        MERGE (e:Entity {{id: row.entity_id}})
+        SET e.text = row.text,
+            e.label = row.label,
+            e.confidence = row.confidence
+
+        // 连接到文档
+        WITH e, row
+        MATCH (d:Document {{id: coalesce(row.document_id, $document_id)}})
+        MERGE (d)-[r:MENTIONS]->(e)
+        SET r.count = {count},
+            r.first_position = {position}
+
+        RETURN sum(row.count) as mentions
+        """
+
+        result = self.execute_query(query, {"rows": rows, "document_id": document_id})
+        return (result[0]["mentions"] or 0) if result else 0
+
+    def bulk_create_documents(self, documents: List[Dict], batch_size: int = None) -> Dict[str, int]:
+        """
+        跨文档批量写入文档节点、实体提及和关系（批量导入使用）
+
+        多个文档的数据合并后按 batch_size 分批，每批一个事务，
+        避免为每个小文档单独发起多次往返。每个文档的提及次数是整篇文档的合计，
+        直接覆盖写入，中断后重新导入同一文档不会重复累加
 
         Args:
-            relation: 关系信息 {subject, predicate, object, confidence, evidence}
+            documents: [{"document_id", "metadata", "entities", "relations"}]
+            batch_size: 每个事务写入的行数（默认 self.batch_size）
 
         Returns:
-            是否成功
+            {"documents": 文档数, "mentions": 提及数, "relations": 关系数}
         """
-        if not self.connected:
-            return False
+        if not self.connected or not documents:
+            return {"documents": 0, "mentions": 0, "relations": 0}
+
+        batch_size = batch_size or self.batch_size
+
+        document_rows = [
+            {
+                "document_id": doc["document_id"],
+                "file_name": doc["metadata"].get("file_name", ""),
+                "title": doc["metadata"].get("title", ""),
+                "author": doc["metadata"].get("author", ""),
+                "file_type": doc["metadata"].get("file_type", "")
+            }
+            for doc in documents
+        ]
+        document_query = """
+        UNWIND $rows AS row
+        MERGE (d:Document {id: row.document_id})
+        SET d.file_name = row.file_name,
+            d.title = row.title,
+            d.author = row.author,
+            d.file_type = row.file_type,
+            d.created_at = datetime()
+        RETURN count(d) as created
+        """
+        created = 0
+        for i in range(0, len(document_rows), batch_size):
+            result = self.execute_query(document_query, {"rows": document_rows[i:i + batch_size]})
+            if result:
+                created += result[0]["created"]
+
+        mention_rows = [
+            {**row, "document_id": doc["document_id"]}
+            for doc in documents
+            for row in self._group_mentions(doc["entities"]).values()
+        ]
+        mentions = 0
+        for i in range(0, len(mention_rows), batch_size):
+            mentions += self._write_mentions(mention_rows[i:i + batch_size], accumulate=False)
+
+        relations = [
+            {**relation, "document_id": doc["document_id"]}
+            for doc in documents
+            for relation in doc["relations"]
+        ]
+        relations_written = self.batch_create_relations(relations, batch_size)
+
+        logger.info(
+            f"Bulk wrote {created} documents, {mentions} mentions, {relations_written} relations"
+        )
+        return {"documents": created, "mentions": mentions, "relations": relations_written}
 
-        # 根据谓词类型动态创建关系
-        predicate = relation["predicate"].upper().replace(" ", "_")
+    # ==================== 关系操作 ====================
+
+    def _relation_type(self, predicate: str) -> str:
+        """将谓词转换为关系类型（反引号转义，可安全拼接进Cypher）"""
+        rel_type = predicate.upper().replace(" ", "_")
+        return "`" + rel_type.replace("`", "``") + "`"
+
+    def _write_relations(self, predicate: str, rows: List[Dict], document_id: str = None) -> int:
+        """
+        以 UNWIND 方式写入同一谓词的一批关系（单个事务）
 
+        关系类型无法参数化，因此每种谓词对应一条固定的查询语句，
+        查询计划可以被缓存复用；实体通过 Entity.text 索引查找。
+        来源文档（行内 document_id 优先，其次为参数 document_id）记录在关系的 document_ids 属性中
+
+        Returns:
+            成功写入的关系数量
+        """
         query = f"""
-        MATCH (e1:Entity), (e2:Entity)
-        WHERE e1.text = $subject AND e2.text = $object
-        MERGE (e1)-[r:{predicate}]->(e2)
-        SET r.confidence = $confidence,
-            r.evidence = $evidence
-        RETURN r
+        UNWIND $rows AS row
+        WITH row, coalesce(row.document_id, $document_id) AS source
+        MATCH (e1:Entity {{text: row.subject}})
+        MATCH (e2:Entity {{text: row.object}})
+        MERGE (e1)-[r:{self._relation_type(predicate)}]->(e2)
+        SET r.confidence = row.confidence,
+            r.evidence = row.evidence,
+            r.document_ids = CASE
+                WHEN source IS NULL OR source IN coalesce(r.document_ids, []) THEN r.document_ids
+                ELSE coalesce(r.document_ids, []) + source
+            END
+        RETURN count(DISTINCT row.idx) as created
         """
 
-        parameters = {
+        result = self.execute_query(query, {"rows": rows, "document_id": document_id})
+        return result[0]["created"] if result else 0
+
+    def _relation_row(self, idx: int, relation: Dict) -> Dict:
+        return {
+            "idx": idx,
             "subject": relation["subject"],
             "object": relation["object"],
             "confidence": relation.get("confidence", 0.5),
-            "evidence": relation.get("evidence", "")
+            "evidence": relation.get("evidence", ""),
+            "document_id": relation.get("document_id")
         }
 
-        result = self.execute_query(query, parameters)
-        return len(result) > 0
+    def create_relation(self, relation: Dict) -> bool:
+        """
+        创建实体间关系
+
+        Args:
+            relation: 关系信息 {subject, predicate, object, confidence, evidence}
+
+        Returns:
+            是否成功
+        """
+        if not self.connected:
+            return False
 
-    def batch_create_relations(self, relations: List[Dict]) -> int:
+        rows = [self._relation_row(0, relation)]
+        return self._write_relations(relation["predicate"], rows) > 0
+
+    def batch_create_relations(
+        self,
+        relations: List[Dict],
+        batch_size: int = None,
+        document_id: str = None
+    ) -> int:
         """
         批量创建关系
 
+        按谓词分组，每组通过 UNWIND 分批写入，每批一个事务
+
         Args:
             relations: 关系列表
+            batch_size: 每个事务写入的关系数（默认 self.batch_size）
+            document_id: 来源文档ID（记录在关系上，用于增量更新时移除过期关系）
 
         Returns:
             成功创建的数量
@@ -333,14 +598,184 @@ class Neo4jManager:
         if not self.connected:
             return 0
 
+        batch_size = batch_size or self.batch_size
+
+        # 按谓词分组（保持原有顺序，同一关系重复出现时后者覆盖前者）
+        by_predicate: Dict[str, List[Dict]] = {}
+        for idx, relation in enumerate(relations):
+            by_predicate.setdefault(relation["predicate"], []).append(self._relation_row(idx, relation))
+
         count = 0
-        for relation in relations:
-            if self.create_relation(relation):
-                count += 1
+        for predicate, rows in by_predicate.items():
+            for i in range(0, len(rows), batch_size):
+                count += self._write_relations(predicate, rows[i:i + batch_size], document_id)
 
         logger.info(f"Created {count}/{len(relations)} relationships")
         return count
 
+    # ==================== 增量更新 ====================
+
+    def sync_document_entities(
+        self,
+        document_id: str,
+        old_entities: List[Dict],
+        new_entities: List[Dict],
+        batch_size: int = None
+    ) -> Dict[str, int]:
+        """
+        按新版本文档的实体提及增量更新图谱
+
+        只写入新增或提及次数/位置/置信度发生变化的实体，
+        删除新版本中不再出现的提及；实体不再有任何连接时一并删除
+
+        Args:
+            document_id: 文档ID
+            old_entities: 旧版本的实体列表
+            new_entities: 新版本的实体列表
+            batch_size: 每个事务写入的实体数（默认 self.batch_size）
+
+        Returns:
+            {"upserted": 写入的实体数, "removed": 移除的提及关系数, "unchanged": 未变化的实体数}
+        """
+        if not self.connected:
+            return {"upserted": 0, "removed": 0, "unchanged": 0}
+
+        batch_size = batch_size or self.batch_size
+        old = self._group_mentions(old_entities)
+        new = self._group_mentions(new_entities)
+
+        changed = [row for entity_id, row in new.items() if old.get(entity_id) != row]
+        stale = [entity_id for entity_id in old if entity_id not in new]
+
+        upsert_query = """
+        UNWIND $rows AS row
+        MERGE (e:Entity {id: row.entity_id})
+        SET e.text = row.text,
+            e.label = row.label,
+            e.confidence = row.confidence
+        WITH e, row
+        MATCH (d:Document {id: $document_id})
+        MERGE (d)-[r:MENTIONS]->(e)
+        SET r.count = row.count,
+            r.first_position = row.first_position
+        RETURN count(row) as upserted
+        """
+
+        remove_query = """
+        UNWIND $entity_ids AS entity_id
+        MATCH (:Document {id: $document_id})-[r:MENTIONS]->(e:Entity {id: entity_id})
+        DELETE r
+        WITH collect(DISTINCT e) AS entities, count(r) AS removed
+        FOREACH (e IN [x IN entities WHERE NOT (x)--()] | DELETE e)
+        RETURN removed
+        """
+
+        upserted = 0
+        for i in range(0, len(changed), batch_size):
+            result = self.execute_query(upsert_query, {
+                "rows": changed[i:i + batch_size],
+                "document_id": document_id
+            })
+            if result:
+                upserted += result[0]["upserted"]
+
+        removed = 0
+        for i in range(0, len(stale), batch_size):
+            result = self.execute_query(remove_query, {
+                "entity_ids": stale[i:i + batch_size],
+                "document_id": document_id
+            })
+            if result:
+                removed += result[0]["removed"]
+
+        stats = {"upserted": upserted, "removed": removed, "unchanged": len(new) - len(changed)}
+        logger.info(f"Synced entities for {document_id}: {stats}")
+        return stats
+
+    def sync_document_relations(
+        self,
+        document_id: str,
+        old_relations: List[Dict],
+        new_relations: List[Dict],
+        batch_size: int = None
+    ) -> Dict[str, int]:
+        """
+        按新版本文档的关系增量更新图谱
+
+        只写入新增或置信度/证据发生变化的关系；新版本中不再出现的关系
+        从其 document_ids 中移除本文档，没有其他来源文档时删除该关系；
+        document_ids 中不包含本文档（包括来源未知、没有 document_ids 的旧关系）时保持不变
+
+        Args:
+            document_id: 文档ID
+            old_relations: 旧版本的关系列表
+            new_relations: 新版本的关系列表
+            batch_size: 每个事务写入的关系数（默认 self.batch_size）
+
+        Returns:
+            {"upserted": 写入的关系数, "removed": 删除的关系数, "unchanged": 未变化的关系数}
+        """
+        if not self.connected:
+            return {"upserted": 0, "removed": 0, "unchanged": 0}
+
+        batch_size = batch_size or self.batch_size
+
+        def keyed(relations: List[Dict]) -> Dict[tuple, Dict]:
+            # 同一关系重复出现时后者覆盖前者（与批量写入一致）
+            rows = {}
+            for idx, relation in enumerate(relations):
+                key = (relation["subject"], relation["predicate"], relation["object"])
+                rows[key] = self._relation_row(idx, relation)
+            return rows
+
+        def same(a: Dict, b: Dict) -> bool:
+            return a["confidence"] == b["confidence"] and a["evidence"] == b["evidence"]
+
+        old = keyed(old_relations)
+        new = keyed(new_relations)
+
+        changed: Dict[str, List[Dict]] = {}
+        for key, row in new.items():
+            if key not in old or not same(old[key], row):
+                changed.setdefault(key[1], []).append(row)
+
+        stale: Dict[str, List[Dict]] = {}
+        for key, row in old.items():
+            if key not in new:
+                stale.setdefault(key[1], []).append(row)
+
+        upserted = 0
+        for predicate, rows in changed.items():
+            for i in range(0, len(rows), batch_size):
+                upserted += self._write_relations(predicate, rows[i:i + batch_size], document_id)
+
+        removed = 0
+        for predicate, rows in stale.items():
+            query = f"""
+            UNWIND $rows AS row
+            MATCH (:Entity {{text: row.subject}})-[r:{self._relation_type(predicate)}]->(:Entity {{text: row.object}})
+            WHERE $document_id IN coalesce(r.document_ids, [])
+            SET r.document_ids = [x IN r.document_ids WHERE x <> $document_id]
+            WITH r WHERE size(r.document_ids) = 0
+            DELETE r
+            RETURN count(r) as removed
+            """
+            for i in range(0, len(rows), batch_size):
+                result = self.execute_query(query, {
+                    "rows": rows[i:i + batch_size],
+                    "document_id": document_id
+                })
+                if result:
+                    removed += result[0]["removed"]
+
+        stats = {
+            "upserted": upserted,
+            "removed": removed,
+            "unchanged": len(new) - sum(len(rows) for rows in changed.values())
+        }
+        logger.info(f"Synced relations for {document_id}: {stats}")
+        return stats
+
     # ==================== 查询操作 ====================
 
     def get_entity_neighbors(
@@ -363,29 +798,7 @@ class Neo4jManager:
         if not self.connected:
             return {"nodes": [], "edges": []}
 
-        query = """
-        MATCH path = (e:Entity {text: $entity_text})-[*1..$max_depth]-(neighbor)
-        WITH e, neighbor, relationships(path) as rels
-        LIMIT $limit
-        WITH 
-            collect(DISTINCT {
-                id: e.id,
-                text: e.text,
-                label: e.label,
-                confidence: e.confidence
-            }) + collect(DISTINCT {
-                id: neighbor.id,
-                text: neighbor.text,
-                label: neighbor.label,
-                confidence: neighbor.confidence
-            }) as nodes,
-            [r IN rels | {
-                source: startNode(r).text,
-                target: endNode(r).text,
-                type: type(r)
-            }] as edges
-        RETURN nodes, edges
-        """
+        query = ENTITY_NEIGHBORS_QUERY
 
         parameters = {
             "entity_text": entity_text,
@@ -413,11 +826,7 @@ class Neo4jManager:
         if not self.connected:
             return []
 
-        query = """
-        MATCH (e:Entity {label: $label})
-        RETURN e.text as text, e.label as label, e.confidence as confidence
-        LIMIT $limit
-        """
+        query = ENTITIES_BY_LABEL_QUERY
 
         return self.execute_query(query, {"label": label, "limit": limit})
 
@@ -441,14 +850,7 @@ class Neo4jManager:
         if not self.connected:
             return []
 
-        query = """
-        MATCH path = shortestPath(
-            (e1:Entity {text: $entity1})-[*1..$max_depth]-(e2:Entity {text: $entity2})
-        )
-        RETURN [node IN nodes(path) | node.text] as path,
-               [rel IN relationships(path) | type(rel)] as relations,
-               length(path) as length
-        """
+        query = PATH_BETWEEN_ENTITIES_QUERY
 
         parameters = {
             "entity1": entity1,
@@ -471,33 +873,7 @@ class Neo4jManager:
         if not self.connected:
             return {"nodes": [], "edges": []}
 
-        query = """
-        // 1. 找到文档提到的所有实体
-        MATCH (d:Document {id: $document_id})-[:MENTIONS]->(e:Entity)
-        WITH d, collect(e) as doc_entities
-
-        // 2. 只找这些实体之间的关系（限定在当前文档的实体内）
-        UNWIND doc_entities as e1
-        OPTIONAL MATCH (e1)-[r]-(e2:Entity)
-        WHERE e2 IN doc_entities
-
-        // 3. 收集节点和边
-        WITH doc_entities, collect(DISTINCT r) as relationships
-
-        RETURN
-            [e IN doc_entities | {
-                id: e.id,
-                text: e.text,
-                label: e.label,
-                confidence: e.confidence
-            }] as nodes,
-            [r IN relationships WHERE r IS NOT NULL | {
-                source: startNode(r).text,
-                target: endNode(r).text,
-                type: type(r),
-                confidence: r.confidence
-            }] as edges
-        """
+        query = DOCUMENT_GRAPH_QUERY
 
 
         result = self.execute_query(query, {"document_id": document_id})
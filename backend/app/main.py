@@ -2,26 +2,33 @@
 MCP Platform - FastAPI Main Application
 集成知识图谱、向量检索、RAG问答的完整平台
 """
+import asyncio
+import hashlib
+import json
 import os
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from loguru import logger
 from dotenv import load_dotenv
 
 from app.parsers.pdf_parser import PDFParser
 from app.parsers.word_parser import WordParser
-from app.nlp.segmenter import TextSegmenter
+from app.nlp.segmenter import create_segmenter
 from app.nlp.ner import SimpleNER, SpacyNER, RelationExtractor
 from app.models.schemas import DocumentMetadata, ParsedDocument
-from app.kg.neo4j_manager import Neo4jManager
-from app.vector.vector_store import VectorStoreManager
-from app.rag.rag_engine import RAGEngine
+from app.jobs.job_queue import JobQueue, JobContext
+from app.jobs.metrics import StageMetrics, PipelineTrace
+from app.jobs.streaming_ingest import StreamingIngestor
+from app.jobs.warmup import Warmup, WARMUP_FAILED
+from app.storage.document_store import DocumentStore
+from app.upload_limit import UploadSizeLimitMiddleware
 
 # 加载环境变量
 load_dotenv()
@@ -33,6 +40,14 @@ app = FastAPI(
     version="0.2.0"
 )
 
+# 上传大小上限与流式写盘的分块大小（字节）
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", "10485760"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", "1048576"))
+
+# 上传大小限制（在接收请求体时检查，UploadFile 在进入接口前已被完整接收）
+# 先于 CORS 注册，413 响应同样带有跨域头
+app.add_middleware(UploadSizeLimitMiddleware, max_upload_size=MAX_UPLOAD_SIZE)
+
 # CORS配置（允许前端跨域访问）
 app.add_middleware(
     CORSMiddleware,
@@ -46,56 +61,150 @@ app.add_middleware(
 UPLOAD_DIR = Path("./uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# 文件大小达到该值时使用流式处理流水线（字节，0 表示始终使用）
+STREAMING_INGEST_THRESHOLD = int(os.getenv("STREAMING_INGEST_THRESHOLD", "5242880"))
+
+# 子系统仍在预热时，503 响应建议客户端重试的间隔（秒）
+WARMUP_RETRY_AFTER = int(os.getenv("WARMUP_RETRY_AFTER", "5"))
+
 # ==================== 初始化各个模块 ====================
+# 轻量模块在导入时创建；NER模型、Neo4j、Embedding模型和RAG引擎在服务启动后
+# 由后台预热线程并行初始化（torch、chromadb、neo4j 等重量级依赖也在此时才导入），
+# 初始化完成前对应的全局变量为 None
 
 # 文件解析器
 pdf_parser = PDFParser()
 word_parser = WordParser()
-text_segmenter = TextSegmenter(max_chunk_size=500, overlap=50)
-
-# NER引擎（尝试使用SpaCy，失败则使用SimpleNER）
-ner_engine = SpacyNER()
-if not ner_engine.available:
-    logger.warning("SpaCy not available, falling back to SimpleNER")
-    ner_engine = SimpleNER()
 
 relation_extractor = RelationExtractor()
 
-# 知识图谱管理器（Neo4j）
-try:
-    kg_manager = Neo4jManager()
-    if kg_manager.connected:
-        kg_manager.create_constraints()
-except Exception as e:
-    logger.warning(f"Knowledge Graph initialization failed: {e}")
-    kg_manager = None
-
-# 向量存储管理器（ChromaDB）
-try:
-    vector_store = VectorStoreManager()
-except Exception as e:
-    logger.error(f"Vector Store initialization failed: {e}")
-    vector_store = None
-
-# RAG问答引擎
-try:
-    rag_engine = RAGEngine(
-        vector_store=vector_store,
-        kg_manager=kg_manager
-    )
-except Exception as e:
-    logger.warning(f"RAG Engine initialization failed: {e}")
-    rag_engine = None
+# NER引擎（预热时加载）
+ner_engine = None
+
+# 知识图谱管理器（Neo4j）与供 async 接口使用的异步图查询管理器（预热时连接）
+kg_manager = None
+async_kg_manager = None
+
+# 向量存储管理器（ChromaDB 或内存映射索引，预热时加载）
+vector_store = None
+
+# 文本分段器（随向量存储一起预热，SEGMENT_MODE=tokens 时按Embedding模型的分词器度量分块）
+text_segmenter = None
+
+# RAG问答引擎（预热时创建）
+rag_engine = None
+
+# 持久化文档存储（全文、实体、关系按需加载）
+document_store = DocumentStore()
+
+# 后台处理任务队列
+job_queue = JobQueue()
+
+# 处理流水线各阶段指标（多个 worker 进程的统计通过共享数据库合并）
+ingest_metrics = StageMetrics(db_path=os.getenv("METRICS_DB_PATH", "./data/metrics.db"))
+
+# 启动事件中记录的事件循环（异步驱动需要在其中连接）
+event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def init_ner_engine() -> bool:
+    """NER引擎（尝试使用SpaCy，失败则使用SimpleNER）"""
+    global ner_engine
+
+    engine = SpacyNER()
+    if not engine.available:
+        logger.warning("SpaCy not available, falling back to SimpleNER")
+        engine = SimpleNER()
+    ner_engine = engine
+    return True
+
+
+def init_knowledge_graph() -> bool:
+    """知识图谱管理器（Neo4j）及异步图查询管理器"""
+    global kg_manager, async_kg_manager
+    from app.kg.neo4j_manager import Neo4jManager
+    from app.kg.async_neo4j_manager import AsyncNeo4jManager
+
+    try:
+        manager = Neo4jManager()
+        if manager.connected:
+            manager.create_constraints()
+    except Exception as e:
+        logger.warning(f"Knowledge Graph initialization failed: {e}")
+        return False
+
+    kg_manager = manager
+    if not manager.connected:
+        return False
+
+    async_manager = AsyncNeo4jManager()
+    asyncio.run_coroutine_threadsafe(async_manager.connect(), event_loop).result()
+    async_kg_manager = async_manager
+    return True
+
+
+def init_vector_store() -> bool:
+    """向量存储管理器（向量索引 + Embedding模型）"""
+    global vector_store, text_segmenter
+    from app.vector.vector_store import VectorStoreManager
+
+    try:
+        store = VectorStoreManager()
+    except Exception as e:
+        logger.error(f"Vector Store initialization failed: {e}")
+        text_segmenter = create_segmenter(None, 0)
+        return False
+
+    vector_store = store
+    text_segmenter = create_segmenter(*store.get_tokenizer())
+    return store.available
+
+
+def init_rag_engine() -> bool:
+    """RAG问答引擎（依赖向量存储和知识图谱，二者结束预热后创建）"""
+    global rag_engine
+    from app.rag.rag_engine import RAGEngine
+
+    try:
+        rag_engine = RAGEngine(
+            vector_store=vector_store,
+            kg_manager=kg_manager
+        )
+    except Exception as e:
+        logger.warning(f"RAG Engine initialization failed: {e}")
+        return False
+    return True
+
+
+def log_initialized():
+    """预热全部结束后输出各模块状态"""
+    logger.info("="*60)
+    logger.info("MCP Platform Initialized")
+    logger.info(f"  - Knowledge Graph (Neo4j): {'✓' if kg_manager and kg_manager.connected else '✗'}")
+    logger.info(f"  - Vector Store ({os.getenv('VECTOR_BACKEND', 'chroma')}): {'✓' if vector_store and vector_store.available else '✗'}")
+    logger.info(f"  - RAG Engine (OpenAI): {'✓' if rag_engine and rag_engine.available else '✗'}")
+    logger.info("="*60)
+
 
-# 内存文档存储（临时方案）
-documents_store = {}
+warmup = Warmup()
+warmup.register("ner_engine", init_ner_engine)
+warmup.register("knowledge_graph", init_knowledge_graph)
+warmup.register("vector_store", init_vector_store)
+warmup.register("rag_engine", init_rag_engine, depends_on=("knowledge_graph", "vector_store"))
 
-logger.info("="*60)
-logger.info("MCP Platform Initialized")
-logger.info(f"  - Knowledge Graph (Neo4j): {'✓' if kg_manager and kg_manager.connected else '✗'}")
-logger.info(f"  - Vector Store (ChromaDB): {'✓' if vector_store and vector_store.available else '✗'}")
-logger.info(f"  - RAG Engine (OpenAI): {'✓' if rag_engine and rag_engine.available else '✗'}")
-logger.info("="*60)
+# 文档处理流水线开始前需要完成预热的子系统
+INGEST_SUBSYSTEMS = ("ner_engine", "knowledge_graph", "vector_store")
+
+
+def service_unavailable(subsystem: str, detail: str) -> HTTPException:
+    """子系统不可用时的 503 错误（仍在预热时附带 Retry-After）"""
+    if not warmup.is_done([subsystem]):
+        return HTTPException(
+            status_code=503,
+            detail=f"{detail} (warming up)",
+            headers={"Retry-After": str(WARMUP_RETRY_AFTER)}
+        )
+    return HTTPException(status_code=503, detail=detail)
 
 
 # ==================== 基础API ====================
@@ -120,16 +229,24 @@ async def root():
 @app.get("/health")
 async def health_check():
     """健康检查"""
-    kg_stats = kg_manager.get_stats() if kg_manager else {"connected": False}
+    kg_stats = (
+        await async_kg_manager.get_stats()
+        if async_kg_manager and async_kg_manager.connected else {"connected": False}
+    )
     vector_stats = vector_store.get_stats() if vector_store else {"available": False}
 
+    if ner_engine is None:
+        ner_status = "loading"
+    else:
+        ner_status = "spacy" if isinstance(ner_engine, SpacyNER) and ner_engine.available else "simple"
+
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "services": {
             "pdf_parser": "available",
             "word_parser": "available",
-            "ner_engine": "spacy" if isinstance(ner_engine, SpacyNER) and ner_engine.available else "simple",
+            "ner_engine": ner_status,
             "knowledge_graph": {
                 "status": "connected" if kg_stats.get("connected") else "disconnected",
                 "nodes": kg_stats.get("nodes", 0),
@@ -137,65 +254,182 @@ async def health_check():
             },
             "vector_store": {
                 "status": "available" if vector_stats.get("available") else "unavailable",
-                "total_chunks": vector_stats.get("total_chunks", 0)
+                "total_chunks": vector_stats.get("total_chunks", 0),
+                "embedding_cache": vector_stats.get("embedding_cache")
             },
             "rag_engine": "available" if rag_engine and rag_engine.available else "unavailable"
-        }
+        },
+        "warmup": warmup.snapshot()
+    }
+
+
+@app.get("/health/live")
+async def liveness_check():
+    """存活探针（进程能处理请求即返回 200，不检查依赖服务）"""
+    return {
+        "status": "alive",
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """
+    就绪探针（所有子系统结束预热后返回 200，预热中返回 503）
+
+    结束预热但初始化失败的子系统（如 Neo4j 未启动）按降级模式运行，
+    此时 status 为 degraded，仍返回 200
+    """
+    subsystems = warmup.snapshot()
+    pending = warmup.pending()
+
+    if pending:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": str(WARMUP_RETRY_AFTER)},
+            content={
+                "status": "warming_up",
+                "timestamp": datetime.now().isoformat(),
+                "pending": pending,
+                "subsystems": subsystems
+            }
+        )
+
+    failed = [name for name, info in subsystems.items() if info["state"] == WARMUP_FAILED]
+    return {
+        "status": "degraded" if failed else "ready",
+        "timestamp": datetime.now().isoformat(),
+        "failed": failed,
+        "subsystems": subsystems
     }
 
 
 # ==================== 文档上传与解析 ====================
 
-@app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...)):
+INGEST_STAGES = ["parsing", "segmenting", "ner", "relations", "vector_store", "knowledge_graph"]
+
+
+def process_document(
+    job: JobContext,
+    document_id: str,
+    file_path: Path,
+    file_name: str,
+    file_ext: str,
+    content_hash: str = None,
+    replace: bool = False
+) -> dict:
     """
-    上传文件并完整处理（解析、NER、知识图谱、向量化）
+    文档处理流水线（在后台工作线程中执行）
 
-    支持的文件类型: PDF, DOCX
+    解析 -> 分段 -> 实体识别 -> 关系抽取 -> 向量化 -> 知识图谱
+
+    每个阶段的耗时、输入/输出数量和字节数记录在结果的 timings 中，
+    并汇总到 /api/metrics 的直方图
+
+    Args:
+        content_hash: 文件内容哈希（用于上传去重）
+        replace: 是否作为同一 document_id 的新版本增量更新（只写入变化的分块、实体提及和关系）
     """
-    try:
-        # 生成文档ID
-        document_id = str(uuid.uuid4())
+    # 服务刚启动时等待模型和数据库连接完成预热（任务在后台线程中执行，可以阻塞）
+    warmup.wait(INGEST_SUBSYSTEMS)
+
+    trace = PipelineTrace(ingest_metrics)
+
+    with trace.stage("total", items_in=1, bytes_in=file_path.stat().st_size) as total:
+        parsed_doc = run_ingest_pipeline(
+            job, trace, document_id, file_path, file_name, file_ext,
+            content_hash=content_hash,
+            replace=replace
+        )
+        total.items_out = parsed_doc["chunks_count"]
+
+    parsed_doc["timings"] = trace.to_dict()
+    logger.info(
+        f"Document processed successfully: {document_id} "
+        f"in {trace.stages['total']['duration_ms']:.0f} ms"
+    )
+    return parsed_doc
 
-        # 检查文件类型
-        file_ext = Path(file.filename).suffix.lower()
-        if file_ext not in ['.pdf', '.docx', '.doc']:
-            raise HTTPException(
-                status_code=400,
-                detail=f"不支持的文件类型: {file_ext}. 仅支持 PDF 和 DOCX"
-            )
 
-        # 保存文件
-        file_path = UPLOAD_DIR / f"{document_id}{file_ext}"
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+def run_ingest_pipeline(
+    job: JobContext,
+    trace: PipelineTrace,
+    document_id: str,
+    file_path: Path,
+    file_name: str,
+    file_ext: str,
+    content_hash: str = None,
+    replace: bool = False
+) -> dict:
+    """
+    执行各处理阶段并保存结果
 
-        logger.info(f"File uploaded: {file.filename} -> {file_path}")
+    replace=True 时视为同一文档的新版本：与文档存储中的旧版本比较，
+    只写入变化的实体提及、关系和分块，并移除过期的部分
 
-        # 1. 解析文件
+    大文件（STREAMING_INGEST_THRESHOLD 以上）的首次处理走流式流水线；
+    增量更新需要新旧两个版本做比较，仍一次性处理
+    """
+    if not replace and file_path.stat().st_size >= STREAMING_INGEST_THRESHOLD:
+        return run_streaming_pipeline(job, trace, document_id, file_path, file_name, file_ext, content_hash)
+
+    sync_stats = {}
+    # 1. 解析文件
+    job.set_stage("parsing")
+    with trace.stage("parsing", items_in=1, bytes_in=file_path.stat().st_size) as stage:
         if file_ext == '.pdf':
             parse_result = pdf_parser.parse(str(file_path))
         else:
             parse_result = word_parser.parse(str(file_path))
 
         if parse_result['status'] == 'error':
-            raise HTTPException(status_code=500, detail=parse_result.get('error', 'Parse error'))
+            raise Exception(parse_result.get('error', 'Parse error'))
 
         text = parse_result['text']
+        stage.items_out = parse_result['metadata'].get('page_count') or 1
+
+    text_bytes = len(text.encode("utf-8"))
 
-        # 2. 文本分段
+    # 2. 文本分段
+    job.set_stage("segmenting")
+    with trace.stage("segmenting", items_in=1, bytes_in=text_bytes) as stage:
         chunks = text_segmenter.segment(text, document_id)
+        stage.items_out = len(chunks)
 
-        # 3. 实体识别
+    # 3. 实体识别
+    job.set_stage("ner")
+    with trace.stage("ner", items_in=1, bytes_in=text_bytes) as stage:
         entities = ner_engine.extract_entities(text)
+        stage.items_out = len(entities)
 
-        # 4. 关系抽取
+    # 4. 关系抽取
+    job.set_stage("relations")
+    with trace.stage("relations", items_in=len(entities), bytes_in=text_bytes) as stage:
         relations = relation_extractor.extract_relations(text, entities)
-
-        # 5. 存储到知识图谱
-        kg_success = False
-        if kg_manager and kg_manager.connected:
+        stage.items_out = len(relations)
+
+    # 5. 向量化并存储
+    # 增量更新时先同步分块：失败时异常中止任务，知识图谱和文档存储仍是旧版本，重试时比较的基准不变
+    job.set_stage("vector_store")
+    vector_success = False
+    if vector_store and vector_store.available:
+        chunk_bytes = sum(len(chunk["text"].encode("utf-8")) for chunk in chunks)
+        with trace.stage("vector_store", items_in=len(chunks), bytes_in=chunk_bytes) as stage:
+            if replace:
+                # 只为内容变化的分块计算 embedding
+                sync_stats["chunks"] = vector_store.sync_document_chunks(document_id, chunks)
+                vector_success = True
+                stage.items_out = sync_stats["chunks"]["added"]
+            else:
+                vector_success = bool(vector_store.add_chunks(chunks, document_id))
+                stage.items_out = len(chunks) if vector_success else 0
+        logger.info(f"✓ Saved to Vector Store: {len(chunks)} chunks")
+
+    # 6. 存储到知识图谱
+    job.set_stage("knowledge_graph")
+    kg_success = False
+    if kg_manager and kg_manager.connected:
+        with trace.stage("knowledge_graph", items_in=len(entities) + len(relations)) as stage:
             # 创建文档节点
             metadata = {
                 **parse_result['metadata'],
@@ -203,52 +437,289 @@ async def upload_file(file: UploadFile = File(...)):
             }
             kg_manager.create_document_node(document_id, metadata)
 
-            # 批量创建实体节点
-            kg_manager.batch_create_entities(entities, document_id)
+            if replace:
+                # 增量更新实体提及和关系
+                entity_stats = kg_manager.sync_document_entities(
+                    document_id,
+                    document_store.get_payload(document_id, "entities") or [],
+                    entities
+                )
+                relation_stats = kg_manager.sync_document_relations(
+                    document_id,
+                    document_store.get_payload(document_id, "relations") or [],
+                    relations
+                )
+                sync_stats["entities"] = entity_stats
+                sync_stats["relations"] = relation_stats
+                stage.items_out = entity_stats["upserted"] + relation_stats["upserted"]
+            else:
+                # 批量创建实体节点
+                entities_written = kg_manager.batch_create_entities(entities, document_id)
+
+                # 批量创建关系
+                relations_written = kg_manager.batch_create_relations(relations, document_id=document_id)
+
+                stage.items_out = entities_written + relations_written
+
+        kg_success = True
+        logger.info(f"✓ Saved to Knowledge Graph: {len(entities)} entities, {len(relations)} relations")
+
+    # 构建结果
+    parsed_doc = {
+        "document_id": document_id,
+        "file_name": file_name,
+        "file_type": file_ext[1:],
+        "text_length": len(text),
+        "chunks_count": len(chunks),
+        "entities_count": len(entities),
+        "relations_count": len(relations),
+        "metadata": parse_result['metadata'],
+        "processing": {
+            "knowledge_graph": kg_success,
+            "vector_store": vector_success
+        },
+        "status": "success"
+    }
+    if replace:
+        parsed_doc["sync"] = sync_stats
+
+    # 保存到文档存储
+    with trace.stage("document_store", items_in=1, bytes_in=text_bytes) as stage:
+        document_store.save(
+            {**parsed_doc, "file_path": str(file_path), "content_hash": content_hash},
+            {
+                "text": text,
+                "chunks": chunks,
+                "entities": entities,
+                "relations": relations
+            }
+        )
+        stage.items_out = 1
+
+    return parsed_doc
+
+
+def run_streaming_pipeline(
+    job: JobContext,
+    trace: PipelineTrace,
+    document_id: str,
+    file_path: Path,
+    file_name: str,
+    file_ext: str,
+    content_hash: str = None
+) -> dict:
+    """
+    流式处理大文档：解析、分段、实体识别、写入交替进行，不在内存中保留完整文本和分块
+    """
+    job.set_stage("parsing")
+    parser = pdf_parser if file_ext == '.pdf' else word_parser
+    parse_result = parser.parse_stream(str(file_path))
+    if parse_result['status'] == 'error':
+        raise Exception(parse_result.get('error', 'Parse error'))
+
+    ingestor = StreamingIngestor(
+        text_segmenter,
+        ner_engine,
+        relation_extractor,
+        document_store,
+        kg_manager=kg_manager,
+        vector_store=vector_store
+    )
+    result = ingestor.run(
+        trace,
+        document_id,
+        parse_result['blocks'],
+        {**parse_result['metadata'], "file_type": file_ext[1:]}
+    )
+    job.set_stage("vector_store")
+
+    parsed_doc = {
+        "document_id": document_id,
+        "file_name": file_name,
+        "file_type": file_ext[1:],
+        "text_length": result["text_length"],
+        "chunks_count": result["chunks_count"],
+        "entities_count": result["entities_count"],
+        "relations_count": result["relations_count"],
+        "metadata": parse_result['metadata'],
+        "processing": {**result["processing"], "streaming": True},
+        "status": "success"
+    }
+
+    with trace.stage("document_store", items_in=1) as stage:
+        document_store.save(
+            {**parsed_doc, "file_path": str(file_path), "content_hash": content_hash},
+            result["payloads"]
+        )
+        stage.items_out = 1
+
+    return parsed_doc
+
+
+async def save_upload_stream(file: UploadFile, file_path: Path) -> Tuple[int, str]:
+    """
+    分块将上传文件写入磁盘，同时计算内容哈希和字节数（在线程池中执行，不阻塞事件循环）
+
+    请求体的大小已由 UploadSizeLimitMiddleware 在接收时限制；这里再按文件本身的
+    字节数检查，超过 MAX_UPLOAD_SIZE 时中止并删除已写入的部分
+
+    Returns:
+        (文件大小, sha256 十六进制摘要)
+    """
+    return await run_in_threadpool(copy_upload, file.file, file_path)
+
 
-            # 批量创建关系
-            kg_manager.batch_create_relations(relations)
+def copy_upload(source: BinaryIO, file_path: Path) -> Tuple[int, str]:
+    """save_upload_stream 的同步部分：从 Starlette 的临时文件分块复制到 file_path"""
+    hasher = hashlib.sha256()
+    size = 0
 
-            kg_success = True
-            logger.info(f"✓ Saved to Knowledge Graph: {len(entities)} entities, {len(relations)} relations")
+    try:
+        source.seek(0)
+        with open(file_path, "wb") as f:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"文件过大，最大允许 {MAX_UPLOAD_SIZE // (1024 * 1024)} MB"
+                    )
+                hasher.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        file_path.unlink(missing_ok=True)
+        raise
+
+    return size, hasher.hexdigest()
 
-        # 6. 向量化并存储
-        vector_success = False
-        if vector_store and vector_store.available:
-            vector_store.add_chunks(chunks, document_id)
-            vector_success = True
-            logger.info(f"✓ Saved to Vector Store: {len(chunks)} chunks")
 
-        # 构建响应
-        parsed_doc = {
+def submit_ingest_job(
+    document_id: str,
+    file_path: Path,
+    file_name: str,
+    file_ext: str,
+    content_hash: str,
+    replace: bool = False
+) -> dict:
+    """提交文档处理任务"""
+    return job_queue.submit(
+        lambda ctx: process_document(
+            ctx, document_id, file_path, file_name, file_ext,
+            content_hash=content_hash,
+            replace=replace
+        ),
+        stages=INGEST_STAGES,
+        metadata={
             "document_id": document_id,
-            "file_name": file.filename,
-            "file_type": file_ext[1:],
-            "text_length": len(text),
-            "chunks_count": len(chunks),
-            "entities_count": len(entities),
-            "relations_count": len(relations),
-            "metadata": parse_result['metadata'],
-            "processing": {
-                "knowledge_graph": kg_success,
-                "vector_store": vector_success
-            },
-            "status": "success"
+            "file_name": file_name,
+            "content_hash": content_hash,
+            "replace": replace
         }
+    )
+
+
+@app.post("/api/upload")
+async def upload_file(
+    file: UploadFile = File(...),
+    force: bool = Query(False, description="内容重复时仍重新处理")
+):
+    """
+    上传文件并提交后台处理任务（解析、NER、知识图谱、向量化）
+
+    立即返回 job_id，处理进度通过 /api/jobs/{job_id} 查询
+
+    按文件内容哈希去重：内容相同的文件直接返回已有的 document_id（duplicate=true），
+    正在处理中的相同文件返回其 job_id；force=true 时在原 document_id 下重新处理
+
+    支持的文件类型: PDF, DOCX
+    """
+    try:
+        # 检查文件类型
+        file_ext = Path(file.filename).suffix.lower()
+        if file_ext not in ['.pdf', '.docx', '.doc']:
+            raise HTTPException(
+                status_code=400,
+                detail=f"不支持的文件类型: {file_ext}. 仅支持 PDF 和 DOCX"
+            )
+
+        if job_queue.is_full():
+            raise HTTPException(status_code=503, detail="处理队列已满，请稍后重试")
 
-        # 保存到内存存储
-        documents_store[document_id] = {
-            **parsed_doc,
-            "text": text,
-            "chunks": chunks,
-            "entities": entities,
-            "relations": relations,
-            "file_path": str(file_path)
+        # 保存文件（先写入临时文件，得到内容哈希后再决定文档ID）
+        trace = PipelineTrace(ingest_metrics)
+        temp_path = UPLOAD_DIR / f"{uuid.uuid4()}.part"
+        with trace.stage("upload", items_in=1) as stage:
+            file_size, content_hash = await save_upload_stream(file, temp_path)
+            stage.bytes_in = file_size
+            stage.items_out = 1
+
+        upload_info = {
+            "file_name": file.filename,
+            "file_size": file_size,
+            "content_hash": content_hash
         }
 
-        logger.info(f"Document processed successfully: {document_id}")
+        # 内容去重：已处理过或正在处理的相同文件直接返回
+        existing = document_store.find_by_hash(content_hash)
+        if not force:
+            active_job = job_queue.find_active("content_hash", content_hash)
+            if existing or active_job:
+                temp_path.unlink(missing_ok=True)
+                logger.info(f"Duplicate upload: {file.filename} ({content_hash[:12]})")
+
+            if existing:
+                return JSONResponse(content={
+                    "job_id": None,
+                    **upload_info,
+                    "document_id": existing["document_id"],
+                    "status": "completed",
+                    "duplicate": True,
+                    "text_length": existing["text_length"],
+                    "chunks_count": existing["chunks_count"],
+                    "entities_count": existing["entities_count"],
+                    "relations_count": existing["relations_count"],
+                    "timings": trace.to_dict()
+                })
+
+            if active_job:
+                return JSONResponse(status_code=202, content={
+                    "job_id": active_job["job_id"],
+                    **upload_info,
+                    "document_id": active_job["document_id"],
+                    "status": active_job["status"],
+                    "duplicate": True,
+                    "timings": trace.to_dict()
+                })
+
+        # 强制重新处理时同一文档已有任务在排队或运行，两个任务会同时改写图谱、向量和文件
+        if force and existing and job_queue.find_active("document_id", existing["document_id"]):
+            temp_path.unlink(missing_ok=True)
+            raise HTTPException(status_code=409, detail="该文档正在处理中，请稍后重试")
+
+        # 强制重新处理时沿用原文档ID，作为新版本增量同步：未变化的分块沿用原向量，
+        # 只为变化的分块计算 embedding，实体提及和关系同样只写入变化部分并移除过期部分
+        replace = existing is not None
+        document_id = existing["document_id"] if replace else str(uuid.uuid4())
+        file_path = UPLOAD_DIR / f"{document_id}{file_ext}"
+        temp_path.replace(file_path)
+        if replace and existing["file_path"] and Path(existing["file_path"]) != file_path:
+            Path(existing["file_path"]).unlink(missing_ok=True)
+
+        logger.info(f"File uploaded: {file.filename} -> {file_path} ({file_size} bytes)")
 
-        return JSONResponse(content=parsed_doc)
+        job = submit_ingest_job(document_id, file_path, file.filename, file_ext, content_hash, replace)
+
+        return JSONResponse(status_code=202, content={
+            "job_id": job["job_id"],
+            **upload_info,
+            "document_id": document_id,
+            "status": job["status"],
+            "duplicate": False,
+            "timings": trace.to_dict()
+        })
 
     except HTTPException:
         raise
@@ -257,15 +728,129 @@ async def upload_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.put("/api/documents/{document_id}")
+async def update_document(
+    document_id: str,
+    file: UploadFile = File(...),
+    force: bool = Query(False, description="内容未变化时仍重新处理")
+):
+    """
+    上传文档的新版本并增量更新（后台处理）
+
+    新版本的分块按内容哈希与已存储的分块比较，只为变化的分块计算 embedding；
+    实体提及和关系同样只写入变化部分并移除过期部分
+    """
+    doc = document_store.get(document_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    file_ext = Path(file.filename).suffix.lower()
+    if file_ext not in ['.pdf', '.docx', '.doc']:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的文件类型: {file_ext}. 仅支持 PDF 和 DOCX"
+        )
+
+    trace = PipelineTrace(ingest_metrics)
+    temp_path = UPLOAD_DIR / f"{uuid.uuid4()}.part"
+    with trace.stage("upload", items_in=1) as stage:
+        file_size, content_hash = await save_upload_stream(file, temp_path)
+        stage.bytes_in = file_size
+        stage.items_out = 1
+
+    upload_info = {
+        "document_id": document_id,
+        "file_name": file.filename,
+        "file_size": file_size,
+        "content_hash": content_hash
+    }
+
+    # 内容与当前版本相同，无需处理
+    if content_hash == doc.get("content_hash") and not force:
+        temp_path.unlink(missing_ok=True)
+        return JSONResponse(content={
+            "job_id": None,
+            **upload_info,
+            "status": "unchanged",
+            "timings": trace.to_dict()
+        })
+
+    # 上传完成后再检查（与替换文件、提交任务之间没有 await）：上传期间可能有并发的
+    # 更新请求提交了任务，两个任务会同时改写图谱、向量和文件
+    if job_queue.find_active("document_id", document_id):
+        temp_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=409, detail="该文档正在处理中，请稍后重试")
+
+    if job_queue.is_full():
+        temp_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=503, detail="处理队列已满，请稍后重试")
+
+    file_path = UPLOAD_DIR / f"{document_id}{file_ext}"
+    temp_path.replace(file_path)
+    if doc["file_path"] and Path(doc["file_path"]) != file_path:
+        Path(doc["file_path"]).unlink(missing_ok=True)
+
+    logger.info(f"New revision uploaded: {file.filename} -> {file_path} ({file_size} bytes)")
+
+    job = submit_ingest_job(document_id, file_path, file.filename, file_ext, content_hash, replace=True)
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job["job_id"],
+        **upload_info,
+        "status": job["status"],
+        "timings": trace.to_dict()
+    })
+
+
+# ==================== 后台任务API ====================
+
+@app.get("/api/jobs")
+async def list_jobs(
+    status: Optional[str] = Query(None, description="按状态过滤 (queued/running/completed/failed)"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """列出最近的处理任务"""
+    jobs = job_queue.list_jobs(status, limit)
+    return JSONResponse(content={
+        "total": len(jobs),
+        "pending": job_queue.pending_count(),
+        "jobs": jobs
+    })
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """获取处理任务状态（阶段、进度、结果）"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return JSONResponse(content=job)
+
+
+@app.get("/api/metrics")
+async def get_metrics(
+    format: str = Query("json", pattern="^(json|prometheus)$", description="输出格式 (json/prometheus)")
+):
+    """处理流水线各阶段的耗时直方图、吞吐量和错误数"""
+    if format == "prometheus":
+        return PlainTextResponse(ingest_metrics.to_prometheus())
+
+    return JSONResponse(content={
+        "stages": ingest_metrics.snapshot(),
+        "jobs_pending": job_queue.pending_count()
+    })
+
+
 # ==================== 文档管理API ====================
 
 @app.get("/api/documents")
 async def list_documents():
     """列出所有文档"""
     docs = []
-    for doc_id, doc in documents_store.items():
+    for doc in document_store.list_documents():
         docs.append({
-            "document_id": doc_id,
+            "document_id": doc["document_id"],
             "file_name": doc["file_name"],
             "file_type": doc["file_type"],
             "text_length": doc["text_length"],
@@ -282,11 +867,10 @@ async def list_documents():
 @app.get("/api/documents/{document_id}")
 async def get_document(document_id: str):
     """获取文档详情"""
-    if document_id not in documents_store:
+    doc = document_store.get(document_id)
+    if doc is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    doc = documents_store[document_id]
-
     return JSONResponse(content={
         "document_id": document_id,
         "file_name": doc["file_name"],
@@ -302,23 +886,23 @@ async def get_document(document_id: str):
 @app.get("/api/documents/{document_id}/text")
 async def get_document_text(document_id: str):
     """获取文档全文"""
-    if document_id not in documents_store:
+    text = document_store.get_payload(document_id, "text")
+    if text is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
     return JSONResponse(content={
         "document_id": document_id,
-        "text": documents_store[document_id]["text"]
+        "text": text
     })
 
 
 @app.get("/api/documents/{document_id}/entities")
 async def get_entities(document_id: str):
     """获取文档的所有实体"""
-    if document_id not in documents_store:
+    entities = document_store.get_payload(document_id, "entities")
+    if entities is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    entities = documents_store[document_id]["entities"]
-
     return JSONResponse(content={
         "document_id": document_id,
         "entities_count": len(entities),
@@ -329,11 +913,10 @@ async def get_entities(document_id: str):
 @app.get("/api/documents/{document_id}/relations")
 async def get_relations(document_id: str):
     """获取文档的所有关系"""
-    if document_id not in documents_store:
+    relations = document_store.get_payload(document_id, "relations")
+    if relations is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    relations = documents_store[document_id]["relations"]
-
     return JSONResponse(content={
         "document_id": document_id,
         "relations_count": len(relations),
@@ -344,12 +927,17 @@ async def get_relations(document_id: str):
 @app.delete("/api/documents/{document_id}")
 async def delete_document(document_id: str):
     """删除文档（包括文件、向量、知识图谱）"""
-    if document_id not in documents_store:
+    doc = document_store.get(document_id)
+    if doc is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
+    # 向量存储仍在预热时不能删除分块，先删除文件和文档记录会留下预热后仍可被检索到的分块
+    if vector_store is None and not warmup.is_done(["vector_store"]):
+        raise service_unavailable("vector_store", "Vector Store not available")
+
     # 删除文件
-    file_path = documents_store[document_id]["file_path"]
-    if os.path.exists(file_path):
+    file_path = doc["file_path"]
+    if file_path and os.path.exists(file_path):
         os.remove(file_path)
 
     # 删除向量
@@ -358,8 +946,8 @@ async def delete_document(document_id: str):
 
     # TODO: 删除知识图谱中的文档节点
 
-    # 从内存中删除
-    del documents_store[document_id]
+    # 从文档存储中删除
+    document_store.delete(document_id)
 
     logger.info(f"Document deleted: {document_id}")
 
@@ -371,20 +959,20 @@ async def delete_document(document_id: str):
 @app.get("/api/kg/stats")
 async def get_kg_stats():
     """获取知识图谱统计信息"""
-    if not kg_manager or not kg_manager.connected:
-        raise HTTPException(status_code=503, detail="Knowledge Graph not available")
+    if not async_kg_manager or not async_kg_manager.connected:
+        raise service_unavailable("knowledge_graph", "Knowledge Graph not available")
 
-    stats = kg_manager.get_stats()
+    stats = await async_kg_manager.get_stats()
     return JSONResponse(content=stats)
 
 
 @app.get("/api/kg/graph/{document_id}")
 async def get_document_graph(document_id: str):
     """获取文档的知识图谱"""
-    if not kg_manager or not kg_manager.connected:
-        raise HTTPException(status_code=503, detail="Knowledge Graph not available")
+    if not async_kg_manager or not async_kg_manager.connected:
+        raise service_unavailable("knowledge_graph", "Knowledge Graph not available")
 
-    graph_data = kg_manager.get_document_graph(document_id)
+    graph_data = await async_kg_manager.get_document_graph(document_id)
     return JSONResponse(content=graph_data)
 
 
@@ -395,10 +983,10 @@ async def get_entity_subgraph(
     limit: int = Query(50, ge=1, le=200)
 ):
     """获取实体的邻居子图"""
-    if not kg_manager or not kg_manager.connected:
-        raise HTTPException(status_code=503, detail="Knowledge Graph not available")
+    if not async_kg_manager or not async_kg_manager.connected:
+        raise service_unavailable("knowledge_graph", "Knowledge Graph not available")
 
-    subgraph = kg_manager.get_entity_neighbors(entity_text, max_depth, limit)
+    subgraph = await async_kg_manager.get_entity_neighbors(entity_text, max_depth, limit)
     return JSONResponse(content=subgraph)
 
 
@@ -408,24 +996,26 @@ async def search_entities(
     limit: int = Query(20, ge=1, le=100)
 ):
     """按标签搜索实体"""
-    if not kg_manager or not kg_manager.connected:
-        raise HTTPException(status_code=503, detail="Knowledge Graph not available")
+    if not async_kg_manager or not async_kg_manager.connected:
+        raise service_unavailable("knowledge_graph", "Knowledge Graph not available")
 
-    entities = kg_manager.search_entities_by_label(label, limit)
+    entities = await async_kg_manager.search_entities_by_label(label, limit)
     return JSONResponse(content={"entities": entities})
 
 
 # ==================== 向量检索API ====================
+# 检索和问答接口定义为同步函数，由 FastAPI 在线程池中并发执行，
+# 并发请求的查询向量在 VectorStoreManager 中合并为批次计算
 
 @app.get("/api/search")
-async def semantic_search(
+def semantic_search(
     query: str = Query(..., min_length=1),
     top_k: int = Query(5, ge=1, le=20),
     document_id: Optional[str] = None
 ):
     """语义搜索"""
     if not vector_store or not vector_store.available:
-        raise HTTPException(status_code=503, detail="Vector Store not available")
+        raise service_unavailable("vector_store", "Vector Store not available")
 
     if document_id:
         results = vector_store.search_by_document(query, document_id, top_k)
@@ -440,16 +1030,24 @@ async def semantic_search(
 
 
 @app.get("/api/search/hybrid")
-async def hybrid_search(
+def hybrid_search(
     query: str = Query(..., min_length=1),
     top_k: int = Query(10, ge=1, le=20),
-    semantic_weight: float = Query(0.7, ge=0.0, le=1.0)
+    semantic_weight: float = Query(0.7, ge=0.0, le=1.0),
+    document_id: Optional[str] = None,
+    fusion: str = Query("rrf", pattern="^(rrf|weighted)$")
 ):
-    """混合搜索（语义+关键词）"""
+    """混合搜索（语义+BM25关键词，rrf 为倒数排名融合，weighted 为加权分数）"""
     if not vector_store or not vector_store.available:
-        raise HTTPException(status_code=503, detail="Vector Store not available")
+        raise service_unavailable("vector_store", "Vector Store not available")
 
-    results = vector_store.hybrid_search(query, top_k, semantic_weight)
+    results = vector_store.hybrid_search(
+        query,
+        top_k,
+        semantic_weight,
+        document_id=document_id,
+        fusion=fusion
+    )
 
     return JSONResponse(content={
         "query": query,
@@ -461,7 +1059,7 @@ async def hybrid_search(
 # ==================== RAG问答API ====================
 
 @app.post("/api/qa/ask")
-async def ask_question(
+def ask_question(
     question: str = Query(..., min_length=1),
     document_id: Optional[str] = None,
     top_k: int = Query(5, ge=1, le=10),
@@ -470,7 +1068,7 @@ async def ask_question(
 ):
     """RAG问答"""
     if not rag_engine:
-        raise HTTPException(status_code=503, detail="RAG Engine not available")
+        raise service_unavailable("rag_engine", "RAG Engine not available")
 
     result = rag_engine.ask(
         question=question,
@@ -484,19 +1082,74 @@ async def ask_question(
 
 
 @app.post("/api/qa/summarize/{document_id}")
-async def summarize_document(
+def summarize_document(
     document_id: str,
     max_length: int = Query(500, ge=100, le=2000)
 ):
     """生成文档摘要"""
     if not rag_engine:
-        raise HTTPException(status_code=503, detail="RAG Engine not available")
+        raise service_unavailable("rag_engine", "RAG Engine not available")
 
     result = rag_engine.summarize_document(document_id, max_length)
 
     return JSONResponse(content=result)
 
 
+def sse_response(events: Iterator[Dict[str, Any]]) -> StreamingResponse:
+    """
+    将 {"event", "data"} 事件流包装为 Server-Sent Events 响应
+
+    生成器是同步的，由 Starlette 在线程池中迭代，不会阻塞事件循环
+    """
+    def encode():
+        for item in events:
+            data = json.dumps(item["data"], ensure_ascii=False)
+            yield f"event: {item['event']}\ndata: {data}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        encode(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁止反向代理缓冲
+        }
+    )
+
+
+@app.post("/api/qa/ask/stream")
+async def ask_question_stream(
+    question: str = Query(..., min_length=1),
+    document_id: Optional[str] = None,
+    top_k: int = Query(5, ge=1, le=10),
+    use_hybrid: bool = Query(True),
+    include_graph: bool = Query(False)
+):
+    """RAG问答（SSE流式：sources → token... → usage → done）"""
+    if not rag_engine:
+        raise service_unavailable("rag_engine", "RAG Engine not available")
+
+    return sse_response(rag_engine.ask_stream(
+        question=question,
+        document_id=document_id,
+        top_k=top_k,
+        use_hybrid=use_hybrid,
+        include_graph=include_graph
+    ))
+
+
+@app.post("/api/qa/summarize/{document_id}/stream")
+async def summarize_document_stream(
+    document_id: str,
+    max_length: int = Query(500, ge=100, le=2000)
+):
+    """生成文档摘要（SSE流式：meta → token... → usage → done）"""
+    if not rag_engine:
+        raise service_unavailable("rag_engine", "RAG Engine not available")
+
+    return sse_response(rag_engine.summarize_document_stream(document_id, max_length))
+
+
 # ==================== LLM模型管理API ====================
 
 @app.get("/api/llm/providers")
@@ -541,7 +1194,7 @@ async def test_llm_provider(
 ):
     """测试LLM提供商的API Key"""
     if not rag_engine:
-        raise HTTPException(status_code=503, detail="RAG Engine not available")
+        raise service_unavailable("rag_engine", "RAG Engine not available")
 
     result = rag_engine.llm_manager.test_provider(provider, api_key, model)
 
@@ -560,7 +1213,7 @@ async def config_llm_provider(
 ):
     """配置LLM提供商（动态添加/更新）"""
     if not rag_engine:
-        raise HTTPException(status_code=503, detail="RAG Engine not available")
+        raise service_unavailable("rag_engine", "RAG Engine not available")
 
     # 添加或更新提供商
     success = rag_engine.llm_manager.add_or_update_provider(provider, api_key, model)
@@ -589,7 +1242,7 @@ async def switch_llm_provider(
 ):
     """切换LLM提供商和模型"""
     if not rag_engine or not rag_engine.available:
-        raise HTTPException(status_code=503, detail="RAG Engine not available")
+        raise service_unavailable("rag_engine", "RAG Engine not available")
 
     success = rag_engine.llm_manager.set_provider(provider, model)
 
@@ -623,15 +1276,25 @@ async def get_current_llm():
 
 @app.on_event("startup")
 async def startup_event():
-    """应用启动事件"""
+    """应用启动事件（模型加载和数据库连接在后台预热，不阻塞端口绑定）"""
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+    warmup.start(on_complete=log_initialized)
     logger.info("🚀 MCP Platform API Server started")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭事件"""
+    job_queue.shutdown()
+    pdf_parser.close()
+    if vector_store:
+        vector_store.close()
+    if async_kg_manager:
+        await async_kg_manager.close()
     if kg_manager:
         kg_manager.close()
+    document_store.close()
     logger.info("👋 MCP Platform API Server stopped")
 
 
@@ -0,0 +1,121 @@
+"""
+Aho-Corasick Automaton
+多模式字符串匹配自动机 - 单次扫描文本即可找到所有词典词条
+"""
+from collections import deque
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配自动机
+
+    匹配耗时为 O(文本长度 + 命中数)，与词典大小无关；
+    构建耗时与词条总长度成线性关系，只需执行一次。
+    """
+
+    # 转移表键 = 节点编号 * _STRIDE + 字符码点（避免为每个节点创建dict）
+    _STRIDE = 0x110000
+
+    def __init__(self):
+        self._goto: Dict[int, int] = {}
+        self._fail: List[int] = [0]
+        self._dict_link: List[int] = [0]
+        self._output: Dict[int, List[int]] = {}
+        self._patterns: List[Tuple[str, Any]] = []
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def add(self, word: str, payload: Any = None):
+        """
+        添加词条
+
+        Args:
+            word: 词条文本（区分大小写）
+            payload: 命中时随结果返回的附加数据
+        """
+        if not word:
+            return
+
+        node = 0
+        stride = self._STRIDE
+        for ch in word:
+            key = node * stride + ord(ch)
+            child = self._goto.get(key)
+            if child is None:
+                child = len(self._fail)
+                self._goto[key] = child
+                self._fail.append(0)
+                self._dict_link.append(0)
+            node = child
+
+        self._output.setdefault(node, []).append(len(self._patterns))
+        self._patterns.append((word, payload))
+        self._built = False
+
+    def build(self):
+        """计算失败链接和输出链接（BFS）"""
+        stride = self._STRIDE
+        goto = self._goto
+        fail = self._fail
+        dict_link = self._dict_link
+        output = self._output
+
+        # 按父节点分组子节点，便于BFS
+        children: Dict[int, List[Tuple[int, int]]] = {}
+        for key, child in goto.items():
+            parent, code = divmod(key, stride)
+            children.setdefault(parent, []).append((code, child))
+
+        queue = deque()
+        for _, child in children.get(0, []):
+            fail[child] = 0
+            dict_link[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for code, child in children.get(node, []):
+                f = fail[node]
+                while f and (f * stride + code) not in goto:
+                    f = fail[f]
+                fail[child] = goto.get(f * stride + code, 0)
+                dict_link[child] = fail[child] if fail[child] in output else dict_link[fail[child]]
+                queue.append(child)
+
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str, Any]]:
+        """
+        扫描文本，返回所有（可重叠的）命中
+
+        Yields:
+            (start, end, word, payload)，按结束位置递增
+        """
+        if not self._built:
+            self.build()
+
+        stride = self._STRIDE
+        goto = self._goto
+        fail = self._fail
+        dict_link = self._dict_link
+        output = self._output
+        patterns = self._patterns
+
+        node = 0
+        for i, ch in enumerate(text):
+            code = ord(ch)
+            nxt = goto.get(node * stride + code)
+            while nxt is None and node:
+                node = fail[node]
+                nxt = goto.get(node * stride + code)
+            node = nxt or 0
+
+            hit = node if node in output else dict_link[node]
+            while hit:
+                for pattern_id in output[hit]:
+                    word, payload = patterns[pattern_id]
+                    yield i + 1 - len(word), i + 1, word, payload
+                hit = dict_link[hit]
@@ -2,10 +2,14 @@
 Named Entity Recognition (NER) Module
 实体识别和关系抽取
 """
+import os
 import re
-from typing import List, Dict, Set
+from bisect import bisect_left
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 from loguru import logger
 
+from app.nlp.aho_corasick import AhoCorasick
+
 # 注意：完整版需要 import spacy，这里先提供简化版本
 
 
@@ -13,9 +17,23 @@ class SimpleNER:
     """
     简化版NER（基于规则）
     完整版本需要安装spaCy模型后使用
+
+    词典类匹配（技术术语、组织机构后缀、姓氏）由一个 Aho-Corasick 自动机
+    在单次扫描中完成，耗时与词典大小无关，可通过 load_dictionary 加载大规模词典
     """
 
-    def __init__(self):
+    # 中文字符范围（与原正则 [\u4e00-\u9fa5] 一致）
+    CJK_START = "\u4e00"
+    CJK_END = "\u9fa5"
+
+    # 人名后允许出现的分隔符（另外允许空白字符和文本结尾）
+    PERSON_DELIMITERS = set("，。、；：！？")
+
+    def __init__(self, dictionary_path: str = None):
+        """
+        Args:
+            dictionary_path: 额外词典文件路径（默认从环境变量 NER_DICTIONARY_PATH 读取）
+        """
         # 技术术语词典（扩展版）
         self.tech_keywords = {
             # AI/ML
@@ -51,8 +69,94 @@ class SimpleNER:
             "徐", "孙", "胡", "朱", "高", "林", "何", "郭", "马", "罗"
         }
 
+        # 外部词典加载的词条 {词条: 标签}
+        self.custom_terms: Dict[str, str] = {}
+
+        # 日期模式
+        self.date_patterns = [
+            re.compile(r'\d{4}年\d{1,2}月\d{1,2}日'),
+            re.compile(r'\d{4}年\d{1,2}月'),
+            re.compile(r'\d{4}年'),
+            re.compile(r'\d{4}-\d{1,2}-\d{1,2}'),
+            re.compile(r'\d{4}/\d{1,2}/\d{1,2}')
+        ]
+
+        # 数值和度量模式
+        self.number_patterns = [
+            re.compile(r'\d+\.\d+%'),  # 百分比
+            re.compile(r'\d+%'),
+            re.compile(r'\d+\.\d+[公千米吨斤克]'),  # 度量单位
+            re.compile(r'\d+[万亿千百十][元人次个]'),  # 数量
+        ]
+
+        self._automaton: Optional[AhoCorasick] = None
+
+        dictionary_path = dictionary_path or os.getenv("NER_DICTIONARY_PATH")
+        if dictionary_path:
+            self.load_dictionary(dictionary_path)
+
         logger.info("Enhanced SimpleNER initialized with expanded keywords")
 
+    def load_dictionary(self, file_path: str, default_label: str = "TECH") -> int:
+        """
+        从文件加载词典
+
+        文件格式：每行一个词条，可选用制表符分隔标签，如 "知识图谱\tTECH"；
+        空行和以 # 开头的行会被忽略
+
+        Args:
+            file_path: 词典文件路径
+            default_label: 未指定标签时使用的标签
+
+        Returns:
+            加载的词条数量
+        """
+        count = 0
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.rstrip("\r\n")
+                    if not line.strip() or line.startswith("#"):
+                        continue
+
+                    term, _, label = line.partition("\t")
+                    term = term.strip()
+                    label = label.strip() or default_label
+                    if not term:
+                        continue
+
+                    if label == "TECH":
+                        self.tech_keywords.add(term)
+                        self.custom_terms.pop(term, None)
+                    else:
+                        self.tech_keywords.discard(term)
+                        self.custom_terms[term] = label
+                    count += 1
+        except Exception as e:
+            logger.error(f"Failed to load NER dictionary {file_path}: {str(e)}")
+            return 0
+
+        # 词典变化后重新构建自动机
+        self._automaton = None
+        logger.info(f"Loaded {count} dictionary terms from {file_path}")
+        return count
+
+    def _get_automaton(self) -> AhoCorasick:
+        """构建（或复用）词典自动机"""
+        if self._automaton is None:
+            automaton = AhoCorasick()
+            for keyword in self.tech_keywords:
+                automaton.add(keyword, ("term", "TECH"))
+            for term, label in self.custom_terms.items():
+                automaton.add(term, ("term", label))
+            for keyword in self.org_keywords:
+                automaton.add(keyword, ("org", keyword))
+            for surname in self.person_surnames:
+                automaton.add(surname, ("surname", surname))
+            automaton.build()
+            self._automaton = automaton
+        return self._automaton
+
     def extract_entities(self, text: str) -> List[Dict]:
         """
         提取实体
@@ -72,39 +176,44 @@ class SimpleNER:
         """
         entities = []
 
-        # 1. 提取技术术语
-        for keyword in self.tech_keywords:
-            for match in re.finditer(re.escape(keyword), text):
+        # 单次扫描收集所有词典命中
+        term_last_end: Dict[str, int] = {}
+        org_hits: Dict[str, List[int]] = {}
+        surname_hits: Dict[str, List[int]] = {}
+
+        for start, end, word, (kind, value) in self._get_automaton().iter_matches(text):
+            if kind == "term":
+                # 同一词条的命中互不重叠（与 re.finditer 一致）
+                if start < term_last_end.get(word, 0):
+                    continue
+                term_last_end[word] = end
+                # 1. 技术术语 / 外部词典词条
                 entities.append({
-                    "text": keyword,
-                    "label": "TECH",
-                    "start": match.start(),
-                    "end": match.end(),
+                    "text": word,
+                    "label": value,
+                    "start": start,
+                    "end": end,
                     "confidence": 0.9
                 })
-
-        # 2. 提取组织机构（简单模式匹配）
-        for keyword in self.org_keywords:
-            pattern = f"[\\u4e00-\\u9fa5]{{2,10}}{keyword}"
-            for match in re.finditer(pattern, text):
+            elif kind == "org":
+                org_hits.setdefault(value, []).append(start)
+            else:
+                surname_hits.setdefault(value, []).append(start)
+
+        # 2. 提取组织机构（2-10个汉字 + 机构关键词）
+        for keyword, positions in org_hits.items():
+            for start, end in self._match_org(text, keyword, positions):
                 entities.append({
-                    "text": match.group(),
+                    "text": text[start:end],
                     "label": "ORG",
-                    "start": match.start(),
-                    "end": match.end(),
+                    "start": start,
+                    "end": end,
                     "confidence": 0.7
                 })
 
         # 3. 提取日期
-        date_patterns = [
-            r'\d{4}年\d{1,2}月\d{1,2}日',
-            r'\d{4}年\d{1,2}月',
-            r'\d{4}年',
-            r'\d{4}-\d{1,2}-\d{1,2}',
-            r'\d{4}/\d{1,2}/\d{1,2}'
-        ]
-        for pattern in date_patterns:
-            for match in re.finditer(pattern, text):
+        for pattern in self.date_patterns:
+            for match in pattern.finditer(text):
                 entities.append({
                     "text": match.group(),
                     "label": "DATE",
@@ -113,30 +222,24 @@ class SimpleNER:
                     "confidence": 0.95
                 })
 
-        # 4. 提取人名（基于姓氏+2-3个字符）
-        for surname in self.person_surnames:
-            pattern = f"{surname}[\\u4e00-\\u9fa5]{{1,3}}(?=[，。、；：！？\\s]|$)"
-            for match in re.finditer(pattern, text):
-                name = match.group()
+        # 4. 提取人名（基于姓氏+1-3个汉字，后接标点/空白/结尾）
+        for surname, positions in surname_hits.items():
+            for start, end in self._match_person(text, positions):
+                name = text[start:end]
                 # 排除一些常见的非人名组合
-                if name not in self.tech_keywords and name not in self.org_keywords:
+                if (name not in self.tech_keywords and name not in self.org_keywords
+                        and name not in self.custom_terms):
                     entities.append({
                         "text": name,
                         "label": "PERSON",
-                        "start": match.start(),
-                        "end": match.end(),
+                        "start": start,
+                        "end": end,
                         "confidence": 0.7
                     })
 
         # 5. 提取数值和度量
-        number_patterns = [
-            r'\d+\.\d+%',  # 百分比
-            r'\d+%',
-            r'\d+\.\d+[公千米吨斤克]',  # 度量单位
-            r'\d+[万亿千百十][元人次个]',  # 数量
-        ]
-        for pattern in number_patterns:
-            for match in re.finditer(pattern, text):
+        for pattern in self.number_patterns:
+            for match in pattern.finditer(text):
                 entities.append({
                     "text": match.group(),
                     "label": "NUMBER",
@@ -151,13 +254,95 @@ class SimpleNER:
         logger.info(f"Extracted {len(entities)} entities with enhanced rules")
         return entities
 
+    def _is_cjk(self, ch: str) -> bool:
+        return self.CJK_START <= ch <= self.CJK_END
+
+    def _cjk_run_before(self, text: str, pos: int, limit: int) -> int:
+        """pos 之前连续汉字的个数（最多 limit 个）"""
+        count = 0
+        while count < limit and pos - count - 1 >= 0 and self._is_cjk(text[pos - count - 1]):
+            count += 1
+        return count
+
+    def _match_org(self, text: str, keyword: str, positions: List[int]) -> List[tuple]:
+        """
+        根据关键词命中位置，复现 re.finditer("[\\u4e00-\\u9fa5]{2,10}" + keyword) 的结果
+
+        对每个候选起点取最靠左的匹配，并在同一起点贪婪地取最长前缀
+        """
+        positions = sorted(positions)
+        # 每个命中位置允许的最小起点（前缀最多10个连续汉字）
+        lowest = [p - self._cjk_run_before(text, p, 10) for p in positions]
+
+        matches = []
+        pos = 0
+        i = 0
+        while True:
+            # 前缀至少2个汉字
+            while i < len(positions) and positions[i] - 2 < pos:
+                i += 1
+            if i >= len(positions):
+                break
+
+            # 最靠左的可行起点
+            start = None
+            j = i
+            while j < len(positions) and (start is None or positions[j] - 10 < start):
+                candidate = max(pos, lowest[j])
+                if candidate <= positions[j] - 2 and (start is None or candidate < start):
+                    start = candidate
+                j += 1
+            if start is None:
+                break
+
+            # 贪婪：同一起点取最远的关键词位置
+            best = None
+            j = i
+            while j < len(positions) and positions[j] <= start + 10:
+                if lowest[j] <= start <= positions[j] - 2:
+                    best = positions[j]
+                j += 1
+
+            end = best + len(keyword)
+            matches.append((start, end))
+            pos = end
+
+        return matches
+
+    def _match_person(self, text: str, positions: List[int]) -> List[tuple]:
+        """
+        根据姓氏命中位置，复现 re.finditer(surname + "[\\u4e00-\\u9fa5]{1,3}(?=[，。、；：！？\\s]|$)") 的结果
+        """
+        matches = []
+        pos = 0
+        length = len(text)
+
+        for start in sorted(positions):
+            if start < pos:
+                continue
+
+            # 姓氏后连续汉字数（最多3个）
+            run = 0
+            while run < 3 and start + 1 + run < length and self._is_cjk(text[start + 1 + run]):
+                run += 1
+
+            # 贪婪：从最长的名字开始尝试
+            for size in range(run, 0, -1):
+                end = start + 1 + size
+                if end == length or text[end] in self.PERSON_DELIMITERS or text[end].isspace():
+                    matches.append((start, end))
+                    pos = end
+                    break
+
+        return matches
+
     def _deduplicate_entities(self, entities: List[Dict]) -> List[Dict]:
-        """去除重叠的实体，保留置信度高的"""
+        """去除重叠的实体，保留置信度高的（同一起点、同置信度时保留最长的）"""
         if not entities:
             return []
 
         # 按起始位置排序
-        entities.sort(key=lambda x: (x['start'], -x['confidence']))
+        entities.sort(key=lambda x: (x['start'], -x['confidence'], x['start'] - x['end']))
 
         result = []
         last_end = -1
@@ -171,167 +356,295 @@ class SimpleNER:
         return result
 
 
+# 已加载的 spaCy 管道（按模型名和排除的组件缓存）。多进程部署时由主进程在 fork 前加载，
+# worker 进程中创建 SpacyNER 直接复用，以写时复制方式共享模型内存
+_SPACY_PIPELINES: Dict[Tuple[str, Tuple[str, ...]], Any] = {}
+
+
+def load_spacy_pipeline(model_name: str, exclude: List[str]):
+    """
+    加载（或复用已加载的）spaCy 管道
+
+    Args:
+        model_name: spaCy 模型名称
+        exclude: 不加载的组件
+
+    Returns:
+        spacy.Language
+    """
+    key = (model_name, tuple(exclude))
+    if key not in _SPACY_PIPELINES:
+        import spacy
+        _SPACY_PIPELINES[key] = spacy.load(model_name, exclude=list(exclude))
+    return _SPACY_PIPELINES[key]
+
+
 class SpacyNER:
     """
     基于spaCy的NER（需要安装模型）
     使用方法：python -m spacy download zh_core_web_sm
+
+    只加载实体识别需要的组件；长文本在句子边界处切分为若干片段，
+    通过 nlp.pipe 批量处理，实体偏移换算回原文中的位置
     """
 
-    def __init__(self, model_name: str = "zh_core_web_sm"):
+    # 实体识别用不到的组件（ner 依赖的 tok2vec 保留）
+    DEFAULT_EXCLUDE = "parser,tagger,lemmatizer,attribute_ruler,morphologizer,senter"
+
+    # 片段切分点：句末标点或换行之后
+    BOUNDARY_PATTERN = re.compile(r'[。！？\.\!\?\n]+')
+
+    def __init__(
+        self,
+        model_name: str = "zh_core_web_sm",
+        batch_size: int = None,
+        n_process: int = None,
+        segment_chars: int = None
+    ):
+        """
+        Args:
+            model_name: spaCy 模型名称
+            batch_size: nlp.pipe 每批片段数 (默认从环境变量 SPACY_BATCH_SIZE 读取)
+            n_process: nlp.pipe 进程数 (默认从环境变量 SPACY_N_PROCESS 读取)
+            segment_chars: 单个片段的最大字符数 (默认从环境变量 SPACY_SEGMENT_CHARS 读取)
+        """
+        self.batch_size = batch_size or int(os.getenv("SPACY_BATCH_SIZE", "32"))
+        self.n_process = n_process or int(os.getenv("SPACY_N_PROCESS", "1"))
+        self.segment_chars = segment_chars or int(os.getenv("SPACY_SEGMENT_CHARS", "5000"))
+        exclude = [
+            name.strip() for name in os.getenv("SPACY_EXCLUDE", self.DEFAULT_EXCLUDE).split(",")
+            if name.strip()
+        ]
+
         try:
-            import spacy
-            self.nlp = spacy.load(model_name)
+            self.nlp = load_spacy_pipeline(model_name, exclude)
             self.available = True
-            logger.info(f"SpacyNER initialized with model: {model_name}")
+            logger.info(
+                f"SpacyNER initialized with model: {model_name}, pipes={self.nlp.pipe_names}, "
+                f"batch_size={self.batch_size}, n_process={self.n_process}"
+            )
         except Exception as e:
             logger.warning(f"SpaCy model not available: {e}")
             self.available = False
             self.nlp = None
 
+        self._fallback: Optional[SimpleNER] = None
+
     def extract_entities(self, text: str) -> List[Dict]:
         """使用spaCy提取实体"""
         if not self.available:
             logger.warning("SpaCy not available, using SimpleNER instead")
-            simple_ner = SimpleNER()
-            return simple_ner.extract_entities(text)
+            if self._fallback is None:
+                self._fallback = SimpleNER()
+            return self._fallback.extract_entities(text)
 
-        doc = self.nlp(text)
-        entities = []
+        spans = list(self._split_segments(text))
+        docs = self.nlp.pipe(
+            (text[start:end] for start, end in spans),
+            batch_size=self.batch_size,
+            n_process=self.n_process
+        )
 
-        for ent in doc.ents:
-            entities.append({
-                "text": ent.text,
-                "label": ent.label_,
-                "start": ent.start_char,
-                "end": ent.end_char,
-                "confidence": 1.0
-            })
+        entities = []
+        for (offset, _), doc in zip(spans, docs):
+            for ent in doc.ents:
+                entities.append({
+                    "text": ent.text,
+                    "label": ent.label_,
+                    "start": offset + ent.start_char,
+                    "end": offset + ent.end_char,
+                    "confidence": 1.0
+                })
 
-        logger.info(f"SpaCy extracted {len(entities)} entities")
+        logger.info(f"SpaCy extracted {len(entities)} entities from {len(spans)} segments")
         return entities
 
+    def _split_segments(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        将文本切分为不超过 segment_chars 的片段 [(start, end)]
+
+        优先在片段内最后一个句子边界处切分，找不到边界时按长度硬切
+        """
+        start = 0
+        length = len(text)
+        while start < length:
+            end = min(start + self.segment_chars, length)
+            if end < length:
+                boundary = None
+                for match in self.BOUNDARY_PATTERN.finditer(text, start, end):
+                    boundary = match.end()
+                if boundary and boundary > start:
+                    end = boundary
+            if text[start:end].strip():
+                yield start, end
+            start = end
+
 
 class RelationExtractor:
-    """关系抽取器（增强版）"""
+    """
+    关系抽取器（增强版）
+
+    基于 NER 返回的实体位置工作：触发词通过一次自动机扫描找出，
+    只在同一句子窗口内组合实体对，耗时随文档长度近似线性增长
+    """
+
+    # 句子分隔符
+    SENTENCE_SEPARATORS = re.compile(r'[。！？\.\!\?]+')
+    # 句内片段分隔符（共现关系使用）
+    SEGMENT_SEPARATORS = re.compile(r'[，、；]')
 
-    def __init__(self):
-        # 关系模式定义（谓词 -> 正则模式列表）
-        self.relation_patterns = {
+    def __init__(self, max_window: int = 500):
+        """
+        Args:
+            max_window: 句子窗口最大长度（字符数），超长句子会被切分
+        """
+        self.max_window = max_window
+
+        # 关系触发词定义（谓词 -> [(触发词, 宾语之后必须出现的后缀)]）
+        # 例如 ("是", ("的一部分", "的组成")) 对应 "{e1}...是...{e2}...的一部分"
+        self.relation_triggers = {
             "属于": [
-                r"{e1}.*?属于.*?{e2}",
-                r"{e1}.*?是.*?{e2}.*?(的一部分|的组成)",
+                ("属于", None),
+                ("是", ("的一部分", "的组成")),
             ],
             "包含": [
-                r"{e1}.*?包含.*?{e2}",
-                r"{e1}.*?包括.*?{e2}",
-                r"{e1}.*?含有.*?{e2}",
+                ("包含", None),
+                ("包括", None),
+                ("含有", None),
             ],
             "用于": [
-                r"{e1}.*?用于.*?{e2}",
-                r"{e1}.*?应用于.*?{e2}",
-                r"{e1}.*?服务于.*?{e2}",
+                ("用于", None),
+                ("应用于", None),
+                ("服务于", None),
             ],
             "实现": [
-                r"{e1}.*?实现.*?{e2}",
-                r"{e1}.*?完成.*?{e2}",
-                r"{e1}.*?达成.*?{e2}",
+                ("实现", None),
+                ("完成", None),
+                ("达成", None),
             ],
             "支持": [
-                r"{e1}.*?支持.*?{e2}",
-                r"{e1}.*?兼容.*?{e2}",
-                r"{e1}.*?适配.*?{e2}",
+                ("支持", None),
+                ("兼容", None),
+                ("适配", None),
             ],
             "依赖": [
-                r"{e1}.*?依赖.*?{e2}",
-                r"{e1}.*?需要.*?{e2}",
-                r"{e1}.*?基于.*?{e2}",
+                ("依赖", None),
+                ("需要", None),
+                ("基于", None),
             ],
             "产生": [
-                r"{e1}.*?产生.*?{e2}",
-                r"{e1}.*?生成.*?{e2}",
-                r"{e1}.*?输出.*?{e2}",
+                ("产生", None),
+                ("生成", None),
+                ("输出", None),
             ],
             "处理": [
-                r"{e1}.*?处理.*?{e2}",
-                r"{e1}.*?分析.*?{e2}",
-                r"{e1}.*?检测.*?{e2}",
+                ("处理", None),
+                ("分析", None),
+                ("检测", None),
             ],
         }
-        logger.info("Enhanced RelationExtractor initialized with pattern matching")
+
+        # 所有触发词和后缀放入同一个自动机，一次扫描全部找出
+        self._automaton = AhoCorasick()
+        words = set()
+        for rules in self.relation_triggers.values():
+            for trigger, suffixes in rules:
+                words.add(trigger)
+                words.update(suffixes or ())
+        for word in words:
+            self._automaton.add(word, word)
+        self._automaton.build()
+
+        logger.info("Enhanced RelationExtractor initialized with trigger automaton")
 
     def extract_relations(self, text: str, entities: List[Dict]) -> List[Dict]:
         """
         提取实体间关系（增强版）
 
         策略：
-        1. 模式匹配：识别有意义的关系模式
-        2. 智能共现：仅为相邻或紧密相关的实体创建关系
+        1. 模式匹配：同一句子内 "主体 ... 触发词 ... 客体" 的组合
+        2. 智能共现：仅为同一片段内相邻且距离较近的实体创建关系
         """
-        relations = []
-        seen_relations = set()  # 去重
+        mentions = sorted(
+            (ent for ent in entities if ent.get('start') is not None and ent.get('end') is not None),
+            key=lambda x: (x['start'], x['end'])
+        )
+        mention_starts = [ent['start'] for ent in mentions]
+
+        # 触发词位置 {词: [(start, end)]}
+        hits: Dict[str, List[tuple]] = {}
+        for start, end, word, _ in self._automaton.iter_matches(text):
+            hits.setdefault(word, []).append((start, end))
+        for positions in hits.values():
+            positions.sort()
 
         # 1. 基于模式的关系抽取
-        for predicate, patterns in self.relation_patterns.items():
-            for ent1 in entities:
-                for ent2 in entities:
-                    if ent1['text'] == ent2['text']:
-                        continue
+        windows = []
+        for win_start, win_end in self._sentence_windows(text):
+            lo = bisect_left(mention_starts, win_start)
+            hi = bisect_left(mention_starts, win_end)
+            window_mentions = [ent for ent in mentions[lo:hi] if ent['end'] <= win_end]
+            if len(window_mentions) >= 2:
+                windows.append((win_start, win_end, window_mentions))
+
+        # 按 谓词 -> 触发规则 -> 句子 的顺序匹配，先命中的规则提供证据文本
+        found: Dict[tuple, str] = {}
+        for predicate, rules in self.relation_triggers.items():
+            for trigger, suffixes in rules:
+                for win_start, win_end, window_mentions in windows:
+                    self._match_rule(
+                        text, window_mentions, predicate, trigger, suffixes,
+                        hits, win_start, win_end, found
+                    )
+
+        # 与逐对正则匹配时的输出顺序保持一致：谓词 -> 主体首次出现 -> 客体首次出现
+        first_index: Dict[str, int] = {}
+        for idx, ent in enumerate(entities):
+            first_index.setdefault(ent['text'], idx)
+        predicate_order = {predicate: i for i, predicate in enumerate(self.relation_triggers)}
 
-                    for pattern_template in patterns:
-                        # 替换模板中的实体占位符
-                        pattern = pattern_template.format(
-                            e1=re.escape(ent1['text']),
-                            e2=re.escape(ent2['text'])
-                        )
-
-                        match = re.search(pattern, text)
-                        if match:
-                            relation_key = (ent1['text'], predicate, ent2['text'])
-                            if relation_key not in seen_relations:
-                                relations.append({
-                                    "subject": ent1['text'],
-                                    "predicate": predicate,
-                                    "object": ent2['text'],
-                                    "confidence": 0.85,
-                                    "evidence": match.group()[:100]
-                                })
-                                seen_relations.add(relation_key)
+        relations = []
+        seen_relations = set()  # 去重
+        for key in sorted(found, key=lambda k: (predicate_order[k[1]], first_index[k[0]], first_index[k[2]])):
+            subject, predicate, obj = key
+            relations.append({
+                "subject": subject,
+                "predicate": predicate,
+                "object": obj,
+                "confidence": 0.85,
+                "evidence": found[key]
+            })
+            seen_relations.add(key)
 
         # 2. 智能共现关系（同一句子或段落中的实体）
         # 使用多个分隔符：句子和逗号
-        segments = []
-
-        # 先按句子分割
-        sentences = re.split(r'[。！？\.\!\?]+', text)
-        for sent in sentences:
-            if len(sent.strip()) < 5:
-                continue
-            # 再按逗号等分割成更小的片段
-            sub_segments = re.split(r'[，、；]', sent)
-            segments.extend(sub_segments)
-
-        # 为每个片段中的实体创建关系
-        for segment in segments:
-            if len(segment.strip()) < 3:
+        for sent_start, sent_end in self._split_spans(text, 0, len(text), self.SENTENCE_SEPARATORS):
+            if len(text[sent_start:sent_end].strip()) < 5:
                 continue
 
-            # 找出这个片段中的所有实体
-            seg_entities = []
-            for ent in entities:
-                if ent['text'] in segment:
-                    # 避免重复添加
-                    if ent not in seg_entities:
+            for seg_start, seg_end in self._split_spans(text, sent_start, sent_end, self.SEGMENT_SEPARATORS):
+                segment = text[seg_start:seg_end]
+                if len(segment.strip()) < 3:
+                    continue
+
+                # 找出这个片段中的所有实体（按首次出现位置，同文本只保留一个）
+                lo = bisect_left(mention_starts, seg_start)
+                hi = bisect_left(mention_starts, seg_end)
+                seg_entities = []
+                seg_texts = set()
+                for ent in mentions[lo:hi]:
+                    if ent['end'] <= seg_end and ent['text'] not in seg_texts:
                         seg_entities.append(ent)
+                        seg_texts.add(ent['text'])
 
-            # 为片段中的实体创建共现关系
-            for i in range(len(seg_entities)):
-                # 每个实体最多与后面5个实体创建关系
-                for j in range(i + 1, min(i + 6, len(seg_entities))):
-                    # 检查两个实体是否在片段中距离适中（<120字符）
-                    pos1 = segment.find(seg_entities[i]['text'])
-                    pos2 = segment.find(seg_entities[j]['text'])
+                # 为片段中的实体创建共现关系
+                for i in range(len(seg_entities)):
+                    # 每个实体最多与后面5个实体创建关系
+                    for j in range(i + 1, min(i + 6, len(seg_entities))):
+                        # 检查两个实体是否在片段中距离适中（<120字符）
+                        if abs(seg_entities[j]['start'] - seg_entities[i]['start']) >= 120:
+                            continue
 
-                    if pos1 != -1 and pos2 != -1 and abs(pos2 - pos1) < 120:
                         relation_key = (seg_entities[i]['text'], "相关", seg_entities[j]['text'])
                         # 避免重复关系
                         reverse_key = (seg_entities[j]['text'], "相关", seg_entities[i]['text'])
@@ -349,6 +662,91 @@ class RelationExtractor:
         logger.info(f"Extracted {len(relations)} high-quality relations")
         return relations
 
+    def _match_rule(
+        self,
+        text: str,
+        mentions: List[Dict],
+        predicate: str,
+        trigger: str,
+        suffixes: Optional[tuple],
+        hits: Dict[str, List[tuple]],
+        win_start: int,
+        win_end: int,
+        found: Dict[tuple, str]
+    ):
+        """
+        在一个句子窗口内匹配 "主体 ... 触发词 ... 客体 [... 后缀]"
+
+        对每个主体取其后第一个触发词、再取之后每种客体的第一次出现，
+        与原先 "{e1}.*?触发词.*?{e2}" 的最左、最短匹配一致
+        """
+        triggers = self._in_window(hits.get(trigger, []), win_start, win_end)
+        if not triggers:
+            return
+        trigger_starts = [t[0] for t in triggers]
+
+        suffix_hits = []
+        if suffixes:
+            for suffix in suffixes:
+                suffix_hits.extend(self._in_window(hits.get(suffix, []), win_start, win_end))
+            if not suffix_hits:
+                return
+            suffix_hits.sort()
+        suffix_starts = [u[0] for u in suffix_hits]
+
+        mention_starts = [ent['start'] for ent in mentions]
+
+        for ent1 in mentions:
+            k = bisect_left(trigger_starts, ent1['end'])
+            if k == len(triggers):
+                continue
+
+            seen_objects = set()
+            for ent2 in mentions[bisect_left(mention_starts, triggers[k][1]):]:
+                if ent2['text'] == ent1['text'] or ent2['text'] in seen_objects:
+                    continue
+                seen_objects.add(ent2['text'])
+
+                key = (ent1['text'], predicate, ent2['text'])
+                if key in found:
+                    continue
+
+                evidence_end = ent2['end']
+                if suffixes:
+                    u = bisect_left(suffix_starts, ent2['end'])
+                    if u == len(suffix_hits):
+                        continue
+                    evidence_end = suffix_hits[u][1]
+
+                found[key] = text[ent1['start']:evidence_end][:100]
+
+    def _in_window(self, positions: List[tuple], win_start: int, win_end: int) -> List[tuple]:
+        """筛选完全落在窗口内的命中"""
+        lo = bisect_left(positions, (win_start,))
+        hi = bisect_left(positions, (win_end,))
+        return [p for p in positions[lo:hi] if p[1] <= win_end]
+
+    def _sentence_windows(self, text: str) -> List[tuple]:
+        """按句子切分文本，超长句子再按 max_window 切分"""
+        windows = []
+        for start, end in self._split_spans(text, 0, len(text), self.SENTENCE_SEPARATORS):
+            while end - start > self.max_window:
+                windows.append((start, start + self.max_window))
+                start += self.max_window
+            if end > start:
+                windows.append((start, end))
+        return windows
+
+    def _split_spans(self, text: str, start: int, end: int, separator) -> List[tuple]:
+        """返回 text[start:end] 被分隔符切开后各片段的 (start, end)"""
+        spans = []
+        pos = start
+        for match in separator.finditer(text, start, end):
+            spans.append((pos, match.start()))
+            pos = match.end()
+        spans.append((pos, end))
+        return spans
+
 
 # 测试代码
 if __name__ == "__main__":
@@ -2,23 +2,56 @@
 Text Segmenter Module
 智能文本分段，将长文本切分为合适的块
 """
+import os
 import re
-from typing import List, Dict
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Tuple
 from loguru import logger
 
 
+PARAGRAPH_SEPARATOR = "\n\n"
+PARAGRAPH_BREAK = re.compile(r'\n\n+')
+SENTENCE_END = re.compile(r'[。！？\.\!\?]+\s*')
+
+
+class _Unit(NamedTuple):
+    """按 token 分段时的最小单元（句子或超长句子的一段）"""
+    text: str
+    start: int  # 全局起点
+    offsets: List[Tuple[int, int]]  # 各 token 在 text 中的字符区间
+    paragraph: int
+
+
 class TextSegmenter:
     """文本分段器"""
 
-    def __init__(self, max_chunk_size: int = 500, overlap: int = 50):
+    def __init__(
+        self,
+        max_chunk_size: int = 500,
+        overlap: int = 50,
+        tokenizer: Any = None,
+        max_tokens: int = 254,
+        overlap_tokens: int = 32
+    ):
         """
         Args:
             max_chunk_size: 最大块大小（字符数）
             overlap: 块之间的重叠字符数
+            tokenizer: Embedding 模型的分词器（HuggingFace fast tokenizer），
+                提供时按 token 数分段，max_chunk_size/overlap 不再生效
+            max_tokens: 每个分块的 token 上限（不含特殊 token）
+            overlap_tokens: 块之间重叠的 token 数
         """
         self.max_chunk_size = max_chunk_size
         self.overlap = overlap
-        logger.info(f"TextSegmenter initialized: max_size={max_chunk_size}, overlap={overlap}")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        if tokenizer is not None:
+            logger.info(
+                f"TextSegmenter initialized: max_tokens={max_tokens}, overlap_tokens={self.overlap_tokens}"
+            )
+        else:
+            logger.info(f"TextSegmenter initialized: max_size={max_chunk_size}, overlap={overlap}")
 
     def segment(self, text: str, document_id: str = "doc") -> List[Dict]:
         """
@@ -38,80 +71,230 @@ class TextSegmenter:
                 }
             ]
         """
-        # 按段落分割
-        paragraphs = self._split_by_paragraphs(text)
+        chunks = list(self.segment_stream([text], document_id))
+        logger.info(f"Segmented text into {len(chunks)} chunks")
+        return chunks
 
-        chunks = []
-        current_chunk = ""
-        start_char = 0
-        chunk_index = 0
+    def segment_stream(self, blocks: Iterable[str], document_id: str = "doc") -> Iterator[Dict]:
+        """
+        流式分段：逐个读取文本块（如PDF页面、Word段落），边读边产出分块
 
-        for para in paragraphs:
-            # 如果当前段落很长，需要进一步分割
-            if len(para) > self.max_chunk_size:
-                # 先保存当前chunk
-                if current_chunk:
-                    chunks.append({
-                        "chunk_id": f"{document_id}_chunk{chunk_index}",
-                        "text": current_chunk.strip(),
-                        "start_char": start_char,
-                        "end_char": start_char + len(current_chunk)
-                    })
-                    chunk_index += 1
-                    start_char += len(current_chunk) - self.overlap
-                    current_chunk = ""
-
-                # 分割长段落
-                sub_chunks = self._split_long_paragraph(para)
-                for sub in sub_chunks:
-                    chunks.append({
-                        "chunk_id": f"{document_id}_chunk{chunk_index}",
-                        "text": sub.strip(),
-                        "start_char": start_char,
-                        "end_char": start_char + len(sub)
-                    })
+        blocks 视为以 "\n\n" 连接的完整文本，分块结果与对完整文本调用 segment() 相同，
+        start_char/end_char 为分块在完整文本中的全局偏移；内存占用只与分块大小有关
+
+        Args:
+            blocks: 文本块迭代器
+            document_id: 文档ID
+
+        Yields:
+            {"chunk_id", "text", "start_char", "end_char"}（按 token 分段时另有 "token_count"）
+        """
+        if self.tokenizer is not None:
+            return self._segment_tokens(blocks, document_id)
+        return self._segment_chars(blocks, document_id)
+
+    def _segment_chars(self, blocks: Iterable[str], document_id: str) -> Iterator[Dict]:
+        """按字符数分段"""
+        chunk_index = 0
+        current_chunk = ""
+        # 当前chunk中各段落的位置 [(chunk内起点, 全局起点, 长度)]
+        spans: List[Tuple[int, int, int]] = []
+        offset = 0
+
+        for block in blocks:
+            for para, para_start in self._iter_paragraphs(block, offset):
+                # 如果当前段落很长，需要进一步分割
+                if len(para) > self.max_chunk_size:
+                    # 先保存当前chunk
+                    if current_chunk:
+                        yield self._make_chunk(document_id, chunk_index, current_chunk, spans)
+                        chunk_index += 1
+                        current_chunk, spans = "", []
+
+                    # 分割长段落
+                    sub_start = para_start
+                    for sub in self._split_long_paragraph(para):
+                        yield self._make_chunk(document_id, chunk_index, sub, [(0, sub_start, len(sub))])
+                        chunk_index += 1
+                        sub_start += len(sub)
+
+                # 如果添加这个段落会超出大小限制
+                elif len(current_chunk) + len(para) > self.max_chunk_size:
+                    # 保存当前chunk
+                    yield self._make_chunk(document_id, chunk_index, current_chunk, spans)
                     chunk_index += 1
-                    start_char += len(sub) - self.overlap
-
-            # 如果添加这个段落会超出大小限制
-            elif len(current_chunk) + len(para) > self.max_chunk_size:
-                # 保存当前chunk
-                chunks.append({
-                    "chunk_id": f"{document_id}_chunk{chunk_index}",
-                    "text": current_chunk.strip(),
-                    "start_char": start_char,
-                    "end_char": start_char + len(current_chunk)
-                })
-                chunk_index += 1
-
-                # 开始新chunk，保留overlap
-                overlap_text = current_chunk[-self.overlap:] if len(current_chunk) >= self.overlap else current_chunk
-                start_char += len(current_chunk) - len(overlap_text)
-                current_chunk = overlap_text + "\n\n" + para
 
-            else:
-                # 添加到当前chunk
-                if current_chunk:
-                    current_chunk += "\n\n" + para
+                    # 开始新chunk，保留overlap
+                    overlap_text = current_chunk[-self.overlap:] if self.overlap else ""
+                    spans = self._shift_spans(spans, len(current_chunk) - len(overlap_text))
+                    current_chunk = overlap_text + "\n\n" + para
+                    spans.append((len(current_chunk) - len(para), para_start, len(para)))
+
                 else:
-                    current_chunk = para
+                    # 添加到当前chunk
+                    if current_chunk:
+                        current_chunk += "\n\n" + para
+                    else:
+                        current_chunk = para
+                    spans.append((len(current_chunk) - len(para), para_start, len(para)))
+
+            offset += len(block) + len(PARAGRAPH_SEPARATOR)
 
         # 保存最后一个chunk
         if current_chunk:
-            chunks.append({
-                "chunk_id": f"{document_id}_chunk{chunk_index}",
-                "text": current_chunk.strip(),
-                "start_char": start_char,
-                "end_char": start_char + len(current_chunk)
-            })
+            yield self._make_chunk(document_id, chunk_index, current_chunk, spans)
 
-        logger.info(f"Segmented text into {len(chunks)} chunks")
-        return chunks
+    def _segment_tokens(self, blocks: Iterable[str], document_id: str) -> Iterator[Dict]:
+        """
+        按 token 数分段：以句子为单元装入分块，直到达到 max_tokens，
+        新分块以上一分块末尾的 overlap_tokens 个 token 开头
+        """
+        chunk_index = 0
+        units: List[_Unit] = []
+        tokens = 0
+        offset = 0
+        paragraph = 0
+
+        for block in blocks:
+            for para, para_start in self._iter_paragraphs(block, offset):
+                paragraph += 1
+                for unit in self._token_units(para, para_start, paragraph):
+                    count = len(unit.offsets)
+                    if units and tokens + count > self.max_tokens:
+                        yield self._make_token_chunk(document_id, chunk_index, units, tokens)
+                        chunk_index += 1
+                        units = self._token_overlap(units)
+                        tokens = sum(len(u.offsets) for u in units)
+                        if tokens + count > self.max_tokens:
+                            units, tokens = [], 0
+                    units.append(unit)
+                    tokens += count
+
+            offset += len(block) + len(PARAGRAPH_SEPARATOR)
+
+        if units:
+            yield self._make_token_chunk(document_id, chunk_index, units, tokens)
+
+    def _token_units(self, para: str, para_start: int, paragraph: int) -> Iterator[_Unit]:
+        """将段落切分为句子并分词；超过上限的句子按 token 切开（留出重叠的空间）"""
+        sentences = []
+        pos = 0
+        for match in SENTENCE_END.finditer(para):
+            sentences.append((pos, para[pos:match.end()]))
+            pos = match.end()
+        if pos < len(para):
+            sentences.append((pos, para[pos:]))
+
+        encoded = self.tokenizer(
+            [sentence for _, sentence in sentences],
+            add_special_tokens=False,
+            return_offsets_mapping=True
+        )["offset_mapping"]
+
+        piece_tokens = self.max_tokens - self.overlap_tokens
+        for (pos, sentence), offsets in zip(sentences, encoded):
+            offsets = [tuple(span) for span in offsets]
+            if len(offsets) <= self.max_tokens:
+                yield _Unit(sentence, para_start + pos, offsets, paragraph)
+                continue
+
+            for i in range(0, len(offsets), piece_tokens):
+                piece = offsets[i:i + piece_tokens]
+                cut_start = piece[0][0] if i else 0
+                cut_end = offsets[i + piece_tokens][0] if i + piece_tokens < len(offsets) else len(sentence)
+                yield _Unit(
+                    sentence[cut_start:cut_end],
+                    para_start + pos + cut_start,
+                    [(start - cut_start, end - cut_start) for start, end in piece],
+                    paragraph
+                )
+
+    def _token_overlap(self, units: List[_Unit]) -> List[_Unit]:
+        """取上一分块末尾 overlap_tokens 个 token 所在的文本作为新分块的开头"""
+        carried: List[_Unit] = []
+        remaining = self.overlap_tokens
+        for unit in reversed(units):
+            if remaining <= 0:
+                break
+            if len(unit.offsets) <= remaining:
+                carried.append(unit)
+                remaining -= len(unit.offsets)
+                continue
+            cut = unit.offsets[-remaining][0]
+            carried.append(_Unit(
+                unit.text[cut:],
+                unit.start + cut,
+                [(start - cut, end - cut) for start, end in unit.offsets[-remaining:]],
+                unit.paragraph
+            ))
+            break
+        return carried[::-1]
+
+    @staticmethod
+    def _make_token_chunk(document_id: str, chunk_index: int, units: List[_Unit], tokens: int) -> Dict:
+        """拼接单元文本（跨段落处以 "\n\n" 连接），偏移取首个非空白字符到末尾非空白字符"""
+        parts = []
+        for i, unit in enumerate(units):
+            if i and unit.paragraph != units[i - 1].paragraph:
+                parts.append(PARAGRAPH_SEPARATOR)
+            parts.append(unit.text)
+        text = "".join(parts)
+
+        first = next((unit for unit in units if unit.text.strip()), units[0])
+        last = next((unit for unit in reversed(units) if unit.text.strip()), units[-1])
+        return {
+            "chunk_id": f"{document_id}_chunk{chunk_index}",
+            "text": text.strip(),
+            "start_char": first.start + len(first.text) - len(first.text.lstrip()),
+            "end_char": last.start + len(last.text.rstrip()),
+            "token_count": tokens
+        }
+
+    @staticmethod
+    def _iter_paragraphs(block: str, offset: int) -> Iterator[Tuple[str, int]]:
+        """按段落分割文本块，返回 (段落, 全局起点)，与 _split_by_paragraphs 的结果一致"""
+        pos = 0
+        for match in PARAGRAPH_BREAK.finditer(block + PARAGRAPH_SEPARATOR):
+            raw = block[pos:match.start()]
+            para = raw.strip()
+            if para:
+                yield para, offset + pos + len(raw) - len(raw.lstrip())
+            pos = match.end()
+
+    @staticmethod
+    def _shift_spans(spans: List[Tuple[int, int, int]], cut: int) -> List[Tuple[int, int, int]]:
+        """丢弃chunk前 cut 个字符后，剩余部分（overlap）的段落位置"""
+        shifted = []
+        for local, start, length in spans:
+            if local + length <= cut:
+                continue
+            if local < cut:
+                start, length, local = start + cut - local, length - (cut - local), cut
+            shifted.append((local - cut, start, length))
+        return shifted
+
+    @staticmethod
+    def _make_chunk(document_id: str, chunk_index: int, text: str, spans: List[Tuple[int, int, int]]) -> Dict:
+        """构造分块，偏移取首个非空白字符到最后一个段落末尾"""
+        lead = len(text) - len(text.lstrip())
+        start_char = next(
+            (start + max(0, lead - local) for local, start, length in spans if local + length > lead),
+            spans[0][1]
+        )
+        last_local, last_start, last_length = spans[-1]
+        trail = len(text) - len(text.rstrip())
+        end_char = last_start + last_length - max(0, trail - (len(text) - last_local - last_length))
+        return {
+            "chunk_id": f"{document_id}_chunk{chunk_index}",
+            "text": text.strip(),
+            "start_char": start_char,
+            "end_char": end_char
+        }
 
     def _split_by_paragraphs(self, text: str) -> List[str]:
         """按段落分割文本"""
         # 按双换行符分割
-        paragraphs = re.split(r'\n\n+', text)
+        paragraphs = PARAGRAPH_BREAK.split(text)
         # 过滤空段落
         return [p.strip() for p in paragraphs if p.strip()]
 
@@ -165,6 +348,35 @@ class TextSegmenter:
         return [s[0] for s in scored[:top_k]]
 
 
+def create_segmenter(
+    tokenizer: Any = None,
+    max_tokens: int = 0,
+    max_chunk_size: int = 500,
+    overlap: int = 50
+) -> TextSegmenter:
+    """
+    按环境变量 SEGMENT_MODE 创建分段器
+
+    SEGMENT_MODE=tokens 且提供了 Embedding 模型的分词器时按 token 分段
+    （上限为 SEGMENT_MAX_TOKENS，未设置时取模型的 max_tokens），否则按字符分段
+
+    Args:
+        tokenizer: Embedding 模型的分词器
+        max_tokens: 模型单段可编码的 token 数（不含特殊 token）
+        max_chunk_size: 按字符分段时的块大小
+        overlap: 按字符分段时的重叠字符数
+    """
+    if os.getenv("SEGMENT_MODE", "chars") == "tokens":
+        if tokenizer is not None and max_tokens > 0:
+            return TextSegmenter(
+                tokenizer=tokenizer,
+                max_tokens=int(os.getenv("SEGMENT_MAX_TOKENS", "0")) or max_tokens,
+                overlap_tokens=int(os.getenv("SEGMENT_OVERLAP_TOKENS", "32"))
+            )
+        logger.warning("SEGMENT_MODE=tokens but no fast tokenizer is available, segmenting by characters")
+    return TextSegmenter(max_chunk_size=max_chunk_size, overlap=overlap)
+
+
 # 测试代码
 if __name__ == "__main__":
     segmenter = TextSegmenter(max_chunk_size=200, overlap=20)
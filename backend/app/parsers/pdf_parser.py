@@ -2,18 +2,118 @@
 PDF Parser Module
 解析PDF文件，提取文本和元数据
 """
+import math
+import multiprocessing
 import os
-from typing import Dict, List, Optional
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional
 from pathlib import Path
 import fitz  # PyMuPDF
 from loguru import logger
 
 
+def extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """
+    提取 [start, end) 范围内页面的原始文本（在子进程中执行，每个进程自行打开文件）
+
+    Args:
+        file_path: PDF文件路径
+        start: 起始页（从0开始）
+        end: 结束页（不含）
+
+    Returns:
+        按页顺序排列的文本列表
+    """
+    doc = fitz.open(file_path)
+    try:
+        return [doc[page_num].get_text("text") for page_num in range(start, end)]
+    finally:
+        doc.close()
+
+
 class PDFParser:
     """PDF文件解析器"""
 
-    def __init__(self):
-        logger.info("PDFParser initialized")
+    def __init__(self, max_workers: int = None, parallel_threshold: int = None):
+        """
+        Args:
+            max_workers: 并行提取的进程数 (默认从环境变量 PDF_PARSE_WORKERS 读取，未设置时为CPU核数)
+            parallel_threshold: 页数达到该值时启用多进程提取 (默认从环境变量 PDF_PARALLEL_THRESHOLD 读取)
+        """
+        self.max_workers = max_workers or int(os.getenv("PDF_PARSE_WORKERS", "0")) or os.cpu_count() or 1
+        self.parallel_threshold = parallel_threshold or int(os.getenv("PDF_PARALLEL_THRESHOLD", "200"))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # 解析在多个处理线程中并发执行，共享同一个进程池
+        self._pool_lock = threading.Lock()
+        logger.info(
+            f"PDFParser initialized: workers={self.max_workers}, "
+            f"parallel_threshold={self.parallel_threshold} pages"
+        )
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """懒加载进程池（spawn 方式启动，避免在多线程进程中 fork）"""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _discard_pool(self, pool: Optional[ProcessPoolExecutor], error: Exception):
+        """
+        并行提取失败后处理进程池
+
+        只有进程池本身损坏（子进程异常退出）时才丢弃，下次使用时重新创建；
+        单个文件的提取错误不影响其他线程正在使用的进程池
+        """
+        if pool is None or not isinstance(error, BrokenProcessPool):
+            return
+        with self._pool_lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        pool.shutdown(wait=False)
+
+    def _extract_texts(self, file_path: str, doc) -> List[str]:
+        """
+        提取所有页面的原始文本
+
+        页数达到阈值且可用多个进程时，按页码区间拆分到进程池并行提取，
+        结果按区间顺序拼接；进程池不可用时退回单线程逐页提取
+        """
+        page_count = doc.page_count
+
+        if self.max_workers > 1 and page_count >= self.parallel_threshold:
+            # 每个进程分到若干个区间，便于负载均衡
+            span = math.ceil(page_count / (self.max_workers * 4))
+            ranges = [(start, min(start + span, page_count)) for start in range(0, page_count, span)]
+            pool = None
+            try:
+                pool = self._get_pool()
+                results = pool.map(
+                    extract_page_range,
+                    [file_path] * len(ranges),
+                    [start for start, _ in ranges],
+                    [end for _, end in ranges]
+                )
+                texts = [text for chunk in results for text in chunk]
+                logger.info(f"Extracted {page_count} pages in {len(ranges)} ranges across {self.max_workers} processes")
+                return texts
+            except Exception as e:
+                logger.warning(f"Parallel PDF extraction failed, falling back to serial: {str(e)}")
+                self._discard_pool(pool, e)
+
+        return [doc[page_num].get_text("text") for page_num in range(page_count)]
+
+    def close(self):
+        """关闭进程池"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
 
     def parse(self, file_path: str) -> Dict:
         """
@@ -34,23 +134,13 @@ class PDFParser:
             doc = fitz.open(file_path)
 
             # 提取元数据
-            metadata = {
-                "title": doc.metadata.get("title", ""),
-                "author": doc.metadata.get("author", ""),
-                "subject": doc.metadata.get("subject", ""),
-                "creator": doc.metadata.get("creator", ""),
-                "page_count": doc.page_count,
-                "file_name": Path(file_path).name
-            }
+            metadata = self._metadata(doc, file_path)
 
             # 提取所有页面文本
             pages = []
             full_text = []
 
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
-                text = page.get_text("text")
-
+            for page_num, text in enumerate(self._extract_texts(file_path, doc)):
                 pages.append({
                     "page_num": page_num + 1,
                     "text": text.strip()
@@ -80,6 +170,89 @@ class PDFParser:
                 "error": str(e)
             }
 
+    def parse_stream(self, file_path: str) -> Dict:
+        """
+        流式解析PDF文件：元数据立即返回，页面文本按顺序逐页产出，不保留完整文本
+
+        Args:
+            file_path: PDF文件路径
+
+        Returns:
+            {
+                "blocks": 页面原始文本迭代器（以 "\n\n" 连接即为 parse() 的 text）,
+                "metadata": {"title": "", "author": "", ...}
+            }
+        """
+        try:
+            doc = fitz.open(file_path)
+            metadata = self._metadata(doc, file_path)
+        except Exception as e:
+            logger.error(f"Error parsing PDF {file_path}: {str(e)}")
+            return {
+                "blocks": iter(()),
+                "metadata": {},
+                "status": "error",
+                "error": str(e)
+            }
+
+        return {
+            "blocks": self._iter_pages(file_path, doc),
+            "metadata": metadata,
+            "status": "success"
+        }
+
+    def _iter_pages(self, file_path: str, doc) -> Iterator[str]:
+        """
+        逐页产出原始文本
+
+        页数达到阈值时按页码区间提交到进程池，同时在途的区间数有上限，
+        内存占用与页数无关；进程池失败时从未产出的页面起退回单线程
+        """
+        page_count = doc.page_count
+        next_page = 0
+
+        try:
+            if self.max_workers > 1 and page_count >= self.parallel_threshold:
+                span = math.ceil(page_count / (self.max_workers * 4))
+                ranges = iter(range(0, page_count, span))
+                in_flight = []
+                pool = None
+                try:
+                    pool = self._get_pool()
+                    for start in ranges:
+                        in_flight.append(pool.submit(extract_page_range, file_path, start, min(start + span, page_count)))
+                        if len(in_flight) >= self.max_workers * 2:
+                            break
+                    while in_flight:
+                        texts = in_flight.pop(0).result()
+                        start = next(ranges, None)
+                        if start is not None:
+                            in_flight.append(pool.submit(extract_page_range, file_path, start, min(start + span, page_count)))
+                        for text in texts:
+                            yield text
+                            next_page += 1
+                except Exception as e:
+                    logger.warning(f"Parallel PDF extraction failed at page {next_page}, falling back to serial: {str(e)}")
+                    for future in in_flight:
+                        future.cancel()
+                    self._discard_pool(pool, e)
+
+            for page_num in range(next_page, page_count):
+                yield doc[page_num].get_text("text")
+        finally:
+            doc.close()
+
+    @staticmethod
+    def _metadata(doc, file_path: str) -> Dict:
+        return {
+            "title": doc.metadata.get("title", ""),
+            "author": doc.metadata.get("author", ""),
+            "subject": doc.metadata.get("subject", ""),
+            "creator": doc.metadata.get("creator", ""),
+            "page_count": doc.page_count,
+            "file_name": Path(file_path).name
+        }
+
     def extract_text_by_page(self, file_path: str, page_num: int) -> str:
         """提取指定页面的文本"""
         try:
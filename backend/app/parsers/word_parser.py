@@ -3,7 +3,7 @@ Word Parser Module
 解析Word文档（.docx），提取文本和元数据
 """
 import os
-from typing import Dict, List
+from typing import Dict, Iterator, List
 from pathlib import Path
 from docx import Document
 from loguru import logger
@@ -35,17 +35,7 @@ class WordParser:
             doc = Document(file_path)
 
             # 提取元数据
-            core_props = doc.core_properties
-            metadata = {
-                "title": core_props.title or "",
-                "author": core_props.author or "",
-                "subject": core_props.subject or "",
-                "keywords": core_props.keywords or "",
-                "created": str(core_props.created) if core_props.created else "",
-                "modified": str(core_props.modified) if core_props.modified else "",
-                "file_name": Path(file_path).name,
-                "paragraph_count": len(doc.paragraphs)
-            }
+            metadata = self._metadata(doc, file_path)
 
             # 提取段落
             paragraphs = []
@@ -98,6 +88,58 @@ class WordParser:
                 "error": str(e)
             }
 
+    def parse_stream(self, file_path: str) -> Dict:
+        """
+        流式解析Word文档：元数据立即返回，非空段落文本逐个产出，不拼接完整文本
+
+        Args:
+            file_path: Word文件路径
+
+        Returns:
+            {
+                "blocks": 段落文本迭代器（以 "\n\n" 连接即为 parse() 的 text）,
+                "metadata": {"title": "", "author": "", ...}
+            }
+        """
+        try:
+            doc = Document(file_path)
+            metadata = self._metadata(doc, file_path)
+        except Exception as e:
+            logger.error(f"Error parsing Word {file_path}: {str(e)}")
+            return {
+                "blocks": iter(()),
+                "metadata": {},
+                "status": "error",
+                "error": str(e)
+            }
+
+        return {
+            "blocks": self._iter_paragraphs(doc),
+            "metadata": metadata,
+            "status": "success"
+        }
+
+    @staticmethod
+    def _iter_paragraphs(doc) -> Iterator[str]:
+        for para in doc.paragraphs:
+            text = para.text.strip()
+            if text:
+                yield text
+
+    @staticmethod
+    def _metadata(doc, file_path: str) -> Dict:
+        core_props = doc.core_properties
+        return {
+            "title": core_props.title or "",
+            "author": core_props.author or "",
+            "subject": core_props.subject or "",
+            "keywords": core_props.keywords or "",
+            "created": str(core_props.created) if core_props.created else "",
+            "modified": str(core_props.modified) if core_props.modified else "",
+            "file_name": Path(file_path).name,
+            "paragraph_count": len(doc.paragraphs)
+        }
+
     def extract_headings(self, file_path: str) -> List[Dict]:
         """提取所有标题（Heading样式）"""
         try:
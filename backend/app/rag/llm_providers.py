@@ -3,7 +3,7 @@ LLM Providers - 支持多个大语言模型提供商
 包括: OpenAI, 千问(Qwen), 文心一言, 等
 """
 import os
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterator
 from abc import ABC, abstractmethod
 from loguru import logger
 
@@ -39,12 +39,73 @@ class LLMProvider(ABC):
         """
         pass
 
+    def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式聊天补全接口（默认实现：一次性返回完整回答）
+
+        Args:
+            messages: 对话消息列表
+            temperature: 生成温度
+            max_tokens: 最大token数
+
+        Yields:
+            {"type": "token", "content": "增量文本"}，最后一条为
+            {"type": "usage", "usage": {...}}
+        """
+        result = self.chat_completion(messages, temperature, max_tokens)
+        yield {"type": "token", "content": result["content"]}
+        yield {"type": "usage", "usage": result.get("usage", {})}
+
     @abstractmethod
     def is_available(self) -> bool:
         """检查提供商是否可用"""
         pass
 
 
+def stream_openai_compatible(
+    client,
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int
+) -> Iterator[Dict[str, Any]]:
+    """
+    OpenAI 兼容接口的流式补全（OpenAI / 千问 / DeepSeek 共用）
+
+    通过 stream_options.include_usage 让服务端在最后一个分块中返回 token 用量
+    """
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+        extra_body={"stream_options": {"include_usage": True}}
+    )
+
+    usage = {}
+    for chunk in stream:
+        if chunk.choices:
+            content = chunk.choices[0].delta.content
+            if content:
+                yield {"type": "token", "content": content}
+
+        chunk_usage = getattr(chunk, "usage", None)
+        if chunk_usage:
+            usage = {
+                "prompt_tokens": chunk_usage.prompt_tokens,
+                "completion_tokens": chunk_usage.completion_tokens,
+                "total_tokens": chunk_usage.total_tokens
+            }
+
+    yield {"type": "usage", "usage": usage}
+
+
 class OpenAIProvider(LLMProvider):
     """OpenAI (ChatGPT) 提供商"""
 
@@ -85,6 +146,17 @@ class OpenAIProvider(LLMProvider):
             }
         }
 
+    def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        if not self.available:
+            raise Exception("OpenAI provider not available")
+
+        return stream_openai_compatible(self.client, self.model, messages, temperature, max_tokens)
+
     def is_available(self) -> bool:
         return self.available
 
@@ -133,6 +205,17 @@ class QwenProvider(LLMProvider):
             }
         }
 
+    def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        if not self.available:
+            raise Exception("Qwen provider not available")
+
+        return stream_openai_compatible(self.client, self.model, messages, temperature, max_tokens)
+
     def is_available(self) -> bool:
         return self.available
 
@@ -180,6 +263,17 @@ class DeepSeekProvider(LLMProvider):
             }
         }
 
+    def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        if not self.available:
+            raise Exception("DeepSeek provider not available")
+
+        return stream_openai_compatible(self.client, self.model, messages, temperature, max_tokens)
+
     def is_available(self) -> bool:
         return self.available
 
@@ -320,6 +414,36 @@ class LLMProviderManager:
 
         return result
 
+    def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: int = 1000,
+        provider_id: str = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式调用聊天补全
+
+        Args:
+            messages: 对话消息
+            temperature: 生成温度
+            max_tokens: 最大token数
+            provider_id: 指定提供商(可选，默认使用当前)
+
+        Yields:
+            token 事件，最后一条 usage 事件附带提供商和模型信息
+        """
+        pid = provider_id or self.current_provider
+
+        if not pid or pid not in self.providers:
+            raise Exception("No LLM provider available")
+
+        provider = self.providers[pid]
+        for event in provider.stream_chat_completion(messages, temperature, max_tokens):
+            if event["type"] == "usage":
+                event = {**event, "provider": pid, "model": provider.model}
+            yield event
+
     def is_available(self) -> bool:
         """检查是否有可用的提供商"""
         return len(self.providers) > 0
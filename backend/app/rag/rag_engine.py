@@ -3,7 +3,7 @@ RAG (Retrieval-Augmented Generation) Engine
 检索增强生成问答系统 - 支持多个 LLM 提供商
 """
 import os
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterator
 from loguru import logger
 from app.rag.llm_providers import get_llm_manager
 
@@ -65,15 +65,16 @@ class RAGEngine:
 
         try:
             # 使用向量检索
-            if document_id:
-                results = self.vector_store.search_by_document(
+            if use_hybrid:
+                results = self.vector_store.hybrid_search(
                     question,
-                    document_id,
-                    top_k
+                    top_k,
+                    document_id=document_id
                 )
-            elif use_hybrid:
-                results = self.vector_store.hybrid_search(
+            elif document_id:
+                results = self.vector_store.search_by_document(
                     question,
+                    document_id,
                     top_k
                 )
             else:
@@ -110,6 +111,61 @@ class RAGEngine:
 
         return "\n\n".join(formatted)
 
+    def _build_qa_messages(
+        self,
+        question: str,
+        contexts: List[Dict],
+        system_prompt: str = None
+    ) -> List[Dict[str, str]]:
+        """构建问答提示词消息"""
+        # 默认系统提示词
+        if not system_prompt:
+            system_prompt = """你是一个专业的知识问答助手。请根据提供的文档片段回答用户问题。
+
+要求：
+1. 只基于提供的文档片段回答，不要编造信息
+2. 如果文档中没有相关信息，请明确说明
+3. 引用具体片段时，标注片段编号
+4. 回答要简洁、准确、有条理
+5. 使用中文回答"""
+
+        # 格式化上下文
+        context_text = self.format_context(contexts)
+
+        # 构建用户提示
+        user_prompt = f"""参考文档：
+{context_text}
+
+问题：{question}
+
+请基于上述文档回答问题。"""
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    @staticmethod
+    def _estimate_confidence(contexts: List[Dict]) -> float:
+        """估算置信度（基于检索分数）"""
+        return sum(
+            ctx.get("score", 0) or ctx.get("combined_score", 0)
+            for ctx in contexts
+        ) / len(contexts) if contexts else 0
+
+    @staticmethod
+    def _format_sources(contexts: List[Dict]) -> List[Dict]:
+        """格式化引用来源"""
+        return [
+            {
+                "chunk_id": ctx.get("id", ""),
+                "text": ctx.get("text", ""),
+                "score": ctx.get("score", 0) or ctx.get("combined_score", 0),
+                "metadata": ctx.get("metadata", {})
+            }
+            for ctx in contexts
+        ]
+
     def generate_answer(
         self,
         question: str,
@@ -137,50 +193,19 @@ class RAGEngine:
                 "error": "OpenAI client not available"
             }
 
-        # 默认系统提示词
-        if not system_prompt:
-            system_prompt = """你是一个专业的知识问答助手。请根据提供的文档片段回答用户问题。
-
-要求：
-1. 只基于提供的文档片段回答，不要编造信息
-2. 如果文档中没有相关信息，请明确说明
-3. 引用具体片段时，标注片段编号
-4. 回答要简洁、准确、有条理
-5. 使用中文回答"""
-
-        # 格式化上下文
-        context_text = self.format_context(contexts)
-
-        # 构建用户提示
-        user_prompt = f"""参考文档：
-{context_text}
-
-问题：{question}
-
-请基于上述文档回答问题。"""
-
         try:
             # 调用LLM提供商
             result = self.llm_manager.chat_completion(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=self._build_qa_messages(question, contexts, system_prompt),
                 temperature=temperature,
                 max_tokens=1000
             )
 
             answer = result["content"]
 
-            # 估算置信度（基于检索分数）
-            avg_score = sum(
-                ctx.get("score", 0) or ctx.get("combined_score", 0)
-                for ctx in contexts
-            ) / len(contexts) if contexts else 0
-
             return {
                 "answer": answer,
-                "confidence": avg_score,
+                "confidence": self._estimate_confidence(contexts),
                 "model": result["model"],
                 "provider": result["provider"],
                 "usage": result.get("usage", {})
@@ -238,15 +263,7 @@ class RAGEngine:
         return {
             "question": question,
             "answer": result["answer"],
-            "sources": [
-                {
-                    "chunk_id": ctx.get("id", ""),
-                    "text": ctx.get("text", ""),
-                    "score": ctx.get("score", 0) or ctx.get("combined_score", 0),
-                    "metadata": ctx.get("metadata", {})
-                }
-                for ctx in contexts
-            ],
+            "sources": self._format_sources(contexts),
             "confidence": result.get("confidence", 0.0),
             "model": result.get("model", "none"),
             "graph_info": graph_info,
@@ -254,6 +271,81 @@ class RAGEngine:
             "error": result.get("error")
         }
 
+    def ask_stream(
+        self,
+        question: str,
+        document_id: Optional[str] = None,
+        top_k: int = 5,
+        use_hybrid: bool = True,
+        include_graph: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式RAG问答：先返回检索到的来源，再逐段返回答案，最后返回用量
+
+        Args:
+            question: 用户问题
+            document_id: 限定文档ID
+            top_k: 检索数量
+            use_hybrid: 使用混合检索
+            include_graph: 是否包含知识图谱信息
+
+        Yields:
+            {"event": "sources" | "token" | "usage" | "error", "data": {...}}
+        """
+        # 1. 检索上下文，检索完成后立即返回来源
+        contexts = self.retrieve_context(
+            question,
+            top_k,
+            document_id,
+            use_hybrid
+        )
+
+        graph_info = None
+        if include_graph and self.kg_manager and self.kg_manager.connected:
+            graph_info = self._get_graph_context(question)
+
+        yield {
+            "event": "sources",
+            "data": {
+                "question": question,
+                "sources": self._format_sources(contexts),
+                "confidence": self._estimate_confidence(contexts),
+                "graph_info": graph_info
+            }
+        }
+
+        if not self.available:
+            yield {
+                "event": "error",
+                "data": {
+                    "answer": "抱歉，AI问答功能当前不可用。您可以查看检索到的相关文档片段。",
+                    "error": "LLM provider not available"
+                }
+            }
+            return
+
+        # 2. 逐段返回答案
+        try:
+            for event in self.llm_manager.stream_chat_completion(
+                messages=self._build_qa_messages(question, contexts),
+                temperature=0.3,
+                max_tokens=1000
+            ):
+                if event["type"] == "token":
+                    yield {"event": "token", "data": {"content": event["content"]}}
+                else:
+                    yield {
+                        "event": "usage",
+                        "data": {
+                            "usage": event.get("usage", {}),
+                            "model": event.get("model", "none"),
+                            "provider": event.get("provider")
+                        }
+                    }
+        except Exception as e:
+            logger.error(f"Streaming answer generation failed: {str(e)}")
+            yield {"event": "error", "data": {"error": str(e)}}
+
     def _get_graph_context(self, question: str) -> Optional[Dict]:
         """
         从知识图谱获取额外上下文（简化版）
@@ -273,6 +365,23 @@ class RAGEngine:
 
         return None
 
+    @staticmethod
+    def _build_summary_messages(chunks: List[Dict], max_length: int) -> List[Dict[str, str]]:
+        """构建摘要提示词消息"""
+        # 合并文本（限制长度）
+        full_text = "\n\n".join([c["text"] for c in chunks[:10]])  # 最多10个chunk
+
+        return [
+            {
+                "role": "system",
+                "content": "你是一个专业的文档摘要助手。请用中文生成简洁、准确的摘要。"
+            },
+            {
+                "role": "user",
+                "content": f"请为以下文档生成摘要（{max_length}字以内）：\n\n{full_text}"
+            }
+        ]
+
     def summarize_document(
         self,
         document_id: str,
@@ -304,21 +413,9 @@ class RAGEngine:
                     "error": "Document not found"
                 }
 
-            # 合并文本（限制长度）
-            full_text = "\n\n".join([c["text"] for c in chunks[:10]])  # 最多10个chunk
-
             # 生成摘要
             result = self.llm_manager.chat_completion(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的文档摘要助手。请用中文生成简洁、准确的摘要。"
-                    },
-                    {
-                        "role": "user",
-                        "content": f"请为以下文档生成摘要（{max_length}字以内）：\n\n{full_text}"
-                    }
-                ],
+                messages=self._build_summary_messages(chunks, max_length),
                 temperature=0.3,
                 max_tokens=max_length
             )
@@ -341,6 +438,59 @@ class RAGEngine:
             }
 
 
+    def summarize_document_stream(
+        self,
+        document_id: str,
+        max_length: int = 500
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式生成文档摘要
+
+        Args:
+            document_id: 文档ID
+            max_length: 最大摘要长度
+
+        Yields:
+            {"event": "meta" | "token" | "usage" | "error", "data": {...}}
+        """
+        if not self.available or not self.vector_store:
+            yield {"event": "error", "data": {"summary": "摘要功能不可用", "error": "Service unavailable"}}
+            return
+
+        try:
+            chunks = self.vector_store.get_document_chunks(document_id)
+
+            if not chunks:
+                yield {"event": "error", "data": {"summary": "未找到文档内容", "error": "Document not found"}}
+                return
+
+            yield {
+                "event": "meta",
+                "data": {"document_id": document_id, "chunks_used": len(chunks)}
+            }
+
+            for event in self.llm_manager.stream_chat_completion(
+                messages=self._build_summary_messages(chunks, max_length),
+                temperature=0.3,
+                max_tokens=max_length
+            ):
+                if event["type"] == "token":
+                    yield {"event": "token", "data": {"content": event["content"]}}
+                else:
+                    yield {
+                        "event": "usage",
+                        "data": {
+                            "usage": event.get("usage", {}),
+                            "model": event.get("model", "none"),
+                            "provider": event.get("provider")
+                        }
+                    }
+
+        except Exception as e:
+            logger.error(f"Streaming summarization failed: {str(e)}")
+            yield {"event": "error", "data": {"summary": f"摘要生成失败: {str(e)}", "error": str(e)}}
+
+
 # 测试代码
 if __name__ == "__main__":
     from vector.vector_store import VectorStoreManager
@@ -0,0 +1,261 @@
+"""
+Document Store
+文档存储 - 基于 SQLite 的持久化文档库
+
+文档元数据保存在带索引的表中；全文、分块、实体、关系等大字段
+以 zlib 压缩的 JSON 单独存放，仅在请求对应接口时按需加载
+"""
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+
+# 按需加载的大字段
+PAYLOAD_KINDS = ("text", "chunks", "entities", "relations")
+
+# 元数据列（JSON 字段单独序列化）
+_COLUMNS = (
+    "document_id", "file_name", "file_type", "file_path", "text_length",
+    "chunks_count", "entities_count", "relations_count", "status", "created_at",
+    "content_hash"
+)
+_COUNT_COLUMNS = ("text_length", "chunks_count", "entities_count", "relations_count")
+_JSON_COLUMNS = ("metadata", "processing")
+
+
+class CompressedPayload(bytes):
+    """已压缩的大字段（由 PayloadWriter 生成），save() 时原样写入"""
+
+
+class PayloadWriter:
+    """
+    增量压缩大字段：内容边产出边压缩，内存中只保留压缩后的数据
+
+    text 字段用 write() 逐段追加字符串，其余字段用 append() 逐项追加列表元素，
+    finish() 返回可直接传给 DocumentStore.save() 的 CompressedPayload
+    """
+
+    def __init__(self, kind: str, compress_level: int = 6):
+        self.kind = kind
+        self.count = 0  # text 为字符数，其余为元素数
+        self._compressor = zlib.compressobj(compress_level)
+        self._parts: List[bytes] = []
+        self._emit('"' if kind == "text" else "[")
+
+    def write(self, text: str):
+        """追加一段文本（仅 text 字段）"""
+        # JSON 字符串的转义逐字符进行，分段转义后拼接与整体转义结果相同
+        self._emit(json.dumps(text, ensure_ascii=False)[1:-1])
+        self.count += len(text)
+
+    def append(self, item: Any):
+        """追加一个列表元素"""
+        self._emit((", " if self.count else "") + json.dumps(item, ensure_ascii=False, default=str))
+        self.count += 1
+
+    def finish(self) -> CompressedPayload:
+        self._emit('"' if self.kind == "text" else "]")
+        self._parts.append(self._compressor.flush())
+        return CompressedPayload(b"".join(self._parts))
+
+    def _emit(self, data: str):
+        self._parts.append(self._compressor.compress(data.encode("utf-8")))
+
+
+class DocumentStore:
+    """持久化文档存储（多线程、多进程共享同一数据库文件）"""
+
+    def __init__(self, db_path: str = None, compress_level: int = 6):
+        """
+        Args:
+            db_path: SQLite 数据库路径 (默认从环境变量 DOCUMENT_STORE_PATH 读取)
+            compress_level: zlib 压缩级别 (1-9)
+        """
+        self.db_path = db_path or os.getenv("DOCUMENT_STORE_PATH", "./data/documents.db")
+        self.compress_level = compress_level
+
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        # WAL 模式下读写互不阻塞，多个 worker 进程可同时访问
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                file_type TEXT,
+                file_path TEXT,
+                text_length INTEGER DEFAULT 0,
+                chunks_count INTEGER DEFAULT 0,
+                entities_count INTEGER DEFAULT 0,
+                relations_count INTEGER DEFAULT 0,
+                status TEXT,
+                created_at TEXT NOT NULL,
+                metadata TEXT,
+                processing TEXT,
+                content_hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_created ON documents (created_at);
+            CREATE INDEX IF NOT EXISTS idx_documents_file_name ON documents (file_name);
+            CREATE TABLE IF NOT EXISTS payloads (
+                document_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (document_id, kind)
+            ) WITHOUT ROWID;
+        """)
+        self._migrate()
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash)"
+        )
+        self._db.commit()
+
+        logger.info(f"DocumentStore ready at {self.db_path}: {self.count()} documents")
+
+    # ==================== 写入 ====================
+
+    def save(self, record: Dict[str, Any], payloads: Dict[str, Any] = None):
+        """
+        保存（或覆盖）文档
+
+        Args:
+            record: 文档元数据（document_id, file_name, 统计数量, metadata, processing 等）
+            payloads: 大字段 {"text": str, "chunks": [...], "entities": [...], "relations": [...]}，
+                值也可以是 PayloadWriter.finish() 返回的 CompressedPayload
+        """
+        row = {column: record.get(column) for column in _COLUMNS}
+        for column in _COUNT_COLUMNS:
+            row[column] = row[column] or 0
+        row["created_at"] = row["created_at"] or datetime.now().isoformat()
+        for column in _JSON_COLUMNS:
+            row[column] = json.dumps(record.get(column) or {}, ensure_ascii=False, default=str)
+
+        payload_rows = [
+            (
+                record["document_id"],
+                kind,
+                bytes(value) if isinstance(value, CompressedPayload) else self._compress(value)
+            )
+            for kind, value in (payloads or {}).items()
+            if kind in PAYLOAD_KINDS
+        ]
+
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{column}" for column in row)
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO documents ({columns}) VALUES ({placeholders})",
+                    row
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO payloads (document_id, kind, data) VALUES (?, ?, ?)",
+                    payload_rows
+                )
+
+    def delete(self, document_id: str) -> bool:
+        """删除文档及其大字段，返回文档是否存在"""
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM payloads WHERE document_id = ?", (document_id,))
+                cursor = self._db.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+        return cursor.rowcount > 0
+
+    def payload_writer(self, kind: str) -> PayloadWriter:
+        """创建增量写入大字段的 PayloadWriter（流式处理大文档时使用）"""
+        return PayloadWriter(kind, self.compress_level)
+
+    # ==================== 查询 ====================
+
+    def count(self) -> int:
+        """文档总数"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def exists(self, document_id: str) -> bool:
+        """文档是否存在"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """获取文档元数据（不含大字段）"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+        return self._to_record(row) if row else None
+
+    def list_documents(self, limit: int = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """按上传时间列出文档元数据（旧的在前）"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM documents ORDER BY created_at LIMIT ? OFFSET ?",
+                (limit if limit is not None else -1, offset)
+            ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def find_by_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """按文件内容哈希查找已处理的文档（用于上传去重）"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM documents WHERE content_hash = ? ORDER BY created_at LIMIT 1",
+                (content_hash,)
+            ).fetchone()
+        return self._to_record(row) if row else None
+
+    def get_payload(self, document_id: str, kind: str) -> Optional[Any]:
+        """
+        按需加载大字段
+
+        Args:
+            document_id: 文档ID
+            kind: text / chunks / entities / relations
+
+        Returns:
+            解压后的内容，不存在时返回 None
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM payloads WHERE document_id = ? AND kind = ?",
+                (document_id, kind)
+            ).fetchone()
+        return self._decompress(row[0]) if row else None
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._db.close()
+
+    # ==================== 内部实现 ====================
+
+    def _migrate(self):
+        """为旧版本数据库补充新增的列"""
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(documents)")}
+        if "content_hash" not in existing:
+            self._db.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT")
+
+    def _compress(self, value: Any) -> bytes:
+        data = json.dumps(value, ensure_ascii=False, default=str).encode("utf-8")
+        return zlib.compress(data, self.compress_level)
+
+    @staticmethod
+    def _decompress(data: bytes) -> Any:
+        return json.loads(zlib.decompress(data).decode("utf-8"))
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        for column in _JSON_COLUMNS:
+            record[column] = json.loads(record[column]) if record[column] else {}
+        return record
@@ -0,0 +1,91 @@
+"""
+Upload Size Limit
+上传大小限制中间件
+
+UploadFile 参数在进入接口之前已由 Starlette 完整接收并写入临时文件，接口内再检查
+文件大小时整个请求体已经传输完毕。本中间件在接收请求体时检查大小：
+    Content-Length 超出上限时不读取请求体，直接返回 413
+    未声明长度（分块传输）时累计接收的字节数，超出上限即停止读取并返回 413
+"""
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# multipart 请求体中分隔符、字段头等额外开销的余量（字节）
+MULTIPART_OVERHEAD = 65536
+
+
+class _BodyTooLarge(Exception):
+    """请求体超出上限（中止表单解析）"""
+
+
+class UploadSizeLimitMiddleware:
+    """限制 multipart/form-data 请求体的大小"""
+
+    def __init__(self, app: ASGIApp, max_upload_size: int):
+        """
+        Args:
+            app: 下层 ASGI 应用
+            max_upload_size: 上传文件的大小上限（字节），请求体上限再加上 multipart 开销的余量
+        """
+        self.app = app
+        self.max_upload_size = max_upload_size
+        self.max_body_size = max_upload_size + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self._is_multipart(scope):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = self._header(scope, b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message: Message):
+            nonlocal response_started
+            # 超出上限后下层应用的响应（表单解析失败的 400）由 413 代替
+            if not exceeded:
+                response_started = True
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            pass
+
+        if exceeded and not response_started:
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send):
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"文件过大，最大允许 {self.max_upload_size // (1024 * 1024)} MB"}
+        )
+        await response(scope, receive, send)
+
+    @staticmethod
+    def _header(scope: Scope, name: bytes):
+        for key, value in scope.get("headers", []):
+            if key.lower() == name:
+                return value.decode("latin-1")
+        return None
+
+    def _is_multipart(self, scope: Scope) -> bool:
+        content_type = self._header(scope, b"content-type") or ""
+        return content_type.lower().startswith("multipart/form-data")
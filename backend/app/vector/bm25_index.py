@@ -0,0 +1,209 @@
+"""
+BM25 Keyword Index
+关键词倒排索引 - 基于 SQLite 的增量 BM25 检索，支持中文（字符二元组）和英文分词
+"""
+import heapq
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+
+# 英文/数字按单词切分，连续汉字按字符二元组切分
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+|[\u4e00-\u9fff]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        词项列表，如 "深度学习 PyTorch" -> ["深度", "度学", "学习", "pytorch"]
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        run = match.group()
+        if '\u4e00' <= run[0] <= '\u9fff':
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class BM25Index:
+    """增量维护的 BM25 倒排索引"""
+
+    def __init__(self, db_path: str, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.db_path = db_path
+        self.k1 = k1
+        self.b = b
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        # WAL 模式下多个 worker 进程可以同时读写
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                document_id TEXT,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks (document_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id);
+        """)
+        self._db.commit()
+
+        logger.info(f"BM25Index ready at {db_path}: {self.count()} chunks")
+
+    def count(self) -> int:
+        """已索引的分块数"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, chunk_ids: List[str], texts: List[str], document_ids: List[Optional[str]]):
+        """
+        添加（或覆盖）分块
+
+        Args:
+            chunk_ids: 分块ID列表
+            texts: 分块文本列表
+            document_ids: 所属文档ID列表
+        """
+        chunk_rows = []
+        posting_rows = []
+        for chunk_id, text, document_id in zip(chunk_ids, texts, document_ids):
+            counts = Counter(tokenize(text))
+            chunk_rows.append((chunk_id, document_id, sum(counts.values())))
+            posting_rows.extend((term, chunk_id, tf) for term, tf in counts.items())
+
+        with self._lock:
+            with self._db:
+                self._delete_chunks(chunk_ids)
+                self._db.executemany(
+                    "INSERT INTO chunks (chunk_id, document_id, length) VALUES (?, ?, ?)",
+                    chunk_rows
+                )
+                self._db.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    posting_rows
+                )
+
+        logger.info(f"BM25 indexed {len(chunk_rows)} chunks, {len(posting_rows)} postings")
+
+    def delete_document(self, document_id: str) -> int:
+        """删除文档的所有分块，返回删除的分块数"""
+        with self._lock:
+            with self._db:
+                chunk_ids = [
+                    row[0] for row in
+                    self._db.execute("SELECT chunk_id FROM chunks WHERE document_id = ?", (document_id,))
+                ]
+                self._delete_chunks(chunk_ids)
+        return len(chunk_ids)
+
+    def delete_chunks(self, chunk_ids: List[str]):
+        """删除指定分块"""
+        with self._lock:
+            with self._db:
+                self._delete_chunks(chunk_ids)
+
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM postings")
+                self._db.execute("DELETE FROM chunks")
+
+    def _delete_chunks(self, chunk_ids: List[str]):
+        """删除分块及其倒排项（调用方需持有锁并处于事务中）"""
+        rows = [(chunk_id,) for chunk_id in chunk_ids]
+        self._db.executemany("DELETE FROM postings WHERE chunk_id = ?", rows)
+        self._db.executemany("DELETE FROM chunks WHERE chunk_id = ?", rows)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        document_id: str = None
+    ) -> List[Tuple[str, float]]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回数量
+            document_id: 限定文档ID
+
+        Returns:
+            [(chunk_id, bm25分数)]，按分数降序
+        """
+        query_terms = Counter(tokenize(query))
+        if not query_terms:
+            return []
+
+        placeholders = ",".join("?" * len(query_terms))
+        terms = list(query_terms)
+
+        with self._lock:
+            total_chunks, total_length = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks"
+            ).fetchone()
+            if not total_chunks:
+                return []
+
+            doc_freq = dict(self._db.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term",
+                terms
+            ).fetchall())
+
+            sql = (
+                "SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p "
+                f"JOIN chunks c ON c.chunk_id = p.chunk_id WHERE p.term IN ({placeholders})"
+            )
+            params = list(terms)
+            if document_id:
+                sql += " AND c.document_id = ?"
+                params.append(document_id)
+            postings = self._db.execute(sql, params).fetchall()
+
+        avg_length = total_length / total_chunks or 1.0
+        idf = {
+            term: math.log(1 + (total_chunks - df + 0.5) / (df + 0.5))
+            for term, df in doc_freq.items()
+        }
+
+        scores: Dict[str, float] = {}
+        k1, b = self.k1, self.b
+        for term, chunk_id, tf, length in postings:
+            norm = tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf[term] * norm * query_terms[term]
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,371 @@
+"""
+Embedding Backends
+Embedding 推理后端 - PyTorch (SentenceTransformer) 或 ONNX Runtime（可选 int8 动态量化）
+
+ONNX 后端首次使用时从 SentenceTransformer 模型导出 Transformer 部分，
+池化与归一化在 numpy 中完成，接口与 SentenceTransformer 一致（encode /
+get_sentence_embedding_dimension / tokenizer / max_seq_length），可直接替换
+
+用法（导出、一致性检查与吞吐量对比）:
+    python embedding_benchmark.py --model all-MiniLM-L6-v2 --backends onnx,onnx-int8
+"""
+import argparse
+import inspect
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+SUPPORTED_POOLING = ("mean", "cls", "max", "mean_sqrt_len_tokens")
+
+
+# 主进程在 fork worker 之前预加载的模型（按模型名和后端），worker 以写时复制方式共享
+_PRELOADED: Dict[Tuple[str, str], Any] = {}
+
+
+def load_embedding_model(model_name: str, backend: str = "torch", onnx_dir: str = None):
+    """
+    加载指定后端的 Embedding 模型（已预加载的直接返回）
+
+    Args:
+        model_name: SentenceTransformer 模型名称
+        backend: torch / onnx / onnx-int8
+        onnx_dir: ONNX 模型目录 (默认从环境变量 EMBEDDING_ONNX_DIR 读取)
+
+    Returns:
+        提供 SentenceTransformer 接口的模型对象
+    """
+    preloaded = _PRELOADED.get((model_name, backend))
+    if preloaded is not None:
+        return preloaded
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbeddingModel.load(model_name, quantize=backend == "onnx-int8", onnx_dir=onnx_dir)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def preload_embedding_model(model_name: str, backend: str = "torch", onnx_dir: str = None):
+    """
+    在 fork worker 进程之前预加载模型
+
+    PyTorch 模型加载到 _PRELOADED 中供 worker 复用；ONNX Runtime 会话的线程池
+    不能跨 fork 使用，只提前完成导出和量化，会话在各 worker 中创建
+
+    Args:
+        model_name: SentenceTransformer 模型名称
+        backend: torch / onnx / onnx-int8
+        onnx_dir: ONNX 模型目录
+    """
+    if backend == "torch":
+        _PRELOADED[(model_name, backend)] = load_embedding_model(model_name, backend)
+    elif backend in ("onnx", "onnx-int8"):
+        OnnxEmbeddingModel.prepare(model_name, quantize=backend == "onnx-int8", onnx_dir=onnx_dir)
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+class OnnxEmbeddingModel:
+    """基于 ONNX Runtime 的 SentenceTransformer 替代实现"""
+
+    def __init__(self, model_dir: str, quantize: bool = False, num_threads: int = None):
+        """
+        Args:
+            model_dir: export() 生成的目录（model.onnx、分词器和 embedding_config.json）
+            quantize: 使用 int8 动态量化模型（不存在时自动生成）
+            num_threads: 推理线程数 (默认从环境变量 ONNX_THREADS 读取，0 为 ONNX Runtime 默认值)
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_dir = Path(model_dir)
+        with open(self.model_dir / "embedding_config.json", encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        model_path = self.model_dir / "model.onnx"
+        if quantize:
+            model_path = self._quantized_path(model_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = num_threads if num_threads is not None else int(os.getenv("ONNX_THREADS", "0"))
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.model_dir))
+        self.max_seq_length = self.config["max_seq_length"]
+        self.input_names = self.config["inputs"]
+        self.quantized = quantize
+
+        logger.info(f"OnnxEmbeddingModel loaded: {model_path} (pooling={self.config['pooling']})")
+
+    @classmethod
+    def load(cls, model_name: str, quantize: bool = False, onnx_dir: str = None) -> "OnnxEmbeddingModel":
+        """加载已导出的模型，不存在时先导出"""
+        return cls(str(cls.prepare(model_name, quantize, onnx_dir)), quantize=quantize)
+
+    @classmethod
+    def prepare(cls, model_name: str, quantize: bool = False, onnx_dir: str = None) -> Path:
+        """导出模型（以及 int8 量化版本），已存在时跳过，返回模型目录"""
+        base_dir = Path(onnx_dir or os.getenv("EMBEDDING_ONNX_DIR", "./data/onnx"))
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in model_name)
+        model_dir = base_dir / safe_name
+        if not (model_dir / "embedding_config.json").exists():
+            cls.export(model_name, str(model_dir))
+        if quantize:
+            cls._quantized_path(model_dir / "model.onnx")
+        return model_dir
+
+    @staticmethod
+    def export(model_name: str, output_dir: str) -> Path:
+        """
+        将 SentenceTransformer 模型的 Transformer 部分导出为 ONNX
+
+        Args:
+            model_name: SentenceTransformer 模型名称
+            output_dir: 输出目录
+
+        Returns:
+            model.onnx 路径
+        """
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        output = Path(output_dir)
+        output.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Exporting {model_name} to ONNX at {output}...")
+
+        st_model = SentenceTransformer(model_name, device="cpu")
+        transformer = st_model[0]
+        pooling = next((module for module in st_model if type(module).__name__ == "Pooling"), None)
+        pooling_mode = pooling.get_pooling_mode_str() if pooling else "mean"
+        if pooling_mode not in SUPPORTED_POOLING:
+            raise ValueError(f"Pooling mode {pooling_mode} is not supported by the ONNX backend")
+
+        tokenizer = transformer.tokenizer
+        sample = tokenizer(["ONNX export 示例文本"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+        class _Encoder(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *inputs):
+                return self.model(**dict(zip(input_names, inputs)))[0]
+
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        export_kwargs = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            # 新版本 PyTorch 默认使用 dynamo 导出器（依赖 onnxscript），这里固定使用 TorchScript 导出器
+            export_kwargs["dynamo"] = False
+
+        model_path = output / "model.onnx"
+        with torch.no_grad():
+            torch.onnx.export(
+                _Encoder(transformer.auto_model.eval()),
+                tuple(sample[name] for name in input_names),
+                str(model_path),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                **export_kwargs
+            )
+
+        tokenizer.save_pretrained(str(output))
+        with open(output / "embedding_config.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "model_name": model_name,
+                "max_seq_length": st_model.max_seq_length,
+                "dimension": st_model.get_sentence_embedding_dimension(),
+                "pooling": pooling_mode,
+                "normalize": any(type(module).__name__ == "Normalize" for module in st_model),
+                "inputs": input_names
+            }, f, ensure_ascii=False, indent=2)
+
+        logger.info(f"✓ Exported {model_name} ({pooling_mode} pooling) to {model_path}")
+        return model_path
+
+    @staticmethod
+    def _quantized_path(model_path: Path) -> Path:
+        """int8 动态量化模型路径，不存在时生成"""
+        quantized = model_path.with_name("model.int8.onnx")
+        if not quantized.exists():
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(str(model_path), str(quantized), weight_type=QuantType.QInt8)
+            logger.info(f"✓ Quantized {model_path.name} to {quantized.name}")
+        return quantized
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def encode(
+        self,
+        sentences: List[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True,
+        **kwargs
+    ) -> np.ndarray:
+        """
+        计算句向量（按长度排序后分批，减少填充）
+
+        Returns:
+            (len(sentences), dimension) 的 float32 矩阵
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = np.zeros((len(texts), self.config["dimension"]), dtype=np.float32)
+
+        for start in range(0, len(texts), batch_size):
+            indices = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in indices],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+            embeddings[indices] = self._pool(hidden, feed["attention_mask"])
+
+        return embeddings[0] if single else embeddings
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        mode = self.config["pooling"]
+        mask = attention_mask[..., None].astype(np.float32)
+
+        if mode == "cls":
+            pooled = hidden[:, 0]
+        elif mode == "max":
+            pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+        else:
+            summed = (hidden * mask).sum(axis=1)
+            lengths = np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled = summed / (np.sqrt(lengths) if mode == "mean_sqrt_len_tokens" else lengths)
+
+        if self.config["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+
+# ==================== 一致性检查与吞吐量测试 ====================
+
+SAMPLE_TEXTS = [
+    "机器学习是人工智能的一个重要分支，它使计算机能够在没有明确编程的情况下学习。",
+    "深度学习使用多层神经网络从大规模数据中学习表示。",
+    "知识图谱以实体和关系的形式组织结构化知识。",
+    "清华大学与北京大学在自然语言处理领域开展了合作研究。",
+    "Vector databases store embeddings and support approximate nearest neighbour search.",
+    "The quick brown fox jumps over the lazy dog.",
+    "Retrieval-augmented generation combines search results with a language model.",
+    "2023年发布的模型在多个基准测试上取得了显著提升。",
+    "Docker 和 Kubernetes 常用于部署微服务架构。",
+    "短句",
+]
+
+
+def parity_check(reference, candidate, texts: List[str], batch_size: int = 32) -> Dict[str, float]:
+    """
+    比较两个后端的向量（余弦相似度）
+
+    Returns:
+        {"mean_cosine", "min_cosine"}
+    """
+    a = np.asarray(reference.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+    b = np.asarray(candidate.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+    cosine = (a * b).sum(axis=1) / np.clip(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12, None)
+    return {"mean_cosine": float(cosine.mean()), "min_cosine": float(cosine.min())}
+
+
+def benchmark(model, texts: List[str], batch_size: int = 32, rounds: int = 3) -> Dict[str, float]:
+    """
+    测量批量编码吞吐量（先预热一次，取多轮中最快的一轮）
+
+    Returns:
+        {"texts_per_second", "ms_per_batch", "single_query_ms"}
+    """
+    model.encode(texts[:batch_size], batch_size=batch_size)
+
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        model.encode(texts, batch_size=batch_size)
+        best = min(best, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for text in texts[:20]:
+        model.encode([text], batch_size=1)
+    single = (time.perf_counter() - start) / min(len(texts), 20)
+
+    batches = max(1, -(-len(texts) // batch_size))
+    return {
+        "texts_per_second": round(len(texts) / best, 1),
+        "ms_per_batch": round(best / batches * 1000, 2),
+        "single_query_ms": round(single * 1000, 2)
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="导出 ONNX Embedding 模型并与 PyTorch 模型比较一致性和吞吐量")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="SentenceTransformer 模型名称")
+    parser.add_argument("--backends", default="onnx,onnx-int8", help="待比较的后端（逗号分隔）")
+    parser.add_argument("--texts-file", default=None, help="测试文本文件（每行一条，默认使用内置样例）")
+    parser.add_argument("--samples", type=int, default=512, help="吞吐量测试的文本数")
+    parser.add_argument("--batch-size", type=int, default=32, help="批大小")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="一致性检查的最低余弦相似度")
+    parser.add_argument("--onnx-dir", default=None, help="ONNX 模型目录（默认 ./data/onnx）")
+    args = parser.parse_args(argv)
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = [name for name in backends if name not in BACKENDS]
+    if unknown:
+        parser.error(f"未知后端: {', '.join(unknown)}（可选 {', '.join(BACKENDS)}）")
+
+    if args.texts_file:
+        with open(args.texts_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = SAMPLE_TEXTS
+    bench_texts = (texts * (args.samples // len(texts) + 1))[:args.samples]
+
+    reference = load_embedding_model(args.model, "torch")
+    results: Dict[str, Dict[str, Any]] = {"torch": benchmark(reference, bench_texts, args.batch_size)}
+
+    passed = True
+    for backend in backends:
+        model = load_embedding_model(args.model, backend, onnx_dir=args.onnx_dir)
+        parity = parity_check(reference, model, texts, args.batch_size)
+        ok = parity["min_cosine"] >= args.min_cosine
+        passed = passed and ok
+        results[backend] = {**benchmark(model, bench_texts, args.batch_size), **parity, "parity_ok": ok}
+
+    baseline = results["torch"]["texts_per_second"]
+    print("=" * 78)
+    print(f"{'backend':<12}{'texts/s':>10}{'speedup':>9}{'ms/batch':>10}{'query ms':>10}{'mean cos':>10}{'min cos':>10}  parity")
+    for backend, stats in results.items():
+        print(
+            f"{backend:<12}{stats['texts_per_second']:>10}{stats['texts_per_second'] / baseline:>8.2f}x"
+            f"{stats['ms_per_batch']:>10}{stats['single_query_ms']:>10}"
+            f"{stats.get('mean_cosine', 1.0):>10.4f}{stats.get('min_cosine', 1.0):>10.4f}  "
+            f"{'-' if backend == 'torch' else ('OK' if stats['parity_ok'] else 'FAIL')}"
+        )
+    print("=" * 78)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Query Embedding Batcher
+查询向量微批处理 - 将并发请求的查询文本合并为一次模型前向计算
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+
+class QueryEmbeddingBatcher:
+    """
+    查询向量的动态微批处理
+
+    调用方线程提交单条查询文本后阻塞等待；后台线程取出第一条请求后，
+    在 max_wait_ms 内（或攒满 max_batch_size 条时）收集其他并发请求，
+    合并为一批调用 encode_fn，再把各自的向量分发回调用方。
+    模型执行期间到达的请求会自然进入下一批，负载越高批次越大
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], List[List[float]]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0
+    ):
+        """
+        Args:
+            encode_fn: 批量编码函数（文本列表 -> 向量列表，失败时返回空列表）
+            max_batch_size: 每批最多合并的请求数
+            max_wait_ms: 收到第一条请求后等待其他请求的最长时间（毫秒）
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.requests = 0
+        self.batches = 0
+
+        self._worker = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+        self._worker.start()
+        logger.info(f"QueryEmbeddingBatcher started: max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms}")
+
+    def embed(self, text: str, timeout: float = None) -> Optional[List[float]]:
+        """
+        计算单条查询的向量（与其他并发请求合并执行）
+
+        Args:
+            text: 查询文本
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            向量，编码失败或批处理已关闭时返回 None
+        """
+        return self._submit(text).result(timeout=timeout)
+
+    def embed_many(self, texts: List[str], timeout: float = None) -> List[Optional[List[float]]]:
+        """
+        计算多条文本的向量（逐条入队，与其他调用方的请求一起按批执行）
+
+        Args:
+            texts: 文本列表
+            timeout: 每条文本的最长等待时间（秒）
+
+        Returns:
+            与输入顺序一致的向量列表，编码失败的位置为 None
+        """
+        futures = [self._submit(text) for text in texts]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def _submit(self, text: str) -> Future:
+        """请求入队；关闭后不再入队，直接以 None（编码失败）结束"""
+        future: Future = Future()
+        with self._lock:
+            if not self._closed:
+                self._queue.put((text, future))
+                return future
+        future.set_result(None)
+        return future
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch: List[tuple]):
+        """编码一批请求（相同文本只计算一次）并设置各自的结果"""
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            embeddings = self.encode_fn(texts)
+            vectors = dict(zip(texts, embeddings)) if len(embeddings) == len(texts) else {}
+        except Exception as e:
+            logger.error(f"Batched query embedding failed: {str(e)}")
+            vectors = {}
+
+        for text, future in batch:
+            future.set_result(vectors.get(text))
+
+        with self._lock:
+            self.requests += len(batch)
+            self.batches += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """批处理统计"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0
+            }
+
+    def close(self):
+        """
+        停止后台线程（已排队的请求处理完后退出）
+
+        关闭后提交的请求直接返回 None；后台线程未能在超时内退出时，
+        仍在排队的请求也以 None 结束，调用方不会一直阻塞
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join(timeout=5)
+
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_result(None)
+        # 后台线程仍在处理当前批次时，处理完后需要取到退出标记
+        self._queue.put(None)
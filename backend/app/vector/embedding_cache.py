@@ -0,0 +1,266 @@
+"""
+Embedding Cache
+向量缓存 - 以文本内容哈希为键，持久化保存已计算过的 embedding
+
+向量保存在内存映射的 float32 矩阵中（每个槽位一行），
+哈希到槽位的映射和最近使用时间保存在 SQLite 中，容量满时按 LRU 淘汰。
+槽位分配在 SQLite 事务中完成，多个 worker 进程可以共享同一个缓存目录
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Any
+
+import numpy as np
+from loguru import logger
+
+
+class EmbeddingCache:
+    """
+    基于内容哈希的持久化 embedding 缓存（多线程、多进程安全）
+
+    写入分两步：先在事务中删除被淘汰条目的映射并预留槽位（ready=0），
+    再写入向量并标记 ready=1。读取时在读出向量后再次确认映射仍然有效，
+    因此不会读到被其他进程淘汰后改写的槽位
+    """
+
+    # 预留后超过该时间（秒）仍未写完的槽位视为写入进程已退出，可以被淘汰
+    RESERVATION_TIMEOUT = 60
+
+    def __init__(
+        self,
+        cache_dir: str,
+        model_name: str,
+        dim: int,
+        capacity: int = None
+    ):
+        """
+        Args:
+            cache_dir: 缓存根目录（每个模型一个子目录）
+            model_name: Embedding模型名称（不同模型的向量互不复用）
+            dim: 向量维度
+            capacity: 最多缓存的向量数 (默认从环境变量 EMBEDDING_CACHE_SIZE 读取)
+        """
+        self.model_name = model_name
+        self.dim = dim
+        self.capacity = capacity or int(os.getenv("EMBEDDING_CACHE_SIZE", "100000"))
+
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in model_name)
+        self.cache_dir = Path(cache_dir) / safe_name
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(
+            str(self.cache_dir / "index.db"),
+            check_same_thread=False,
+            timeout=30,
+            isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "hash TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(entries)")}
+        if "ready" not in columns:
+            self._db.execute("ALTER TABLE entries ADD COLUMN ready INTEGER NOT NULL DEFAULT 1")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)")
+
+        self._open_vectors()
+
+        logger.info(
+            f"EmbeddingCache ready: {self.size()}/{self.capacity} vectors "
+            f"(dim={dim}) at {self.cache_dir}"
+        )
+
+    def _open_vectors(self):
+        """打开（或重建）内存映射的向量矩阵"""
+        path = self.cache_dir / "vectors.npy"
+        expected = {"dim": str(self.dim), "capacity": str(self.capacity)}
+
+        # 写锁保证多个进程同时启动时只有一个进程重建
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+            if path.exists() and all(meta.get(k) == v for k, v in expected.items()):
+                self._vectors = np.lib.format.open_memmap(str(path), mode="r+")
+                if "next_slot" not in meta:
+                    # 旧版本缓存：槽位从 0 开始连续分配
+                    next_slot = self._db.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM entries").fetchone()[0]
+                    self._db.execute("INSERT INTO meta (key, value) VALUES ('next_slot', ?)", (str(next_slot),))
+                self._db.execute("COMMIT")
+                return
+
+            # 维度或容量变化后旧缓存无法复用，清空重建
+            if path.exists():
+                logger.warning(f"Embedding cache layout changed, rebuilding {path}")
+            self._vectors = np.lib.format.open_memmap(
+                str(path), mode="w+", dtype=np.float32, shape=(self.capacity, self.dim)
+            )
+            self._db.execute("DELETE FROM entries")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [*expected.items(), ("next_slot", "0")]
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        """文本内容哈希"""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, int]:
+        """查询已写完的条目的槽位（调用方需持有锁）"""
+        slots: Dict[str, int] = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            slots.update(self._db.execute(
+                f"SELECT hash, slot FROM entries WHERE ready = 1 AND hash IN ({placeholders})",
+                batch
+            ).fetchall())
+        return slots
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        批量查询缓存
+
+        Args:
+            keys: 内容哈希列表
+
+        Returns:
+            命中的 {哈希: 向量}
+        """
+        unique = list(dict.fromkeys(keys))
+
+        with self._lock:
+            slots = self._lookup(unique)
+            vectors = {key: self._vectors[slot].copy() for key, slot in slots.items()}
+
+            # 读出向量后再确认映射未被淘汰（淘汰方先提交映射的删除，再改写槽位）
+            if vectors:
+                current = self._lookup(list(vectors))
+                vectors = {key: vector for key, vector in vectors.items() if current.get(key) == slots[key]}
+
+            found = {key: vector.tolist() for key, vector in vectors.items()}
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+
+            if found:
+                self._execute_many(
+                    "UPDATE entries SET last_used = ? WHERE hash = ?",
+                    [(time.time(), key) for key in found]
+                )
+
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """
+        批量写入缓存（容量满时淘汰最久未使用的条目）
+
+        Args:
+            items: {哈希: 向量}
+        """
+        if not items:
+            return
+
+        with self._lock:
+            slots = self._reserve(list(items))
+            if not slots:
+                return
+
+            for key, slot in slots.items():
+                self._vectors[slot] = np.asarray(items[key], dtype=np.float32)
+            self._vectors.flush()
+
+            self._execute_many(
+                "UPDATE entries SET ready = 1, last_used = ? WHERE hash = ? AND slot = ?",
+                [(time.time(), key, slot) for key, slot in slots.items()]
+            )
+
+    def _execute_many(self, sql: str, rows: List[tuple]):
+        """在一个写事务中执行（调用方需持有锁）"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.executemany(sql, rows)
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _reserve(self, keys: List[str]) -> Dict[str, int]:
+        """
+        为尚未缓存的哈希预留槽位（调用方需持有锁）
+
+        Returns:
+            {哈希: 槽位}，已被缓存（或正由其他进程写入）的哈希不在其中
+        """
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            existing = set()
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(row[0] for row in self._db.execute(
+                    f"SELECT hash FROM entries WHERE hash IN ({placeholders})", batch
+                ))
+            new_keys = [key for key in dict.fromkeys(keys) if key not in existing][-self.capacity:]
+
+            next_slot = int(self._db.execute("SELECT value FROM meta WHERE key = 'next_slot'").fetchone()[0])
+            fresh = min(len(new_keys), self.capacity - next_slot)
+            slots = list(range(next_slot, next_slot + fresh))
+
+            if len(slots) < len(new_keys):
+                evicted = self._db.execute(
+                    "SELECT hash, slot FROM entries WHERE ready = 1 OR last_used < ? "
+                    "ORDER BY last_used LIMIT ?",
+                    (now - self.RESERVATION_TIMEOUT, len(new_keys) - len(slots))
+                ).fetchall()
+                self._db.executemany("DELETE FROM entries WHERE hash = ?", [(key,) for key, _ in evicted])
+                slots.extend(slot for _, slot in evicted)
+
+            reserved = dict(zip(new_keys, slots))
+            self._db.executemany(
+                "INSERT INTO entries (hash, slot, last_used, ready) VALUES (?, ?, ?, 0)",
+                [(key, slot, now) for key, slot in reserved.items()]
+            )
+            self._db.execute("UPDATE meta SET value = ? WHERE key = 'next_slot'", (str(next_slot + fresh),))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+        return reserved
+
+    def size(self) -> int:
+        """已缓存的向量数"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries WHERE ready = 1").fetchone()[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计信息（命中率为本进程的统计）"""
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size(),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self):
+        """刷新并关闭缓存文件"""
+        with self._lock:
+            self._vectors.flush()
+            self._db.close()
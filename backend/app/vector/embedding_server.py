@@ -0,0 +1,463 @@
+"""
+Embedding Server
+本地向量化服务 - 独立进程持有 Embedding 模型和推理线程设置，
+通过 Unix socket 接收所有 API worker 和批量导入进程的请求并合并为批次计算，
+向量经由客户端提供的共享内存缓冲区返回
+
+用法:
+    python embedding_server.py --socket ./data/embedding.sock
+    # API 进程中设置 EMBEDDING_SERVER_SOCKET=./data/embedding.sock
+
+协议（每条消息为 4 字节大端长度 + UTF-8 JSON）:
+    {"op": "hello"}  -> {"model", "backend", "dim", "max_seq_length", "tokenizer_path"}
+    {"op": "encode", "texts": [...], "shm": 共享内存名称}  -> {"count", "dim"}（向量写入共享内存）
+    {"op": "stats"}  -> 批处理统计
+    出错时返回 {"error": "..."}
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from app.vector.embedding_backends import load_embedding_model
+from app.vector.embedding_batcher import QueryEmbeddingBatcher
+
+
+DEFAULT_SOCKET_PATH = "./data/embedding.sock"
+
+_HEADER = struct.Struct(">I")
+
+
+def _send(sock: socket.socket, message: Dict[str, Any]):
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    parts = []
+    while size:
+        part = sock.recv(min(size, 1 << 20))
+        if not part:
+            return None
+        parts.append(part)
+        size -= len(part)
+    return b"".join(parts)
+
+
+def _recv(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """读取一条消息，连接关闭时返回 None"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, _HEADER.unpack(header)[0])
+    return None if data is None else json.loads(data.decode("utf-8"))
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """附加到客户端创建的共享内存（由客户端负责释放，服务端不登记到 resource_tracker）"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13 之前没有 track 参数，附加时也会登记，服务退出时会误删客户端的缓冲区
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+# ==================== 服务端 ====================
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """一个客户端连接（可连续发送多个请求）"""
+
+    server: "EmbeddingServer"
+
+    def handle(self):
+        shm: Optional[shared_memory.SharedMemory] = None
+        try:
+            while True:
+                try:
+                    message = _recv(self.request)
+                except (OSError, ValueError):
+                    break
+                if message is None:
+                    break
+
+                op = message.get("op")
+                try:
+                    if op == "hello":
+                        reply = self.server.info
+                    elif op == "stats":
+                        reply = self.server.get_stats()
+                    elif op == "encode":
+                        if shm is None or shm.name != message["shm"]:
+                            if shm is not None:
+                                shm.close()
+                            shm = _attach_shared_memory(message["shm"])
+                        reply = self.server.encode_into(message["texts"], shm)
+                    else:
+                        reply = {"error": f"Unknown op: {op}"}
+                except Exception as e:
+                    logger.error(f"Embedding request failed: {str(e)}")
+                    reply = {"error": str(e)}
+                _send(self.request, reply)
+        finally:
+            if shm is not None:
+                shm.close()
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    向量化服务
+
+    每个连接一个处理线程；各连接的文本逐条进入同一个批处理队列，
+    由单个推理线程按批调用模型，推理线程数由本进程统一设置
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: str,
+        model_name: str = None,
+        backend: str = "torch",
+        threads: int = 0,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0
+    ):
+        """
+        Args:
+            socket_path: Unix socket 路径
+            model_name: 模型名称（默认依次尝试 VectorStoreManager 的备选模型）
+            backend: torch / onnx / onnx-int8
+            threads: 推理线程数（0 为使用全部核心）
+            max_batch_size: 每批最多合并的文本数
+            max_wait_ms: 收到第一条文本后等待其他请求的最长时间（毫秒）
+        """
+        from app.vector.vector_store import EMBEDDING_MODEL_FALLBACKS
+
+        threads = threads or os.cpu_count() or 1
+        os.environ["ONNX_THREADS"] = str(threads)
+
+        self.model = None
+        for candidate in ([model_name] if model_name else EMBEDDING_MODEL_FALLBACKS):
+            try:
+                self.model = load_embedding_model(candidate, backend)
+                model_name = candidate
+                break
+            except Exception as e:
+                logger.warning(f"Failed to load {candidate} ({backend}): {str(e)}")
+        if self.model is None:
+            raise RuntimeError("No embedding model could be loaded")
+
+        if backend == "torch":
+            import torch
+            torch.set_num_threads(threads)
+
+        tokenizer = getattr(self.model, "tokenizer", None)
+        self.info = {
+            "model": model_name,
+            "backend": backend,
+            "dim": self.model.get_sentence_embedding_dimension(),
+            "max_seq_length": self.model.max_seq_length,
+            "tokenizer_path": getattr(tokenizer, "name_or_path", None)
+        }
+        self.max_batch_size = max_batch_size
+        self.batcher = QueryEmbeddingBatcher(self._encode, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+        self.socket_path = socket_path
+        self._remove_stale_socket()
+        Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(socket_path, _RequestHandler)
+        os.chmod(socket_path, 0o600)
+
+        logger.info(
+            f"EmbeddingServer listening on {socket_path}: {model_name} ({backend}), "
+            f"threads={threads}, max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms}"
+        )
+
+    def _remove_stale_socket(self):
+        """删除上次异常退出遗留的 socket 文件（已有服务在监听时报错）"""
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError(f"Another embedding server is already listening on {self.socket_path}")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.max_batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True
+        )
+
+    def encode_into(self, texts: List[str], shm: shared_memory.SharedMemory) -> Dict[str, Any]:
+        """计算向量并写入客户端的共享内存缓冲区"""
+        dim = self.info["dim"]
+        if len(texts) * dim * 4 > shm.size:
+            return {"error": f"Shared buffer too small for {len(texts)} vectors"}
+
+        vectors = self.batcher.embed_many(texts)
+        if any(vector is None for vector in vectors):
+            return {"error": "Embedding failed"}
+
+        out = np.ndarray((len(texts), dim), dtype=np.float32, buffer=shm.buf)
+        if texts:
+            out[:] = np.asarray(vectors, dtype=np.float32)
+        del out
+        return {"count": len(texts), "dim": dim}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.info, **self.batcher.get_stats()}
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+# ==================== 客户端 ====================
+
+class EmbeddingServerError(RuntimeError):
+    """服务端返回的错误（如服务端模型推理失败）"""
+
+
+class _ServerConnection:
+    """到向量化服务的一个连接及其共享内存缓冲区"""
+
+    def __init__(self, socket_path: str, timeout: float):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self.buffer: Optional[shared_memory.SharedMemory] = None
+
+    def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        _send(self.sock, message)
+        reply = _recv(self.sock)
+        if reply is None:
+            raise ConnectionError("Embedding server closed the connection")
+        if "error" in reply:
+            raise EmbeddingServerError(reply["error"])
+        return reply
+
+    def encode(self, texts: List[str], dim: int) -> np.ndarray:
+        size = max(len(texts) * dim * 4, 1)
+        if self.buffer is None or self.buffer.size < size:
+            self._release_buffer()
+            # 按 2 的幂分配，避免请求大小变化时频繁重建
+            self.buffer = shared_memory.SharedMemory(create=True, size=1 << (size - 1).bit_length())
+
+        reply = self.request({"op": "encode", "texts": texts, "shm": self.buffer.name})
+        view = np.ndarray((reply["count"], dim), dtype=np.float32, buffer=self.buffer.buf)
+        vectors = view.copy()
+        del view
+        return vectors
+
+    def _release_buffer(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer.unlink()
+            self.buffer = None
+
+    def close(self):
+        self.sock.close()
+        self._release_buffer()
+
+
+class RemoteEmbeddingModel:
+    """
+    向量化服务的客户端（提供 SentenceTransformer 的 encode 接口）
+
+    连接可被多个线程并发使用（每个请求占用池中的一个连接）；服务不可用或返回错误时
+    在本进程加载同一模型继续计算，每隔 retry_interval 秒重新尝试连接服务
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        timeout: float = None,
+        retry_interval: float = 30.0,
+        fallback: Callable[[str, str], Any] = None
+    ):
+        """
+        Args:
+            socket_path: 服务的 Unix socket 路径
+            timeout: 单个请求的超时（秒，默认从环境变量 EMBEDDING_SERVER_TIMEOUT 读取）
+            retry_interval: 退回本进程计算后重新连接服务的间隔（秒）
+            fallback: 本进程加载模型的函数 (model_name, backend) -> model
+        """
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError("Unix sockets are not supported on this platform")
+
+        self.socket_path = socket_path
+        self.timeout = timeout or float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "60"))
+        self.retry_interval = retry_interval
+        self.fallback = fallback or load_embedding_model
+
+        self._idle: List[_ServerConnection] = []
+        self._lock = threading.Lock()
+        self._local = None
+        self._failed_at: Optional[float] = None
+        self._tokenizer = None
+
+        connection = _ServerConnection(socket_path, self.timeout)
+        self.info = connection.request({"op": "hello"})
+        self._idle.append(connection)
+
+        self.model_name = self.info["model"]
+        self.backend = self.info["backend"]
+        self.max_seq_length = self.info["max_seq_length"]
+
+    @property
+    def tokenizer(self):
+        """服务端模型的分词器（按需在本进程加载，用于按 token 分段）"""
+        if self._tokenizer is None and self.info.get("tokenizer_path"):
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.info["tokenizer_path"])
+        return self._tokenizer
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.info["dim"]
+
+    def encode(
+        self,
+        sentences: List[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        **kwargs
+    ) -> np.ndarray:
+        """
+        计算句向量（批大小由服务端决定）
+
+        Returns:
+            (len(sentences), dimension) 的 float32 矩阵
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        if self._use_server():
+            try:
+                embeddings = self._request(texts)
+            except (OSError, EmbeddingServerError) as e:
+                logger.warning(f"Embedding server request failed, encoding in-process: {str(e)}")
+                self._failed_at = time.monotonic()
+                embeddings = self._encode_locally(texts, batch_size)
+        else:
+            embeddings = self._encode_locally(texts, batch_size)
+
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, 1e-12)
+        return embeddings[0] if single else embeddings
+
+    def _use_server(self) -> bool:
+        return self._failed_at is None or time.monotonic() - self._failed_at >= self.retry_interval
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is None:
+            connection = _ServerConnection(self.socket_path, self.timeout)
+
+        try:
+            embeddings = connection.encode(texts, self.info["dim"])
+        except BaseException:
+            connection.close()
+            raise
+
+        self._failed_at = None
+        with self._lock:
+            self._idle.append(connection)
+        return embeddings
+
+    def _encode_locally(self, texts: List[str], batch_size: int) -> np.ndarray:
+        with self._lock:
+            if self._local is None:
+                try:
+                    self._local = self.fallback(self.model_name, self.backend)
+                except Exception as e:
+                    logger.warning(f"In-process {self.backend} backend unavailable, using torch: {str(e)}")
+                    self._local = self.fallback(self.model_name, "torch")
+        return self._local.encode(texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """服务端的批处理统计（服务不可用时返回空字典）"""
+        try:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            connection = connection or _ServerConnection(self.socket_path, self.timeout)
+            stats = connection.request({"op": "stats"})
+            with self._lock:
+                self._idle.append(connection)
+            return stats
+        except Exception:
+            return {}
+
+    def close(self):
+        """关闭连接并释放共享内存"""
+        with self._lock:
+            connections, self._idle = self._idle, []
+        for connection in connections:
+            connection.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="本地向量化服务（Unix socket + 共享内存）")
+    parser.add_argument(
+        "--socket", default=os.getenv("EMBEDDING_SERVER_SOCKET", DEFAULT_SOCKET_PATH),
+        help="Unix socket 路径"
+    )
+    parser.add_argument("--model", default=None, help="SentenceTransformer 模型名称（默认 all-MiniLM-L6-v2）")
+    parser.add_argument(
+        "--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"),
+        choices=("torch", "onnx", "onnx-int8"), help="推理后端"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=int(os.getenv("EMBEDDING_SERVER_THREADS", "0")),
+        help="推理线程数（0 为全部核心）"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=int(os.getenv("EMBEDDING_SERVER_BATCH_SIZE", "64")),
+        help="每批最多合并的文本数"
+    )
+    parser.add_argument(
+        "--wait-ms", type=float, default=float(os.getenv("EMBEDDING_SERVER_WAIT_MS", "2")),
+        help="等待其他请求合并的最长时间（毫秒）"
+    )
+    args = parser.parse_args(argv)
+
+    server = EmbeddingServer(
+        args.socket,
+        model_name=args.model,
+        backend=args.backend,
+        threads=args.threads,
+        max_batch_size=args.batch_size,
+        max_wait_ms=args.wait_ms
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Embedding server interrupted")
+    finally:
+        server.server_close()
+    return 0
@@ -0,0 +1,937 @@
+"""
+Vector Index Backends
+向量索引后端 - ChromaDB 或进程内的内存映射矩阵索引（精确 top-k，可选 HNSW 图）
+
+VectorStoreManager 只通过 VectorIndex 接口读写向量（add / query / get / update /
+delete / count / clear），由环境变量 VECTOR_BACKEND 选择实现:
+    chroma  ChromaDB 集合（默认）
+    flat    向量保存在连续的 float32/float16 内存映射文件中，numpy 分块计算距离；
+            文本和元数据保存在旁路 SQLite 索引中，按 document_id 过滤只读取该文档的行。
+            VECTOR_INDEX_HNSW=true 且安装了 hnswlib 时，不带过滤条件的查询走 HNSW 近似检索
+
+两种实现的距离都是平方 L2 距离，search 的分数口径（1 - distance）不随后端改变
+
+用法（同一批向量在各后端上的写入吞吐、查询延迟和召回率对比）:
+    python vector_index_benchmark.py --backends chroma,flat,flat-f16,hnsw --vectors 100000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+VECTOR_BACKENDS = ("chroma", "flat")
+
+# 对比脚本中的索引配置：flat-f16 为 float16 矩阵，hnsw 为 float32 矩阵 + HNSW 图
+BENCHMARK_VARIANTS = ("chroma", "flat", "flat-f16", "hnsw")
+
+# 分块计算距离时每块的行数（float16 按块转换为 float32，控制临时内存）
+SCAN_BLOCK_ROWS = 65536
+
+# 矩阵文件的初始容量（行），写满后按倍数扩容
+INITIAL_CAPACITY = 1024
+
+
+class VectorIndex(ABC):
+    """
+    向量索引抽象基类
+
+    get 的返回值与 ChromaDB collection.get 的格式一致:
+        {"ids": [...], "documents": [...], "metadatas": [...], "embeddings": [...] 或 None}
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def add(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict]):
+        """写入向量（已存在的ID跳过）"""
+        pass
+
+    @abstractmethod
+    def query(self, embedding: List[float], n_results: int, where: Dict = None) -> List[Dict]:
+        """
+        检索最近的向量
+
+        Returns:
+            按距离升序 [{id, text, metadata, distance}]
+        """
+        pass
+
+    @abstractmethod
+    def get(
+            self,
+            ids: List[str] = None,
+            where: Dict = None,
+            limit: int = None,
+            offset: int = 0,
+            include_embeddings: bool = False
+    ) -> Dict[str, Any]:
+        """按ID或元数据条件取回分块"""
+        pass
+
+    @abstractmethod
+    def update(self, ids: List[str], metadatas: List[Dict]):
+        """更新分块的元数据"""
+        pass
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        """删除分块"""
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        """分块总数"""
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """删除全部分块"""
+        pass
+
+    def close(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class ChromaIndex(VectorIndex):
+    """ChromaDB 集合"""
+
+    name = "chroma"
+
+    def __init__(self, persist_directory: str, collection_name: str):
+        """
+        Args:
+            persist_directory: 嵌入式 ChromaDB 的持久化目录
+            collection_name: 集合名称
+        """
+        # chromadb 用到时才导入
+        import chromadb
+        from chromadb.config import Settings
+
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+
+        # 配置了 CHROMA_SERVER_HOST 时连接独立的 Chroma 服务；
+        # 嵌入式 PersistentClient 的索引在每个进程内存中各自维护，不能由多个 worker 进程共享
+        chroma_host = os.getenv("CHROMA_SERVER_HOST")
+        try:
+            settings = Settings(
+                anonymized_telemetry=False,
+                allow_reset=True
+            )
+            if chroma_host:
+                chroma_port = int(os.getenv("CHROMA_SERVER_PORT", "8000"))
+                self.client = chromadb.HttpClient(host=chroma_host, port=chroma_port, settings=settings)
+                logger.info(f"✓ ChromaDB connected to {chroma_host}:{chroma_port}")
+            else:
+                if int(os.getenv("SERVER_WORKERS", "1")) > 1:
+                    logger.warning(
+                        "Embedded ChromaDB is not shared between worker processes, "
+                        "set CHROMA_SERVER_HOST when running multiple workers"
+                    )
+                self.client = chromadb.PersistentClient(
+                    path=self.persist_directory,
+                    settings=settings
+                )
+                logger.info(f"✓ ChromaDB initialized at {self.persist_directory}")
+        except Exception as e:
+            logger.error(f"✗ Failed to initialize ChromaDB: {str(e)}")
+            raise
+
+        # 获取或创建集合
+        try:
+            self.collection = self.client.get_or_create_collection(
+                name=self.collection_name,
+                metadata={"description": "MCP文档向量存储"}
+            )
+            logger.info(f"✓ Collection ready: {self.collection_name}")
+        except Exception as e:
+            logger.error(f"✗ Failed to create collection: {str(e)}")
+            raise
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self.collection.add(
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=ids
+        )
+
+    def query(self, embedding, n_results, where=None):
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances"]
+        )
+
+        if not results["ids"]:
+            return []
+        return [
+            {
+                "id": results["ids"][0][i],
+                "text": results["documents"][0][i],
+                "metadata": results["metadatas"][0][i],
+                "distance": results["distances"][0][i]
+            }
+            for i in range(len(results["ids"][0]))
+        ]
+
+    def get(self, ids=None, where=None, limit=None, offset=0, include_embeddings=False):
+        include = ["documents", "metadatas"]
+        if include_embeddings:
+            include.append("embeddings")
+        results = self.collection.get(
+            ids=ids,
+            where=where,
+            limit=limit,
+            offset=offset or None,
+            include=include
+        )
+        return {
+            "ids": results["ids"],
+            "documents": results["documents"],
+            "metadatas": results["metadatas"],
+            "embeddings": results.get("embeddings") if include_embeddings else None
+        }
+
+    def update(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def clear(self):
+        self.client.delete_collection(self.collection_name)
+        self.collection = self.client.create_collection(
+            name=self.collection_name,
+            metadata={"description": "MCP文档向量存储"}
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "persist_directory": self.persist_directory}
+
+
+class FlatIndex(VectorIndex):
+    """
+    内存映射矩阵向量索引
+
+    vectors.bin 是 (容量, 维度) 的行主序矩阵，每个分块占一行（slot），删除后的行被复用；
+    meta.db 保存 slot -> 分块ID、document_id、文本和元数据。写入时先写向量再提交元数据，
+    中途崩溃只会留下没有元数据的空行。查询时按块计算平方 L2 距离并用 argpartition 取 top-k，
+    按 document_id 过滤时只计算该文档的行
+
+    多个进程可以同时读写同一索引：分配行、写向量和提交元数据都在 SQLite 写事务
+    （BEGIN IMMEDIATE）中完成，同一时刻只有一个进程写入；每次写入递增 meta 中的写入代数，
+    各进程访问索引前发现代数变化时刷新内存中的行状态
+    """
+
+    name = "flat"
+
+    def __init__(
+            self,
+            index_dir: str,
+            dtype: str = "float32",
+            hnsw: bool = False,
+            hnsw_m: int = 16,
+            hnsw_ef_construction: int = 200,
+            hnsw_ef_search: int = 64
+    ):
+        """
+        Args:
+            index_dir: 索引目录
+            dtype: 向量存储精度 float32 / float16（已有索引沿用创建时的精度）
+            hnsw: 是否为不带过滤条件的查询维护 HNSW 图（需要 hnswlib）
+            hnsw_m: HNSW 每个节点的连接数
+            hnsw_ef_construction: HNSW 构建时的候选集大小
+            hnsw_ef_search: HNSW 查询时的候选集大小（不小于 n_results）
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.index_dir / "vectors.bin"
+        self.hnsw_path = self.index_dir / "hnsw.bin"
+        self._lock = threading.RLock()
+
+        # 自动提交模式，写操作显式开启 BEGIN IMMEDIATE 事务
+        self.conn = sqlite3.connect(
+            str(self.index_dir / "meta.db"),
+            timeout=30,
+            check_same_thread=False,
+            isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    slot INTEGER PRIMARY KEY,
+                    chunk_id TEXT NOT NULL UNIQUE,
+                    document_id TEXT,
+                    text TEXT,
+                    metadata TEXT,
+                    generation INTEGER NOT NULL
+                )
+                """
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_generation ON chunks(generation)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        stored_dtype = self._get_meta("dtype")
+        if stored_dtype and stored_dtype != dtype:
+            logger.warning(f"Vector index at {self.index_dir} was created as {stored_dtype}, ignoring dtype={dtype}")
+        self.dtype = np.dtype(stored_dtype or dtype)
+        self.dim = int(self._get_meta("dim") or 0)
+
+        # 行状态：是否有效、向量平方范数、可复用的空行；generation 为已刷新到的写入代数（-1 表示尚未加载）
+        self._vectors: Optional[np.memmap] = None
+        self._live = np.zeros(0, dtype=bool)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._free: List[int] = []
+        self._high_water = 0
+        self.generation = -1
+        self.hnsw = None
+        self._sync()
+
+        if hnsw:
+            self._init_hnsw(hnsw_m, hnsw_ef_construction)
+        self.hnsw_ef_search = hnsw_ef_search
+
+        logger.info(
+            f"✓ Flat vector index ready at {self.index_dir}: {self.count()} vectors, "
+            f"dtype={self.dtype.name}, hnsw={'on' if self.hnsw is not None else 'off'}"
+        )
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: Any):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @contextmanager
+    def _transaction(self):
+        """
+        跨进程写事务（BEGIN IMMEDIATE，同一时刻只有一个进程写入）
+
+        回滚时内存中的行状态可能已部分更新，下次访问时从元数据完整重建
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            self.dim = int(self._get_meta("dim") or 0)
+            self.generation = -1
+            raise
+
+    def _sync(self):
+        """
+        写入代数变化（其他进程或回滚的写入）时刷新行状态
+
+        只为写入代数大于上次刷新时的行重新计算范数（并加入 HNSW 图），
+        不再有效的行从 HNSW 图中标记删除
+        """
+        generation = int(self._get_meta("generation") or 0)
+        if generation == self.generation:
+            return
+
+        if not self.dim:
+            self.dim = int(self._get_meta("dim") or 0)
+            self.dtype = np.dtype(self._get_meta("dtype") or self.dtype.name)
+        if not self.dim or not self.vectors_path.exists():
+            self.generation = generation
+            return
+
+        # 矩阵文件可能已被其他进程扩容
+        capacity = self.vectors_path.stat().st_size // (self.dim * self.dtype.itemsize)
+        if self._vectors is None or len(self._vectors) != capacity:
+            self._open_vectors()
+        if capacity > len(self._live):
+            grow = capacity - len(self._live)
+            self._live = np.concatenate([self._live, np.zeros(grow, dtype=bool)])
+            self._norms = np.concatenate([self._norms, np.zeros(grow, dtype=np.float32)])
+            if self.hnsw is not None:
+                self.hnsw.resize_index(capacity)
+
+        # 向量先于元数据写入，元数据中的行一定在矩阵容量内
+        live = np.zeros(capacity, dtype=bool)
+        live[[row[0] for row in self.conn.execute("SELECT slot FROM chunks")]] = True
+        changed = np.asarray(
+            [row[0] for row in self.conn.execute(
+                "SELECT slot FROM chunks WHERE generation > ? ORDER BY slot", (self.generation,)
+            )],
+            dtype=np.int64
+        )
+
+        if self.hnsw is not None:
+            for slot in np.flatnonzero(self._live & ~live):
+                self.hnsw.mark_deleted(int(slot))
+        for start in range(0, len(changed), SCAN_BLOCK_ROWS):
+            slots = changed[start:start + SCAN_BLOCK_ROWS]
+            block = np.asarray(self._vectors[slots], dtype=np.float32)
+            self._norms[slots] = np.einsum("ij,ij->i", block, block)
+            if self.hnsw is not None:
+                self.hnsw.add_items(block, slots)
+
+        live_slots = np.flatnonzero(live)
+        self._live = live
+        self._high_water = int(live_slots[-1]) + 1 if len(live_slots) else 0
+        self._free = [slot for slot in range(self._high_water) if not live[slot]]
+        self.generation = generation
+
+        # 索引由其他进程创建后才确定维度
+        if self.hnsw is None and hasattr(self, "_hnsw_params"):
+            self._init_hnsw(*self._hnsw_params)
+
+    def _open_vectors(self):
+        row_bytes = self.dim * self.dtype.itemsize
+        capacity = self.vectors_path.stat().st_size // row_bytes
+        self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+
+    def _ensure_capacity(self, rows: int):
+        """矩阵文件容量不足 rows 行时按倍数扩容"""
+        capacity = len(self._live)
+        if rows <= capacity:
+            return
+
+        new_capacity = max(INITIAL_CAPACITY, capacity)
+        while new_capacity < rows:
+            new_capacity *= 2
+
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * self.dtype.itemsize)
+        self._open_vectors()
+
+        self._live = np.concatenate([self._live, np.zeros(new_capacity - capacity, dtype=bool)])
+        self._norms = np.concatenate([self._norms, np.zeros(new_capacity - capacity, dtype=np.float32)])
+        if self.hnsw is not None:
+            self.hnsw.resize_index(new_capacity)
+
+    def _init_hnsw(self, m: int, ef_construction: int):
+        """加载或重建 HNSW 图；未安装 hnswlib 时只使用精确检索"""
+        try:
+            import hnswlib
+        except ImportError:
+            logger.warning("hnswlib not installed, flat vector index uses exact search only")
+            return
+
+        self._hnsw_params = (m, ef_construction)
+        if not self.dim:
+            return  # 首次写入确定维度后再创建
+
+        index = hnswlib.Index(space="l2", dim=self.dim)
+        capacity = max(len(self._live), INITIAL_CAPACITY)
+
+        # 保存时的写入代数与当前一致才能直接加载，否则从矩阵重建
+        if self.hnsw_path.exists() and self._get_meta("hnsw_generation") == str(self.generation):
+            try:
+                index.load_index(str(self.hnsw_path), max_elements=capacity)
+                self.hnsw = index
+                return
+            except Exception as e:
+                logger.warning(f"Failed to load HNSW graph, rebuilding: {str(e)}")
+                index = hnswlib.Index(space="l2", dim=self.dim)
+
+        start = time.perf_counter()
+        index.init_index(max_elements=capacity, M=m, ef_construction=ef_construction)
+        live_slots = np.flatnonzero(self._live)
+        for begin in range(0, len(live_slots), SCAN_BLOCK_ROWS):
+            slots = live_slots[begin:begin + SCAN_BLOCK_ROWS]
+            index.add_items(np.asarray(self._vectors[slots], dtype=np.float32), slots)
+        self.hnsw = index
+        logger.info(f"HNSW graph built for {len(live_slots)} vectors in {time.perf_counter() - start:.1f}s")
+
+    def _bump_generation(self):
+        """在写事务中递增写入代数（事务开始时已刷新到最新代数）"""
+        self.generation += 1
+        self._set_meta("generation", self.generation)
+
+    def add(self, ids, embeddings, documents, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("embeddings must be a list of vectors matching ids")
+
+        with self._lock, self._transaction():
+            self._sync()
+            if not self.dim:
+                self.dim = vectors.shape[1]
+                self._set_meta("dim", self.dim)
+                self._set_meta("dtype", self.dtype.name)
+                if hasattr(self, "_hnsw_params"):
+                    self._init_hnsw(*self._hnsw_params)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+
+            # 与 ChromaDB 一致：已存在（或本批内重复）的ID跳过
+            existing = self._existing_ids(ids)
+            if existing:
+                logger.warning(f"Skipped {len(existing)} existing ids in flat vector index")
+            rows = []
+            for i, chunk_id in enumerate(ids):
+                if chunk_id not in existing:
+                    existing.add(chunk_id)
+                    rows.append(i)
+            if not rows:
+                return
+
+            reused = min(len(rows), len(self._free))
+            slots = self._free[:reused]
+            del self._free[:reused]
+            slots.extend(range(self._high_water, self._high_water + len(rows) - reused))
+            self._high_water += len(rows) - reused
+            self._ensure_capacity(self._high_water)
+
+            slot_array = np.asarray(slots, dtype=np.int64)
+            new_vectors = vectors[rows]
+            self._vectors[slot_array] = new_vectors
+            self._vectors.flush()
+
+            self._bump_generation()
+            self.conn.executemany(
+                "INSERT INTO chunks (slot, chunk_id, document_id, text, metadata, generation) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        slot,
+                        ids[i],
+                        (metadatas[i] or {}).get("document_id"),
+                        documents[i],
+                        json.dumps(metadatas[i] or {}, ensure_ascii=False),
+                        self.generation
+                    )
+                    for slot, i in zip(slots, rows)
+                ]
+            )
+
+            # 按存储精度计算范数，与查询时读出的向量一致
+            stored = np.asarray(self._vectors[slot_array], dtype=np.float32)
+            self._norms[slot_array] = np.einsum("ij,ij->i", stored, stored)
+            self._live[slot_array] = True
+            if self.hnsw is not None:
+                self.hnsw.add_items(stored, slot_array)
+
+    def _existing_ids(self, ids: List[str]) -> set:
+        existing = set()
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            existing.update(
+                row[0] for row in self.conn.execute(
+                    f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({placeholders})", batch
+                )
+            )
+        return existing
+
+    @staticmethod
+    def _where_clause(where: Dict = None) -> Tuple[str, List[Any]]:
+        """元数据等值过滤条件转换为 SQL（document_id 走索引列，其余键用 json_extract）"""
+        if not where:
+            return "", []
+
+        conditions = where["$and"] if set(where) == {"$and"} else [{key: value} for key, value in where.items()]
+        clauses, params = [], []
+        for condition in conditions:
+            for key, value in condition.items():
+                if key.startswith("$"):
+                    raise ValueError(f"Unsupported filter operator for flat vector index: {key}")
+                if isinstance(value, dict):
+                    if set(value) != {"$eq"}:
+                        raise ValueError(f"Unsupported filter operator for flat vector index: {value}")
+                    value = value["$eq"]
+                if key == "document_id":
+                    clauses.append("document_id = ?")
+                else:
+                    clauses.append("json_extract(metadata, ?) = ?")
+                    params.append(f'$."{key}"')
+                params.append(value)
+        return " WHERE " + " AND ".join(clauses), params
+
+    def query(self, embedding, n_results, where=None):
+        query = np.asarray(embedding, dtype=np.float32)
+
+        with self._lock:
+            self._sync()
+            if not self.dim or n_results <= 0:
+                return []
+
+            live_count = int(self._live.sum())
+            if where:
+                clause, params = self._where_clause(where)
+                slots = np.asarray(
+                    [row[0] for row in self.conn.execute(f"SELECT slot FROM chunks{clause}", params)],
+                    dtype=np.int64
+                )
+                # 刷新之后其他进程新写入的行留到下次查询
+                slots = slots[slots < len(self._live)]
+                slots, distances = self._scan(query, n_results, slots[self._live[slots]])
+            elif self.hnsw is not None and live_count > 0:
+                k = min(n_results, live_count)
+                self.hnsw.set_ef(max(self.hnsw_ef_search, k))
+                try:
+                    labels, distances = self.hnsw.knn_query(query, k=k)
+                    slots, distances = labels[0].astype(np.int64), distances[0]
+                except RuntimeError:
+                    # 删除较多时图中可达的节点可能不足 k 个
+                    slots, distances = self._scan(query, n_results)
+            else:
+                slots, distances = self._scan(query, n_results)
+
+            if not len(slots):
+                return []
+            rows = self._rows_by_slot([int(slot) for slot in slots])
+
+        results = []
+        for slot, distance in zip(slots, distances):
+            row = rows.get(int(slot))
+            if row is None:
+                continue
+            chunk_id, text, metadata = row
+            results.append({
+                "id": chunk_id,
+                "text": text,
+                "metadata": metadata,
+                "distance": float(distance)
+            })
+        return results
+
+    def _scan(self, query: np.ndarray, k: int, slots: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        精确检索：平方 L2 距离 = |x|^2 - 2 x·q + |q|^2
+
+        Args:
+            query: 查询向量
+            k: 返回数量
+            slots: 候选行（默认全部有效行）
+
+        Returns:
+            (slots, distances)，按距离升序
+        """
+        query_norm = float(np.dot(query, query))
+        if slots is None:
+            blocks = (
+                np.arange(start, min(start + SCAN_BLOCK_ROWS, self._high_water))
+                for start in range(0, self._high_water, SCAN_BLOCK_ROWS)
+            )
+        else:
+            blocks = (slots[start:start + SCAN_BLOCK_ROWS] for start in range(0, len(slots), SCAN_BLOCK_ROWS))
+
+        best_slots, best_distances = [], []
+        for block_slots in blocks:
+            if slots is None:
+                # 连续读取整块，已删除的行距离置为无穷大
+                block = np.asarray(self._vectors[block_slots[0]:block_slots[-1] + 1], dtype=np.float32)
+            else:
+                block = np.asarray(self._vectors[block_slots], dtype=np.float32)
+            distances = self._norms[block_slots] - 2 * (block @ query) + query_norm
+            if slots is None:
+                distances[~self._live[block_slots]] = np.inf
+            if len(distances) > k:
+                top = np.argpartition(distances, k)[:k]
+                block_slots, distances = block_slots[top], distances[top]
+            best_slots.append(block_slots)
+            best_distances.append(distances)
+
+        if not best_slots:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        all_slots = np.concatenate(best_slots)
+        all_distances = np.concatenate(best_distances)
+        order = np.argsort(all_distances, kind="stable")[:k]
+        order = order[np.isfinite(all_distances[order])]
+        return all_slots[order], np.maximum(all_distances[order], 0.0)
+
+    def _rows_by_slot(self, slots: List[int]) -> Dict[int, Tuple[str, str, Dict]]:
+        rows = {}
+        for start in range(0, len(slots), 500):
+            batch = slots[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for slot, chunk_id, text, metadata in self.conn.execute(
+                    f"SELECT slot, chunk_id, text, metadata FROM chunks WHERE slot IN ({placeholders})", batch
+            ):
+                rows[slot] = (chunk_id, text, json.loads(metadata))
+        return rows
+
+    def get(self, ids=None, where=None, limit=None, offset=0, include_embeddings=False):
+        with self._lock:
+            self._sync()
+            if ids is not None:
+                rows = []
+                for start in range(0, len(ids), 500):
+                    batch = ids[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows.extend(self.conn.execute(
+                        f"SELECT slot, chunk_id, text, metadata FROM chunks WHERE chunk_id IN ({placeholders})",
+                        batch
+                    ))
+                order = {chunk_id: i for i, chunk_id in enumerate(ids)}
+                rows.sort(key=lambda row: order[row[1]])
+            else:
+                clause, params = self._where_clause(where)
+                sql = f"SELECT slot, chunk_id, text, metadata FROM chunks{clause} ORDER BY slot"
+                if limit is not None or offset:
+                    sql += " LIMIT ? OFFSET ?"
+                    params = params + [-1 if limit is None else limit, offset or 0]
+                rows = self.conn.execute(sql, params).fetchall()
+
+            embeddings = None
+            if include_embeddings:
+                slots = np.asarray([row[0] for row in rows], dtype=np.int64)
+                if len(slots) and slots.max() >= len(self._vectors):
+                    self._open_vectors()  # 刷新之后其他进程扩容并写入的行
+                embeddings = np.asarray(self._vectors[slots], dtype=np.float32).tolist() if len(slots) else []
+
+        return {
+            "ids": [row[1] for row in rows],
+            "documents": [row[2] for row in rows],
+            "metadatas": [json.loads(row[3]) for row in rows],
+            "embeddings": embeddings
+        }
+
+    def update(self, ids, metadatas):
+        # 只改元数据，行状态不变，不递增写入代数
+        with self._lock, self._transaction():
+            self.conn.executemany(
+                "UPDATE chunks SET metadata = ?, document_id = ? WHERE chunk_id = ?",
+                [
+                    (json.dumps(metadata or {}, ensure_ascii=False), (metadata or {}).get("document_id"), chunk_id)
+                    for chunk_id, metadata in zip(ids, metadatas)
+                ]
+            )
+
+    def delete(self, ids):
+        with self._lock, self._transaction():
+            self._sync()
+            slots = []
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                slots.extend(row[0] for row in self.conn.execute(
+                    f"SELECT slot FROM chunks WHERE chunk_id IN ({placeholders})", batch
+                ))
+                self.conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", batch)
+            if not slots:
+                return
+            self._bump_generation()
+
+            for slot in slots:
+                self._live[slot] = False
+                if self.hnsw is not None:
+                    self.hnsw.mark_deleted(slot)
+            self._free.extend(slots)
+            self._free.sort()
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._transaction():
+            self._sync()
+            self.conn.execute("DELETE FROM chunks")
+            self._bump_generation()
+
+            self._live[:] = False
+            self._free = []
+            self._high_water = 0
+            if self.hnsw is not None:
+                import hnswlib
+                self.hnsw = hnswlib.Index(space="l2", dim=self.dim)
+                m, ef_construction = self._hnsw_params
+                self.hnsw.init_index(max_elements=max(len(self._live), INITIAL_CAPACITY), M=m, ef_construction=ef_construction)
+
+    def close(self):
+        """落盘矩阵，保存 HNSW 图（下次启动直接加载）"""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            if self.hnsw is not None:
+                try:
+                    # 多个进程可能同时保存，先写临时文件再替换
+                    self._sync()
+                    temp_path = self.hnsw_path.with_suffix(f".{os.getpid()}.tmp")
+                    self.hnsw.save_index(str(temp_path))
+                    os.replace(temp_path, self.hnsw_path)
+                    self._set_meta("hnsw_generation", self.generation)
+                except Exception as e:
+                    logger.warning(f"Failed to save HNSW graph: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "index_dir": str(self.index_dir),
+            "dtype": self.dtype.name,
+            "dim": self.dim,
+            "capacity": len(self._live),
+            "matrix_bytes": len(self._live) * self.dim * self.dtype.itemsize,
+            "hnsw": self.hnsw is not None
+        }
+
+
+def create_vector_index(
+        backend: str = None,
+        persist_directory: str = None,
+        collection_name: str = "mcp_documents"
+) -> VectorIndex:
+    """
+    按 VECTOR_BACKEND 创建向量索引
+
+    Args:
+        backend: chroma / flat (默认从环境变量 VECTOR_BACKEND 读取)
+        persist_directory: ChromaDB 持久化目录
+        collection_name: 集合名称（flat 索引按集合名分目录）
+
+    Returns:
+        VectorIndex 实现
+    """
+    backend = backend or os.getenv("VECTOR_BACKEND", "chroma")
+    if backend == "chroma":
+        return ChromaIndex(persist_directory, collection_name)
+    if backend == "flat":
+        index_dir = Path(os.getenv("VECTOR_INDEX_DIR", "./data/vector_index")) / collection_name
+        return FlatIndex(
+            str(index_dir),
+            dtype=os.getenv("VECTOR_INDEX_DTYPE", "float32"),
+            hnsw=os.getenv("VECTOR_INDEX_HNSW", "false").lower() == "true",
+            hnsw_m=int(os.getenv("HNSW_M", "16")),
+            hnsw_ef_construction=int(os.getenv("HNSW_EF_CONSTRUCTION", "200")),
+            hnsw_ef_search=int(os.getenv("HNSW_EF_SEARCH", "64"))
+        )
+    raise ValueError(f"Unknown vector backend: {backend} (expected one of {', '.join(VECTOR_BACKENDS)})")
+
+
+def _open_benchmark_index(variant: str, directory: str) -> VectorIndex:
+    if variant == "chroma":
+        return ChromaIndex(directory, "benchmark")
+    if variant == "flat":
+        return FlatIndex(directory)
+    if variant == "flat-f16":
+        return FlatIndex(directory, dtype="float16")
+    index = FlatIndex(directory, hnsw=True)
+    if not hasattr(index, "_hnsw_params"):
+        raise RuntimeError("hnswlib not installed")
+    return index
+
+
+def benchmark(
+        variant: str,
+        vectors: np.ndarray,
+        queries: np.ndarray,
+        exact: List[set],
+        top_k: int = 10,
+        batch_size: int = 1000,
+        documents: int = 100
+) -> Dict[str, float]:
+    """
+    在临时目录中写入向量并逐条查询
+
+    Returns:
+        {add_per_sec, query_p50_ms, query_p95_ms, filtered_p50_ms, recall}
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        index = _open_benchmark_index(variant, directory)
+        ids = [f"chunk_{i}" for i in range(len(vectors))]
+
+        start = time.perf_counter()
+        for begin in range(0, len(vectors), batch_size):
+            end = begin + batch_size
+            index.add(
+                ids[begin:end],
+                vectors[begin:end].tolist(),
+                [f"text {i}" for i in range(begin, min(end, len(vectors)))],
+                [{"document_id": f"doc_{i % documents}", "chunk_id": ids[i]} for i in range(begin, min(end, len(vectors)))]
+            )
+        add_seconds = time.perf_counter() - start
+
+        latencies, hits = [], 0
+        for query, expected in zip(queries, exact):
+            start = time.perf_counter()
+            results = index.query(query.tolist(), top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & {result["id"] for result in results})
+
+        filtered = []
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            index.query(query.tolist(), top_k, where={"document_id": f"doc_{i % documents}"})
+            filtered.append((time.perf_counter() - start) * 1000)
+        index.close()
+
+    return {
+        "add_per_sec": round(len(vectors) / add_seconds, 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "filtered_p50_ms": round(float(np.percentile(filtered, 50)), 2),
+        "recall": round(hits / (len(queries) * top_k), 4)
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="比较各向量索引后端的写入吞吐、查询延迟和召回率")
+    parser.add_argument("--backends", default="chroma,flat,flat-f16,hnsw", help="待比较的后端（逗号分隔）")
+    parser.add_argument("--vectors", type=int, default=100000, help="写入的向量数")
+    parser.add_argument("--dim", type=int, default=384, help="向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--top-k", type=int, default=10, help="每次查询返回的数量")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    variants = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = [name for name in variants if name not in BENCHMARK_VARIANTS]
+    if unknown:
+        parser.error(f"未知后端: {', '.join(unknown)}（可选 {', '.join(BENCHMARK_VARIANTS)}）")
+
+    # 归一化的随机向量（与 Embedding 模型输出的分布一致：单位长度）
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.vectors, args.dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(args.vectors, args.queries, replace=False)] + \
+        0.1 * rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    # 精确结果作为召回率的基准
+    exact = []
+    for query in queries:
+        distances = np.einsum("ij,ij->i", vectors - query, vectors - query)
+        exact.append({f"chunk_{i}" for i in np.argpartition(distances, args.top_k)[:args.top_k]})
+
+    print(f"{args.vectors} vectors x {args.dim} dims, {args.queries} queries, top_k={args.top_k}")
+    print(f"{'backend':<10} {'add/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'filter ms':>10} {'recall':>8}")
+    for variant in variants:
+        try:
+            result = benchmark(variant, vectors, queries, exact, top_k=args.top_k)
+        except Exception as e:
+            print(f"{variant:<10} skipped: {str(e)}")
+            continue
+        print(
+            f"{variant:<10} {result['add_per_sec']:>10} {result['query_p50_ms']:>8} "
+            f"{result['query_p95_ms']:>8} {result['filtered_p50_ms']:>10} {result['recall']:>8}"
+        )
+    return 0
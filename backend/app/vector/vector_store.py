@@ -1,15 +1,31 @@
 """
-Vector Store Manager using ChromaDB
-向量数据库管理器 - 基于ChromaDB
+Vector Store Manager
+向量数据库管理器 - 向量索引由 VECTOR_BACKEND 选择（ChromaDB 或内存映射矩阵索引）
 """
 import os
-from typing import List, Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Tuple
 from pathlib import Path
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+import numpy as np
 from loguru import logger
 
+from app.vector.embedding_backends import load_embedding_model
+from app.vector.embedding_cache import EmbeddingCache
+from app.vector.embedding_batcher import QueryEmbeddingBatcher
+from app.vector.embedding_server import RemoteEmbeddingModel
+from app.vector.bm25_index import BM25Index
+from app.vector.index_backends import VectorIndex, create_vector_index
+
+# 倒数排名融合（RRF）常数
+RRF_K = 60
+
+# 首选模型加载失败时按顺序尝试的备选模型
+EMBEDDING_MODEL_FALLBACKS = (
+    "all-MiniLM-L6-v2",  # 通用英文模型（推荐，最稳定）
+    "paraphrase-MiniLM-L6-v2",  # 备选小模型
+    "distiluse-base-multilingual-cased-v2",  # 多语言模型
+)
+
 
 class VectorStoreManager:
     """向量数据库管理器"""
@@ -38,35 +54,38 @@ class VectorStoreManager:
         # 确保目录存在
         Path(self.persist_directory).mkdir(parents=True, exist_ok=True)
 
-        # 初始化ChromaDB客户端
-        try:
-            self.client = chromadb.PersistentClient(
-                path=self.persist_directory,
-                settings=Settings(
-                    anonymized_telemetry=False,
-                    allow_reset=True
-                )
-            )
-            logger.info(f"✓ ChromaDB initialized at {self.persist_directory}")
-        except Exception as e:
-            logger.error(f"✗ Failed to initialize ChromaDB: {str(e)}")
-            raise
-
-        # 获取或创建集合
-        try:
-            self.collection = self.client.get_or_create_collection(
-                name=self.collection_name,
-                metadata={"description": "MCP文档向量存储"}
-            )
-            logger.info(f"✓ Collection ready: {self.collection_name}")
-        except Exception as e:
-            logger.error(f"✗ Failed to create collection: {str(e)}")
-            raise
+        # 初始化向量索引（chromadb、sentence_transformers 用到时才导入，导入本模块不加载 torch）
+        self.index: VectorIndex = create_vector_index(
+            persist_directory=self.persist_directory,
+            collection_name=self.collection_name
+        )
 
         # 初始化Embedding模型（带多个备选方案）
         self.embedding_model = None
+        self.embedding_model_name = None
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+        self.embedding_backend = os.getenv("EMBEDDING_BACKEND", "torch")
         self._init_embedding_model(embedding_model)
 
+        # 初始化Embedding缓存（按内容哈希复用已计算的向量）
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "false":
+            self._init_embedding_cache()
+
+        # 并发查询的向量计算合并为批次执行
+        self.query_batcher: Optional[QueryEmbeddingBatcher] = None
+        if os.getenv("QUERY_BATCHING_ENABLED", "true").lower() != "false":
+            self.query_batcher = QueryEmbeddingBatcher(
+                self.generate_embeddings,
+                max_batch_size=int(os.getenv("QUERY_BATCH_SIZE", "64")),
+                max_wait_ms=float(os.getenv("QUERY_BATCH_WAIT_MS", "2"))
+            )
+
+        # 初始化关键词索引（BM25，与向量检索并行查询）
+        self.keyword_index: Optional[BM25Index] = None
+        self._search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid")
+        self._init_keyword_index()
+
     def _init_embedding_model(self, preferred_model: str):
         """
         初始化Embedding模型，带多个备选方案
@@ -74,22 +93,32 @@ class VectorStoreManager:
         Args:
             preferred_model: 首选模型名称
         """
+        # 配置了 EMBEDDING_SERVER_SOCKET 时由独立的向量化服务计算，服务不可用时在本进程加载模型
+        socket_path = os.getenv("EMBEDDING_SERVER_SOCKET")
+        if socket_path:
+            try:
+                model = RemoteEmbeddingModel(socket_path)
+                self.embedding_model = model
+                self.embedding_model_name = model.model_name
+                self.embedding_backend = model.backend
+                self.available = True
+                logger.info(f"✓ 使用向量化服务: {socket_path} ({model.model_name}, {model.backend})")
+                return
+            except Exception as e:
+                logger.warning(f"  ✗ 向量化服务不可用，在本进程加载模型: {str(e)}")
+
         # 按优先级尝试多个模型
-        models_to_try = [
-            preferred_model,
-            "all-MiniLM-L6-v2",  # 通用英文模型（推荐，最稳定）
-            "paraphrase-MiniLM-L6-v2",  # 备选小模型
-            "distiluse-base-multilingual-cased-v2",  # 多语言模型
-        ]
+        models_to_try = [preferred_model, *EMBEDDING_MODEL_FALLBACKS]
 
         logger.info("正在尝试加载Embedding模型...")
 
         for model_name in models_to_try:
             try:
-                logger.info(f"  尝试: {model_name}")
-                self.embedding_model = SentenceTransformer(model_name)
+                logger.info(f"  尝试: {model_name} ({self.embedding_backend})")
+                self.embedding_model = self._load_embedding_model(model_name)
+                self.embedding_model_name = model_name
                 self.available = True
-                logger.info(f"✓ 成功加载模型: {model_name}")
+                logger.info(f"✓ 成功加载模型: {model_name} ({self.embedding_backend})")
                 return
             except Exception as e:
                 logger.warning(f"  ✗ 加载失败: {str(e)}")
@@ -100,6 +129,83 @@ class VectorStoreManager:
         logger.error(f"✗ {error_msg}")
         raise Exception(error_msg)
 
+    def _load_embedding_model(self, model_name: str):
+        """
+        按 EMBEDDING_BACKEND 加载模型，ONNX 后端不可用时退回 PyTorch
+
+        主进程已预加载（preload_models）的模型直接复用
+        """
+        if self.embedding_backend == "torch":
+            return load_embedding_model(model_name, "torch")
+        try:
+            return load_embedding_model(model_name, self.embedding_backend)
+        except Exception as e:
+            logger.warning(f"  ✗ {self.embedding_backend} 后端不可用，改用 torch: {str(e)}")
+            self.embedding_backend = "torch"
+            return load_embedding_model(model_name, "torch")
+
+    def _init_embedding_cache(self):
+        """初始化Embedding缓存，失败时不影响向量存储的使用"""
+        cache_dir = os.getenv(
+            "EMBEDDING_CACHE_DIR",
+            str(Path(self.persist_directory).parent / "embedding_cache")
+        )
+        try:
+            # 量化模型的向量与原模型略有差异，按后端分开缓存
+            cache_name = self.embedding_model_name
+            if self.embedding_backend != "torch":
+                cache_name = f"{cache_name}@{self.embedding_backend}"
+            self.embedding_cache = EmbeddingCache(
+                cache_dir=cache_dir,
+                model_name=cache_name,
+                dim=self.embedding_model.get_sentence_embedding_dimension()
+            )
+        except Exception as e:
+            logger.warning(f"Embedding cache disabled: {str(e)}")
+            self.embedding_cache = None
+
+    def _init_keyword_index(self):
+        """初始化BM25关键词索引，索引为空而向量索引中已有数据时回填"""
+        index_path = os.getenv(
+            "KEYWORD_INDEX_PATH",
+            str(Path(self.persist_directory).parent / "keyword_index.db")
+        )
+        try:
+            self.keyword_index = BM25Index(index_path)
+            if self.keyword_index.count() == 0 and self.index.count() > 0:
+                self._rebuild_keyword_index()
+        except Exception as e:
+            logger.warning(f"Keyword index disabled: {str(e)}")
+            self.keyword_index = None
+
+    def _rebuild_keyword_index(self, page_size: int = 1000):
+        """从向量索引中已有的分块重建关键词索引"""
+        total = self.index.count()
+        logger.info(f"Rebuilding keyword index from {total} stored chunks...")
+
+        for offset in range(0, total, page_size):
+            results = self.index.get(limit=page_size, offset=offset)
+            self.keyword_index.add(
+                results["ids"],
+                results["documents"],
+                [(metadata or {}).get("document_id") for metadata in results["metadatas"]]
+            )
+
+        logger.info(f"✓ Keyword index rebuilt: {self.keyword_index.count()} chunks")
+
+    def get_tokenizer(self) -> Tuple[Any, int]:
+        """
+        Embedding模型的分词器（用于按 token 分段）
+
+        Returns:
+            (fast tokenizer, 单段可编码的 token 数（不含特殊 token）)，不可用时返回 (None, 0)
+        """
+        tokenizer = getattr(self.embedding_model, "tokenizer", None)
+        if not self.available or tokenizer is None or not getattr(tokenizer, "is_fast", False):
+            return None, 0
+        special_tokens = len(tokenizer("", add_special_tokens=True)["input_ids"])
+        return tokenizer, self.embedding_model.max_seq_length - special_tokens
+
     def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
         生成文本的向量表示
@@ -117,6 +223,7 @@ class VectorStoreManager:
         try:
             embeddings = self.embedding_model.encode(
                 texts,
+                batch_size=self.embedding_batch_size,
                 show_progress_bar=False,
                 convert_to_numpy=True
             )
@@ -125,6 +232,55 @@ class VectorStoreManager:
             logger.error(f"Embedding generation failed: {str(e)}")
             return []
 
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """
+        生成查询向量（启用微批处理时与其他并发查询合并计算）
+
+        Returns:
+            向量，失败时返回 None
+        """
+        if self.query_batcher is not None:
+            return self.query_batcher.embed(query)
+        embeddings = self.generate_embeddings([query])
+        return embeddings[0] if embeddings else None
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        生成文档向量（优先使用缓存，只将未命中的文本送入模型）
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            向量列表（与输入顺序一致）
+        """
+        if self.embedding_cache is None:
+            return self.generate_embeddings(texts)
+
+        keys = [EmbeddingCache.content_hash(text) for text in texts]
+        vectors = self.embedding_cache.get_many(keys)
+
+        # 未命中的文本（同一文档内的重复文本只计算一次）
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            embeddings = self.generate_embeddings(list(missing.values()))
+            if len(embeddings) != len(missing):
+                return []
+
+            computed = dict(zip(missing.keys(), embeddings))
+            try:
+                self.embedding_cache.put_many(computed)
+            except Exception as e:
+                logger.warning(f"Failed to update embedding cache: {str(e)}")
+            vectors.update(computed)
+
+        logger.info(f"Embeddings: {len(texts) - len(missing)} from cache, {len(missing)} computed")
+        return [vectors[key] for key in keys]
+
     def add_documents(
             self,
             texts: List[str],
@@ -147,20 +303,23 @@ class VectorStoreManager:
             return False
 
         try:
-            # 生成embeddings
-            embeddings = self.generate_embeddings(texts)
+            # 生成embeddings（命中缓存的文本不再重新计算）
+            embeddings = self.embed_documents(texts)
 
             if not embeddings:
                 logger.error("Failed to generate embeddings")
                 return False
 
-            # 添加到ChromaDB
-            self.collection.add(
-                documents=texts,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                ids=ids
-            )
+            # 写入向量索引
+            self.index.add(ids, embeddings, texts, metadatas)
+
+            # 同步更新关键词索引
+            if self.keyword_index:
+                self.keyword_index.add(
+                    ids,
+                    texts,
+                    [metadata.get("document_id") for metadata in metadatas]
+                )
 
             logger.info(f"✓ Added {len(texts)} documents to vector store")
             return True
@@ -189,18 +348,29 @@ class VectorStoreManager:
 
         texts = [chunk["text"] for chunk in chunks]
         ids = [chunk["chunk_id"] for chunk in chunks]
-        metadatas = [
-            {
-                "document_id": document_id,
-                "chunk_id": chunk["chunk_id"],
-                "start_char": chunk.get("start_char", 0),
-                "end_char": chunk.get("end_char", 0)
-            }
-            for chunk in chunks
-        ]
+        metadatas = [self.chunk_metadata(chunk, document_id) for chunk in chunks]
 
         return self.add_documents(texts, metadatas, ids)
 
+    @staticmethod
+    def chunk_metadata(chunk: Dict, document_id: str) -> Dict[str, Any]:
+        """
+        分块写入向量库时的元数据
+
+        Args:
+            chunk: 分块 {chunk_id, text, start_char, end_char}
+            document_id: 文档ID
+
+        Returns:
+            {document_id, chunk_id, start_char, end_char}
+        """
+        return {
+            "document_id": document_id,
+            "chunk_id": chunk["chunk_id"],
+            "start_char": chunk.get("start_char", 0),
+            "end_char": chunk.get("end_char", 0)
+        }
+
     def search(
             self,
             query: str,
@@ -224,30 +394,11 @@ class VectorStoreManager:
 
         try:
             # 生成查询向量
-            query_embedding = self.generate_embeddings([query])
-            if not query_embedding:
+            query_embedding = self.embed_query(query)
+            if query_embedding is None:
                 return []
 
-            query_embedding = query_embedding[0]
-
-            # 执行搜索
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                where=filter_metadata,
-                include=["documents", "metadatas", "distances"]
-            )
-
-            # 格式化结果
-            search_results = []
-            if results["ids"]:
-                for i in range(len(results["ids"][0])):
-                    search_results.append({
-                        "id": results["ids"][0][i],
-                        "text": results["documents"][0][i],
-                        "metadata": results["metadatas"][0][i],
-                        "score": 1 - results["distances"][0][i]  # 转换为相似度分数
-                    })
+            search_results = self._query_collection(query_embedding, top_k, filter_metadata)
 
             logger.info(f"Search returned {len(search_results)} results")
             return search_results
@@ -256,6 +407,48 @@ class VectorStoreManager:
             logger.error(f"Search failed: {str(e)}")
             return []
 
+    def _query_collection(
+            self,
+            query_embedding: List[float],
+            top_k: int,
+            where: Dict = None
+    ) -> List[Dict]:
+        """用已计算的查询向量检索向量索引"""
+        return [
+            {
+                "id": hit["id"],
+                "text": hit["text"],
+                "metadata": hit["metadata"],
+                "score": 1 - hit["distance"]  # 转换为相似度分数
+            }
+            for hit in self.index.query(query_embedding, top_k, where)
+        ]
+
+    def _fetch_chunks(self, ids: List[str], query_embedding: Optional[List[float]]) -> Dict[str, Dict]:
+        """
+        按ID取回分块，并计算与查询向量的相似度（与 search 的分数口径一致）
+
+        Returns:
+            {chunk_id: {id, text, metadata, score}}
+        """
+        results = self.index.get(ids=ids, include_embeddings=True)
+
+        chunks = {}
+        query_vector = np.asarray(query_embedding, dtype=np.float32) if query_embedding else None
+        for i, chunk_id in enumerate(results["ids"]):
+            score = 0.0
+            if query_vector is not None:
+                # 向量索引使用平方L2距离，search 中的分数为 1 - distance
+                diff = np.asarray(results["embeddings"][i], dtype=np.float32) - query_vector
+                score = float(1 - np.dot(diff, diff))
+            chunks[chunk_id] = {
+                "id": chunk_id,
+                "text": results["documents"][i],
+                "metadata": results["metadatas"][i],
+                "score": score
+            }
+        return chunks
+
     def search_by_document(
             self,
             query: str,
@@ -290,10 +483,7 @@ class VectorStoreManager:
             分块列表
         """
         try:
-            results = self.collection.get(
-                where={"document_id": document_id},
-                include=["documents", "metadatas"]
-            )
+            results = self.index.get(where={"document_id": document_id})
 
             chunks = []
             if results["ids"]:
@@ -322,12 +512,13 @@ class VectorStoreManager:
         """
         try:
             # 先获取所有相关的chunk IDs
-            results = self.collection.get(
-                where={"document_id": document_id}
-            )
+            results = self.index.get(where={"document_id": document_id})
+
+            if self.keyword_index:
+                self.keyword_index.delete_document(document_id)
 
             if results["ids"]:
-                self.collection.delete(ids=results["ids"])
+                self.index.delete(results["ids"])
                 logger.info(f"Deleted {len(results['ids'])} chunks for document {document_id}")
                 return True
             else:
@@ -338,6 +529,86 @@ class VectorStoreManager:
             logger.error(f"Failed to delete document: {str(e)}")
             return False
 
+    def sync_document_chunks(self, document_id: str, chunks: List[Dict]) -> Dict[str, int]:
+        """
+        用新版本的分块增量更新文档的向量
+
+        按文本内容哈希与已存储的分块匹配：内容未变的分块沿用原ID和向量
+        （位置变化时只更新元数据），只有新增内容的分块需要计算 embedding，
+        新版本中不再存在的分块被删除。chunks 中的 chunk_id 会被改写为实际使用的ID
+
+        Args:
+            document_id: 文档ID
+            chunks: 新版本的分块列表 [{chunk_id, text, start_char, end_char}]
+
+        Returns:
+            {"added": 新增数, "updated": 仅更新元数据数, "unchanged": 未变化数, "removed": 删除数}
+        """
+        stats = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+        if not self.available:
+            return stats
+
+        existing = self.index.get(where={"document_id": document_id})
+
+        # 内容哈希 -> 旧分块（同一内容可能出现多次）
+        old_by_hash: Dict[str, List[tuple]] = {}
+        for chunk_id, text, metadata in zip(existing["ids"], existing["documents"], existing["metadatas"]):
+            old_by_hash.setdefault(EmbeddingCache.content_hash(text), []).append((chunk_id, metadata))
+
+        kept_ids = set()
+        to_add = []
+        to_update_ids, to_update_metadatas = [], []
+
+        for chunk in chunks:
+            candidates = old_by_hash.get(EmbeddingCache.content_hash(chunk["text"]))
+            if candidates:
+                chunk_id, old_metadata = candidates.pop(0)
+                chunk["chunk_id"] = chunk_id
+                kept_ids.add(chunk_id)
+                metadata = self.chunk_metadata(chunk, document_id)
+                if metadata != old_metadata:
+                    to_update_ids.append(chunk_id)
+                    to_update_metadatas.append(metadata)
+                else:
+                    stats["unchanged"] += 1
+            else:
+                to_add.append(chunk)
+
+        stale_ids = [chunk_id for chunk_id in existing["ids"] if chunk_id not in kept_ids]
+
+        # 新分块的ID不能与保留的旧分块冲突（旧分块ID中的序号可能已经错位）
+        taken = kept_ids | set(stale_ids)
+        for chunk in to_add:
+            chunk_id = chunk["chunk_id"]
+            if chunk_id in taken:
+                base = f"{chunk_id}_{EmbeddingCache.content_hash(chunk['text'])[:8]}"
+                chunk_id, suffix = base, 1
+                while chunk_id in taken:
+                    chunk_id = f"{base}_{suffix}"
+                    suffix += 1
+                chunk["chunk_id"] = chunk_id
+            taken.add(chunk_id)
+
+        # 先写入新分块，成功后再更新元数据、删除过期分块：写入失败时文档的旧版本保持完整，
+        # 中途失败后重试时已写入的新分块按内容哈希匹配沿用
+        if to_add:
+            if not self.add_chunks(to_add, document_id):
+                raise Exception("Failed to add changed chunks to vector store")
+            stats["added"] = len(to_add)
+
+        if to_update_ids:
+            self.index.update(to_update_ids, to_update_metadatas)
+            stats["updated"] = len(to_update_ids)
+
+        if stale_ids:
+            self.index.delete(stale_ids)
+            if self.keyword_index:
+                self.keyword_index.delete_chunks(stale_ids)
+            stats["removed"] = len(stale_ids)
+
+        logger.info(f"Synced chunks for {document_id}: {stats}")
+        return stats
+
     def get_stats(self) -> Dict[str, Any]:
         """
         获取向量数据库统计信息
@@ -346,25 +617,42 @@ class VectorStoreManager:
             统计信息
         """
         try:
-            count = self.collection.count()
+            count = self.index.count()
             return {
                 "total_chunks": count,
                 "collection_name": self.collection_name,
                 "persist_directory": self.persist_directory,
-                "available": self.available
+                "vector_index": self.index.get_stats(),
+                "available": self.available,
+                "embedding_model": self.embedding_model_name,
+                "embedding_backend": self.embedding_backend,
+                "embedding_cache": self.embedding_cache.get_stats() if self.embedding_cache else None,
+                "keyword_chunks": self.keyword_index.count() if self.keyword_index else None,
+                "query_batching": self.query_batcher.get_stats() if self.query_batcher else None,
+                "embedding_server": (
+                    self.embedding_model.get_stats()
+                    if isinstance(self.embedding_model, RemoteEmbeddingModel) else None
+                )
             }
         except Exception as e:
             logger.error(f"Failed to get stats: {str(e)}")
             return {"available": False}
 
+    def close(self):
+        """停止后台线程、断开向量化服务并落盘向量索引"""
+        if self.query_batcher is not None:
+            self.query_batcher.close()
+        if isinstance(self.embedding_model, RemoteEmbeddingModel):
+            self.embedding_model.close()
+        self._search_pool.shutdown(wait=False)
+        self.index.close()
+
     def clear_collection(self):
         """清空集合（谨慎使用！）"""
         try:
-            self.client.delete_collection(self.collection_name)
-            self.collection = self.client.create_collection(
-                name=self.collection_name,
-                metadata={"description": "MCP文档向量存储"}
-            )
+            self.index.clear()
+            if self.keyword_index:
+                self.keyword_index.clear()
             logger.warning(f"⚠ Collection '{self.collection_name}' cleared")
         except Exception as e:
             logger.error(f"Failed to clear collection: {str(e)}")
@@ -373,44 +661,94 @@ class VectorStoreManager:
             self,
             query: str,
             top_k: int = 10,
-            semantic_weight: float = 0.7
+            semantic_weight: float = 0.7,
+            document_id: str = None,
+            fusion: str = "rrf"
     ) -> List[Dict]:
         """
         混合搜索（语义+关键词）
 
+        向量检索与BM25关键词检索并行执行，各取 2*top_k 个候选后融合排序，
+        关键词命中但向量检索未召回的分块也会出现在结果中
+
         Args:
             query: 查询文本
             top_k: 返回数量
             semantic_weight: 语义搜索权重 (0-1)
+            document_id: 限定文档ID
+            fusion: 融合方式 "rrf"（倒数排名融合）或 "weighted"（加权分数）
 
         Returns:
-            搜索结果
+            搜索结果（含 score、keyword_score、combined_score）
         """
-        # 语义搜索
-        semantic_results = self.search(query, top_k * 2)
-
-        if not semantic_results:
+        if not self.available:
+            logger.error("Vector store not available")
             return []
 
-        # 关键词过滤（简单实现）
-        keyword_filtered = []
-        query_keywords = set(query.lower().split())
+        candidates = top_k * 2
+        where = {"document_id": document_id} if document_id else None
 
-        for result in semantic_results:
-            text_lower = result["text"].lower()
-            keyword_score = sum(1 for kw in query_keywords if kw in text_lower) / len(query_keywords)
+        try:
+            # 关键词检索在后台线程中执行，同时计算查询向量并检索向量索引
+            keyword_future = None
+            if self.keyword_index:
+                keyword_future = self._search_pool.submit(
+                    self.keyword_index.search, query, candidates, document_id
+                )
 
-            # 混合分数
-            combined_score = (
-                    semantic_weight * result["score"] +
-                    (1 - semantic_weight) * keyword_score
+            query_embedding = self.embed_query(query)
+            semantic_results = (
+                self._query_collection(query_embedding, candidates, where)
+                if query_embedding is not None else []
             )
 
+            keyword_hits = keyword_future.result() if keyword_future else []
+        except Exception as e:
+            logger.error(f"Hybrid search failed: {str(e)}")
+            return []
+
+        results = {result["id"]: result for result in semantic_results}
+        semantic_rank = {result["id"]: rank for rank, result in enumerate(semantic_results)}
+        keyword_rank = {chunk_id: rank for rank, (chunk_id, _) in enumerate(keyword_hits)}
+
+        # BM25分数按本次最高分归一化到 0-1
+        max_bm25 = keyword_hits[0][1] if keyword_hits else 0.0
+        keyword_scores = {
+            chunk_id: (score / max_bm25 if max_bm25 > 0 else 0.0)
+            for chunk_id, score in keyword_hits
+        }
+
+        # 取回仅被关键词检索召回的分块
+        missing = [chunk_id for chunk_id, _ in keyword_hits if chunk_id not in results]
+        if missing:
+            try:
+                results.update(self._fetch_chunks(missing, query_embedding))
+            except Exception as e:
+                logger.warning(f"Failed to fetch keyword-only chunks: {str(e)}")
+
+        for chunk_id, result in results.items():
+            keyword_score = keyword_scores.get(chunk_id, 0.0)
+
+            if fusion == "weighted":
+                combined_score = (
+                        semantic_weight * result["score"] +
+                        (1 - semantic_weight) * keyword_score
+                )
+            else:
+                combined_score = 0.0
+                if chunk_id in semantic_rank:
+                    combined_score += semantic_weight / (RRF_K + semantic_rank[chunk_id] + 1)
+                if chunk_id in keyword_rank:
+                    combined_score += (1 - semantic_weight) / (RRF_K + keyword_rank[chunk_id] + 1)
+
             result["combined_score"] = combined_score
             result["keyword_score"] = keyword_score
-            keyword_filtered.append(result)
 
         # 按混合分数排序
-        keyword_filtered.sort(key=lambda x: x["combined_score"], reverse=True)
+        ranked = sorted(results.values(), key=lambda x: x["combined_score"], reverse=True)
 
-        return keyword_filtered[:top_k]
\ No newline at end of file
+        logger.info(
+            f"Hybrid search: {len(semantic_results)} semantic + {len(keyword_hits)} keyword "
+            f"candidates -> {min(len(ranked), top_k)} results"
+        )
+        return ranked[:top_k]
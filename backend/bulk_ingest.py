@@ -0,0 +1,24 @@
+"""
+批量导入脚本
+将目录中的 PDF/Word 文档批量解析、抽取并写入知识图谱和向量库
+
+用法:
+    python bulk_ingest.py /path/to/archive --workers 8
+"""
+import sys
+
+from dotenv import load_dotenv
+
+# 设置UTF-8编码，避免Windows控制台编码问题
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+load_dotenv()
+
+from app.jobs.bulk_ingest import main  # noqa: E402
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Embedding 后端检查脚本
+导出 ONNX 模型（可选 int8 量化），与 PyTorch 模型比较向量一致性和吞吐量
+
+用法:
+    python embedding_benchmark.py --model all-MiniLM-L6-v2 --backends onnx,onnx-int8
+"""
+import sys
+
+from dotenv import load_dotenv
+
+# 设置UTF-8编码，避免Windows控制台编码问题
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+load_dotenv()
+
+from app.vector.embedding_backends import main  # noqa: E402
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+"""
+本地向量化服务
+独立进程持有 Embedding 模型，通过 Unix socket 为所有 API worker 和批量导入进程计算向量
+
+用法:
+    python embedding_server.py --socket ./data/embedding.sock --threads 8
+"""
+import sys
+
+from dotenv import load_dotenv
+
+# 设置UTF-8编码，避免Windows控制台编码问题
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+load_dotenv()
+
+from app.vector.embedding_server import main  # noqa: E402
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Gunicorn 配置 - 多进程部署（仅 Linux/macOS）
+
+用法:
+    gunicorn -c gunicorn.conf.py app.main:app
+
+主进程在 fork worker 之前加载 spaCy 和 Embedding 模型，各 worker 以写时复制方式共享；
+应用在各 worker 中导入（preload_app=False），数据库连接和后台线程不跨 fork。
+文档、任务、指标、向量缓存都保存在共享存储中，向量库需要配置 CHROMA_SERVER_HOST
+"""
+import gc
+import multiprocessing
+import os
+import sys
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+load_dotenv()
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("SERVER_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = False
+timeout = int(os.getenv("SERVER_TIMEOUT", "120"))
+graceful_timeout = 30
+
+# 应用代码据此判断是否运行在多进程模式下
+os.environ["SERVER_WORKERS"] = str(workers)
+# 分词器在主进程中加载，fork 后不能再使用其线程池
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def on_starting(server):
+    """主进程启动时预加载模型"""
+    if os.getenv("PRELOAD_MODELS", "true").lower() == "false":
+        return
+
+    from app.jobs.warmup import preload_models
+    preload_models()
+
+    # 已加载的对象移出垃圾回收的跟踪范围，避免 worker 中的回收改写这些页面而触发写时复制
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """worker 进程的推理线程数 = CPU 核数 / worker 数，避免线程超额订阅"""
+    threads = int(os.getenv("WORKER_THREADS", "0")) or max(1, multiprocessing.cpu_count() // server.cfg.workers)
+    os.environ.setdefault("ONNX_THREADS", str(threads))
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
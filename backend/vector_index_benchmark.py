@@ -0,0 +1,24 @@
+"""
+向量索引后端对比脚本
+同一批向量分别写入 ChromaDB 和内存映射矩阵索引（float32 / float16 / HNSW），比较写入吞吐、查询延迟和召回率
+
+用法:
+    python vector_index_benchmark.py --backends chroma,flat,flat-f16,hnsw --vectors 100000
+"""
+import sys
+
+from dotenv import load_dotenv
+
+# 设置UTF-8编码，避免Windows控制台编码问题
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+load_dotenv()
+
+from app.vector.index_backends import main  # noqa: E402
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -77,11 +77,17 @@ function DocumentsPage() {
     setUploadProgress(0);
 
     try {
-      const result = await documentAPI.upload(file, (progress) => {
+      const job = await documentAPI.upload(file, (progress) => {
         setUploadProgress(progress);
       });
+      // 内容重复且已处理完成的文件不会创建新任务，直接返回已有文档
+      const result = job.job_id ? await documentAPI.waitForJob(job.job_id) : job;
 
-      message.success(`文档 "${file.name}" 上传成功！`);
+      if (job.duplicate) {
+        message.info(`文档 "${file.name}" 已存在，已复用之前的处理结果`);
+      } else {
+        message.success(`文档 "${file.name}" 上传成功！`);
+      }
       message.info(`提取了 ${result.entities_count} 个实体，${result.chunks_count} 个文本块`);
 
       // 刷新列表
@@ -254,19 +254,34 @@ function QAPage() {
     setInput('');
     setLoading(true);
 
-    try {
-      const data = await qaAPI.ask(input);
-
-      const aiMessage = {
-        type: 'ai',
-        content: data.answer,
-        sources: data.sources || [],
-        confidence: data.confidence,
-        model: data.model,
-        timestamp: new Date().toLocaleTimeString(),
-      };
+    // 更新正在流式生成的最后一条AI消息
+    const updateLast = (update) => {
+      setMessages(prev => {
+        const last = prev[prev.length - 1];
+        return [...prev.slice(0, -1), { ...last, ...update(last) }];
+      });
+    };
 
-      setMessages(prev => [...prev, aiMessage]);
+    try {
+      await qaAPI.askStream(input, (event, data) => {
+        if (event === 'sources') {
+          // 来源先到达：插入AI消息，之后逐段追加回答
+          setLoading(false);
+          setMessages(prev => [...prev, {
+            type: 'ai',
+            content: '',
+            sources: data.sources || [],
+            confidence: data.confidence,
+            timestamp: new Date().toLocaleTimeString(),
+          }]);
+        } else if (event === 'token') {
+          updateLast(last => ({ content: last.content + data.content }));
+        } else if (event === 'usage') {
+          updateLast(() => ({ model: data.model, usage: data.usage }));
+        } else if (event === 'error') {
+          updateLast(last => ({ content: last.content || data.answer || `生成答案时出错: ${data.error}`, error: !data.answer }));
+        }
+      });
     } catch (error) {
       if (error.response?.status === 503) {
         message.error('RAG问答服务未启用，请配置OpenAI API密钥');
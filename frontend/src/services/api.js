@@ -56,6 +56,38 @@ export const documentAPI = {
     });
   },
 
+  // 上传文档新版本（增量更新）
+  update: async (documentId, file, force = false) => {
+    const formData = new FormData();
+    formData.append('file', file);
+
+    return apiClient.put(`/api/documents/${documentId}`, formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+      params: { force },
+    });
+  },
+
+  // 查询处理任务状态
+  getJob: async (jobId) => {
+    return apiClient.get(`/api/jobs/${jobId}`);
+  },
+
+  // 等待处理任务完成
+  waitForJob: async (jobId, interval = 1000) => {
+    for (;;) {
+      const job = await apiClient.get(`/api/jobs/${jobId}`);
+      if (job.status === 'completed') {
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || '文档处理失败');
+      }
+      await new Promise((resolve) => setTimeout(resolve, interval));
+    }
+  },
+
   // 获取所有文档
   list: async () => {
     return apiClient.get('/api/documents');
@@ -143,6 +175,50 @@ export const searchAPI = {
 
 // ==================== RAG 问答 API ====================
 
+/**
+ * 以 POST 方式请求 SSE 接口，逐个事件回调 onEvent(event, data)
+ * （EventSource 只支持 GET，这里用 fetch + ReadableStream 解析）
+ */
+const postEventStream = async (path, params, onEvent) => {
+  const query = new URLSearchParams(
+    Object.entries(params).filter(([, value]) => value !== null && value !== undefined)
+  );
+  const response = await fetch(`${API_BASE_URL}${path}?${query}`, {
+    method: 'POST',
+    headers: { Accept: 'text/event-stream' },
+  });
+
+  if (!response.ok) {
+    const error = new Error(`HTTP ${response.status}`);
+    error.response = { status: response.status, data: await response.json().catch(() => ({})) };
+    throw error;
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      let data = '';
+      raw.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      onEvent(event, data ? JSON.parse(data) : {});
+    }
+  }
+};
+
 export const qaAPI = {
   // 提问
   ask: async (question, documentId = null, topK = 5, useHybrid = true, includeGraph = false) => {
@@ -157,12 +233,28 @@ export const qaAPI = {
     });
   },
 
+  // 流式提问（sources → token... → usage → done）
+  askStream: async (question, onEvent, documentId = null, topK = 5, useHybrid = true, includeGraph = false) => {
+    return postEventStream('/api/qa/ask/stream', {
+      question,
+      document_id: documentId,
+      top_k: topK,
+      use_hybrid: useHybrid,
+      include_graph: includeGraph,
+    }, onEvent);
+  },
+
   // 生成摘要
   summarize: async (documentId, maxLength = 500) => {
     return apiClient.post(`/api/qa/summarize/${documentId}`, null, {
       params: { max_length: maxLength },
     });
   },
+
+  // 流式生成摘要（meta → token... → usage → done）
+  summarizeStream: async (documentId, onEvent, maxLength = 500) => {
+    return postEventStream(`/api/qa/summarize/${documentId}/stream`, { max_length: maxLength }, onEvent);
+  },
 };
 
 // ==================== 系统 API ====================